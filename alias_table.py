@@ -0,0 +1,76 @@
+"""
+Walker 别名表: 把离散分布 {数值: 概率} 变成 O(1) 抽样的查找表。
+
+每个伤害规格 (dice_expr.DiceExpr) 的分布只构建一次，按规格缓存，
+表达式相同的武器 (如各档 重弩 (N=k)) 共享同一张表。
+一次抽样只需一个 [0, 1) 均匀随机数: u * 格数 的整数部分选格，小数部分决定取本格数值还是别名。
+别名抽样的结果不随 u 单调；需要单调时 (对偶抽样) 用 sample_inverse 按累积分布取值。
+"""
+from functools import lru_cache
+from itertools import accumulate
+
+ALIAS_CACHE_SIZE = 512
+
+class AliasTable:
+    """
+    离散分布的别名表。values/alias_values 为每格的数值与别名数值，threshold 为取本格数值的概率，
+    cumulative 为按数值从小到大的累积概率。
+    """
+    def __init__(self, pmf):
+        values = sorted(pmf)
+        size = len(values)
+        total = sum(pmf.values())
+        self.cumulative = list(accumulate(pmf[v] / total for v in values))
+        scaled = [pmf[v] * size / total for v in values]
+        alias = list(range(size))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        # Vose 的构建方法: 每次用一个不足的格配一个多余的格
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in small + large:
+            scaled[i] = 1.0
+        self.size = size
+        self.values = values
+        self.alias_values = [values[a] for a in alias]
+        self.threshold = scaled
+        self._arrays = None  # 批量抽样用的 NumPy 数组，首次 sample 时创建
+        self._cumulative_array = None
+
+    def draw(self, u):
+        """由一个 [0, 1) 均匀随机数抽取一个数值。"""
+        u *= self.size
+        i = int(u)
+        return self.values[i] if u - i < self.threshold[i] else self.alias_values[i]
+
+    def sample(self, rng, n):
+        """批量抽取 n 个数值，返回 int64 数组。"""
+        import numpy as np
+        if self._arrays is None:
+            self._arrays = (np.asarray(self.values, dtype=np.int64), np.asarray(self.alias_values, dtype=np.int64),
+                            np.asarray(self.threshold))
+        values, alias_values, threshold = self._arrays
+        u = rng.random(n) * self.size
+        i = u.astype(np.int64)
+        return np.where(u - i < threshold[i], values[i], alias_values[i])
+
+    def sample_inverse(self, rng, n):
+        """按逆分布函数批量抽取 n 个数值: 结果随均匀随机数单调不减，O(log 格数)。"""
+        import numpy as np
+        if self._cumulative_array is None:
+            self._cumulative_array = np.asarray(self.cumulative)
+        values = np.asarray(self.values, dtype=np.int64) if self._arrays is None else self._arrays[0]
+        i = np.searchsorted(self._cumulative_array, rng.random(n), side='right')
+        return values[np.minimum(i, self.size - 1)]
+
+@lru_cache(maxsize=ALIAS_CACHE_SIZE)
+def damage_alias_table(spec):
+    """伤害规格的别名表，按规格缓存共享。"""
+    return AliasTable(spec.pmf())
+
+def cache_info():
+    return damage_alias_table.cache_info()
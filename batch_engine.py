@@ -0,0 +1,323 @@
+"""
+向量化批量引擎: 所有战斗同时以NumPy数组逐回合推进。
+
+每个动作函数在 monte_carlo_simulator 中都有一个对应的数组版本，
+签名为 (state, attacker, defender, pro_level, current_round, rng, n, last_round)，
+其中 state 是 {字段名: 长度为n的数组} 的字典，返回 (伤害数组, 命中数数组)。
+"""
+import numpy as np
+
+from alias_table import damage_alias_table
+
+# 单次分块的战斗数，用于限制内存
+DEFAULT_CHUNK_SIZE = 100_000
+
+# --- 批量掷骰 ---
+def roll_dice_batch(rng, n, num_dice, num_sides, modifier=0):
+    """批量掷 num_dice 个 num_sides 面骰，返回长度为n的总和数组。"""
+    if num_dice <= 0 or n == 0:
+        return np.full(n, modifier, dtype=np.int64)
+    return rng.integers(1, num_sides + 1, size=(n, num_dice)).sum(axis=1) + modifier
+
+def roll_attack_batch(rng, n, modifier):
+    """批量掷2d12命中骰。modifier 可以是标量或长度为n的数组。"""
+    return rng.integers(1, 13, size=n) + rng.integers(1, 13, size=n) + modifier
+
+def roll_damage_batch(rng, attacker, n):
+    """
+    按 attacker.damage_spec 批量掷伤害: 一次向量化的别名表抽样 (见 alias_table)。
+    rng.inverse_cdf 为真时 (对偶抽样，见 variance_reduction) 改按逆分布函数取值，使伤害随均匀数单调。
+    """
+    table = damage_alias_table(attacker.damage_spec)
+    if getattr(rng, 'inverse_cdf', False):
+        return table.sample_inverse(rng, n)
+    return table.sample(rng, n)
+
+def damage_on_hit(rng, attacker, hit):
+    """
+    只为命中的战斗掷伤害，未命中为0。
+    rng.draw_all 为真时 (共同随机数，见 defender_sweep) 每场都掷，使抽样数与命中情况无关。
+    """
+    if getattr(rng, 'draw_all', False):
+        return np.where(hit, roll_damage_batch(rng, attacker, hit.shape[0]), 0)
+    damage = np.zeros(hit.shape[0], dtype=np.int64)
+    damage[hit] = roll_damage_batch(rng, attacker, int(hit.sum()))
+    return damage
+
+def convert_damage_to_hp_loss_batch(damage, defender_stats, pro_level):
+    """convert_damage_to_hp_loss 的数组版本。"""
+    threshold1, threshold2 = defender_stats.thresholds[pro_level - 1]
+    hp_loss = 1 + (damage >= threshold1).astype(np.int64) + (damage >= threshold2)
+    return np.where(damage <= 0, 0, hp_loss)
+
+def _state_array(state, key, n, dtype=np.int64):
+    """取出state中的数组，不存在时初始化为0。"""
+    if key not in state:
+        state[key] = np.zeros(n, dtype=dtype)
+    return state[key]
+
+# --- Batch Action Functions: 与 monte_carlo_simulator 中的动作一一对应 ---
+
+def simple_attack_batch(state, attacker, defender, pro_level, current_round, rng, n, last_round=None):
+    """simple_attack_action 的数组版本。"""
+    hit = roll_attack_batch(rng, n, attacker.attack_modifier) >= defender.defense
+    return damage_on_hit(rng, attacker, hit), hit.astype(np.int64)
+
+def long_sword_token_batch(state, attacker, defender, pro_level, current_round, rng, n, last_round=None):
+    """long_sword_token_action 的数组版本。"""
+    tokens = _state_array(state, 'tokens', n)
+    hit = roll_attack_batch(rng, n, attacker.attack_modifier) >= defender.defense
+    tokens = np.where(hit, np.minimum(tokens + 1, 3), np.maximum(tokens - 1, 0))
+    state['tokens'] = tokens
+    damage = damage_on_hit(rng, attacker, hit) + np.where(hit, tokens * 5, 0)
+    return damage, hit.astype(np.int64)
+
+def form_switching_batch(state, attacker, defender, pro_level, current_round, rng, n, last_round=None):
+    """form_switching_action 的数组版本。"""
+    active = _state_array(state, 'form_active', n, dtype=bool)
+    remaining = _state_array(state, 'form_attacks_remaining', n)
+    total = _state_array(state, 'successful_attacks_total', n)
+
+    # 检查并更新激活的形态
+    remaining = np.where(active, remaining - 1, remaining)
+    active = active & (remaining > 0)
+
+    attack_modifier = attacker.attack_modifier + attacker.form_attack_bonus * active
+    hit = roll_attack_batch(rng, n, attack_modifier) >= defender.defense
+    damage = damage_on_hit(rng, attacker, hit) + np.where(hit & active, attacker.form_damage_bonus, 0)
+
+    # 形态未激活时累积命中次数
+    accumulate = hit & ~active
+    total = total + accumulate
+    trigger = accumulate & (total >= attacker.form_switch_threshold)
+    state['form_active'] = active | trigger
+    state['form_attacks_remaining'] = np.where(trigger, attacker.form_duration, remaining)
+    state['successful_attacks_total'] = np.where(trigger, 0, total)
+    return damage, hit.astype(np.int64)
+
+def charge_blade_batch(state, attacker, defender, pro_level, current_round, rng, n, last_round=None):
+    """charge_blade_action 的数组版本。"""
+    tokens = _state_array(state, 'tokens', n)
+    discharge = (tokens >= attacker.discharge_threshold) | ((current_round == last_round) & (tokens > 0))
+
+    hit = roll_attack_batch(rng, n, attacker.attack_modifier) >= defender.defense
+    base_damage = damage_on_hit(rng, attacker, hit)
+    targets = attacker.num_aoe_targets
+
+    # 超解: 消耗所有Token；普通攻击: 命中时获得Token
+    discharge_damage = (base_damage + (2 * tokens) ** 2) * targets
+    damage = np.where(hit, np.where(discharge, discharge_damage, base_damage), 0)
+    hits = np.where(hit, np.where(discharge, targets, 1), 0)
+    state['tokens'] = np.where(discharge, 0, tokens + hit)
+    return damage, hits
+
+def multi_attack_batch(state, attacker, defender, pro_level, current_round, rng, n, last_round=None):
+    """multi_attack_action 的数组版本。"""
+    damage = np.zeros(n, dtype=np.int64)
+    hits = np.zeros(n, dtype=np.int64)
+    for _ in range(attacker.num_attacks):
+        hit = roll_attack_batch(rng, n, attacker.attack_modifier) >= defender.defense
+        damage += damage_on_hit(rng, attacker, hit)
+        hits += hit
+    return damage, hits
+
+def wyvernstake_batch(state, attacker, defender, pro_level, current_round, rng, n, last_round=None):
+    """wyvernstake_action 的数组版本。"""
+    active = _state_array(state, 'stake_active', n, dtype=bool)
+    countdown = _state_array(state, 'countdown', n)
+    accumulated = _state_array(state, 'damage_accumulated', n)
+
+    # 无论是否激活，本回合都只进行一次攻击
+    hit = roll_attack_batch(rng, n, attacker.attack_modifier) >= defender.defense
+    damage = damage_on_hit(rng, attacker, hit)
+
+    # 已激活: 累积伤害并倒计时，归零时引爆
+    accumulated = np.where(active, accumulated + damage, accumulated)
+    countdown = np.where(active, countdown - 1, countdown)
+    explode = active & (countdown <= 0)
+    damage = damage + np.where(explode, accumulated, 0)
+
+    # 未激活: 插入成功则开始倒计时
+    insert = ~active & hit
+    state['stake_active'] = (active & ~explode) | insert
+    state['countdown'] = np.where(insert, 3, countdown)
+    state['damage_accumulated'] = np.where(insert | explode, 0, accumulated)
+    return damage, hit.astype(np.int64)
+
+def insect_glaive_batch(state, attacker, defender, pro_level, current_round, rng, n, last_round=None):
+    """insect_glaive_action 的数组版本。"""
+    tokens = _state_array(state, 'tokens', n)
+
+    # 策略：有token就用
+    use_token = tokens > 0
+    tokens = tokens - use_token
+    hit_roll_modifier = attacker.attack_modifier + np.where(use_token, roll_dice_batch(rng, n, 1, 6), 0)
+
+    hit = roll_attack_batch(rng, n, hit_roll_modifier) >= defender.defense
+    damage = damage_on_hit(rng, attacker, hit)
+    state['tokens'] = tokens + convert_damage_to_hp_loss_batch(damage, defender, pro_level)
+    return damage, hit.astype(np.int64)
+
+def simple_aoe_batch(state, attacker, defender, pro_level, current_round, rng, n, last_round=None):
+    """simple_aoe_action 的数组版本。"""
+    hit = roll_attack_batch(rng, n, attacker.attack_modifier) >= defender.defense
+    damage = damage_on_hit(rng, attacker, hit) * attacker.num_aoe_targets
+    return damage, hit * attacker.num_aoe_targets
+
+def great_hammer_batch(state, attacker, defender, pro_level, current_round, rng, n, last_round=None):
+    """great_hammer_action 的数组版本。"""
+    active = _state_array(state, 'vulnerable_active', n, dtype=bool)
+    duration = _state_array(state, 'vulnerable_duration', n)
+
+    # 检查并更新脆弱状态
+    duration = np.where(active, duration - 1, duration)
+    active = active & (duration > 0)
+
+    hit_roll_modifier = attacker.attack_modifier + np.where(active, roll_dice_batch(rng, n, 1, 6), 0)
+    hit = roll_attack_batch(rng, n, hit_roll_modifier) >= defender.defense
+    damage = damage_on_hit(rng, attacker, hit)
+
+    # HP损失>=2且未脆弱时触发脆弱
+    trigger = hit & ~active & (convert_damage_to_hp_loss_batch(damage, defender, pro_level) >= 2)
+    state['vulnerable_active'] = active | trigger
+    state['vulnerable_duration'] = np.where(trigger, 2, duration)
+    return damage, hit.astype(np.int64)
+
+def lance_batch(state, attacker, defender, pro_level, current_round, rng, n, last_round=None):
+    """lance_action 的数组版本。"""
+    hit_1 = roll_attack_batch(rng, n, attacker.attack_modifier) > defender.defense
+    damage = damage_on_hit(rng, attacker, hit_1)
+
+    # 追击
+    follow_up = rng.random(n) < 0.5
+    hit_2 = follow_up & (roll_attack_batch(rng, n, attacker.attack_modifier) > defender.defense)
+    damage += damage_on_hit(rng, attacker, hit_2)
+    return damage, hit_1.astype(np.int64) + hit_2
+
+def light_bowgun_batch(state, attacker, defender, pro_level, current_round, rng, n, last_round=None):
+    """light_bowgun_action 的数组版本。"""
+    attack_roll = roll_attack_batch(rng, n, attacker.attack_modifier)
+    failed = attack_roll <= defender.defense
+    if getattr(rng, 'draw_all', False):
+        # 共同随机数: 每场都掷重骰，使抽样数与第一次检定的结果无关 (同 damage_on_hit)
+        attack_roll = np.where(failed, roll_attack_batch(rng, n, attacker.attack_modifier), attack_roll)
+    else:
+        attack_roll[failed] = roll_attack_batch(rng, int(failed.sum()), attacker.attack_modifier)
+    hit = attack_roll >= defender.defense
+    return damage_on_hit(rng, attacker, hit), hit.astype(np.int64)
+
+def heavy_bowgun_batch(state, attacker, defender, pro_level, current_round, rng, n, last_round=None):
+    """heavy_bowgun_action 的数组版本。"""
+    buff_stacks = attacker.buff_stacks
+    hit = roll_attack_batch(rng, n, attacker.attack_modifier + buff_stacks) >= defender.defense
+    damage = damage_on_hit(rng, attacker, hit) + np.where(hit, buff_stacks, 0)
+    return damage, hit.astype(np.int64)
+
+# 按动作函数名查找数组版本，避免 __main__ 与模块导入时函数对象不一致
+BATCH_ACTIONS = {
+    'simple_attack_action': simple_attack_batch,
+    'long_sword_token_action': long_sword_token_batch,
+    'form_switching_action': form_switching_batch,
+    'charge_blade_action': charge_blade_batch,
+    'multi_attack_action': multi_attack_batch,
+    'wyvernstake_action': wyvernstake_batch,
+    'insect_glaive_action': insect_glaive_batch,
+    'simple_aoe_action': simple_aoe_batch,
+    'great_hammer_action': great_hammer_batch,
+    'lance_action': lance_batch,
+    'light_bowgun_action': light_bowgun_batch,
+    'heavy_bowgun_action': heavy_bowgun_batch,
+}
+
+def get_batch_action(action_function):
+    """返回动作函数对应的数组版本。"""
+    try:
+        return BATCH_ACTIONS[action_function.__name__]
+    except KeyError:
+        raise ValueError(f"动作 {action_function.__name__} 没有向量化版本") from None
+
+# --- 引擎核心 ---
+def make_rng(seed=None):
+    """seed 可以是 None、整数、SeedSequence、已有的 Generator 或 defender_sweep.CommonRandomNumbers。"""
+    if isinstance(seed, np.random.Generator) or hasattr(seed, 'draw_all'):
+        return seed
+    return np.random.default_rng(seed)
+
+def simulate_battles(action_function, attacker_stats, defender_stats, n, num_rounds=10, pro_level=1, rng=None,
+                     rounds=None, trace_field=None):
+    """
+    向量化运行一批 n 场战斗。
+    返回: (每场命中数数组, 每场HP损失数组)
+    rounds 为列表时，每回合追加 (伤害, 命中数, HP损失, 关键状态 state[trace_field]) 四个数组 (轨迹记录用)。
+    """
+    if not hasattr(attacker_stats, 'damage_spec'):
+        raise ValueError("向量化模式需要 attacker_stats.damage_spec，请使用 build_attacker_stats 构建攻击者")
+    batch_action = get_batch_action(action_function)
+    rng = make_rng(rng)
+
+    state = {}
+    battle_hits = np.zeros(n, dtype=np.int64)
+    battle_hp_loss = np.zeros(n, dtype=np.int64)
+    for current_round in range(1, num_rounds + 1):
+        damage, hits = batch_action(state, attacker_stats, defender_stats, pro_level, current_round, rng, n, num_rounds)
+        hp_loss = convert_damage_to_hp_loss_batch(damage, defender_stats, pro_level)
+        battle_hp_loss += hp_loss
+        battle_hits += hits
+        if rounds is not None:
+            key_state = state[trace_field] if trace_field else np.zeros(n, dtype=np.int64)
+            rounds.append((damage, hits, hp_loss, key_state))
+    return battle_hits, battle_hp_loss
+
+def time_to_kill_battles(action_function, attacker_stats, defender_stats, n, hp, max_rounds=100, pro_level=1,
+                        rng=None):
+    """
+    向量化运行 n 场战斗，每场在累计HP损失 >= hp 时结束，最多 max_rounds 回合 (最后一回合)。
+    已结束的战斗连同其状态一起移出批次，之后不再为它们掷骰。
+    返回: 每场的击杀回合数组，max_rounds 内未击杀为 0。
+    """
+    batch_action = get_batch_action(action_function)
+    rng = make_rng(rng)
+
+    kill_round = np.zeros(n, dtype=np.int64)
+    active = np.arange(n)                 # 仍在进行的战斗在结果数组中的下标
+    hp_loss = np.zeros(n, dtype=np.int64)
+    state = {}
+    for current_round in range(1, max_rounds + 1):
+        if not active.size:
+            break
+        damage, _ = batch_action(state, attacker_stats, defender_stats, pro_level, current_round, rng, active.size,
+                                 max_rounds)
+        hp_loss += convert_damage_to_hp_loss_batch(damage, defender_stats, pro_level)
+        killed = hp_loss >= hp
+        kill_round[active[killed]] = current_round
+        alive = ~killed
+        active = active[alive]
+        hp_loss = hp_loss[alive]
+        state = {key: value[alive] for key, value in state.items()}
+    return kill_round
+
+def run_batch(action_function, attacker_stats, defender_stats, num_simulations=10000, num_rounds=10,
+              pro_level=1, seed=None, chunk_size=DEFAULT_CHUNK_SIZE, hp_loss_stats=None, trace=None, trace_field=None):
+    """
+    向量化运行 num_simulations 场战斗。
+    返回: (每场平均命中, 每场平均HP损失)，与 Simulator.run 相同。
+    hp_loss_stats 为 StreamingStats 时，每场的HP损失会逐块记入其中。
+    trace 为 trace_recorder.TraceWriter 时，每块的逐回合记录按战斗顺序写入，trace_field 为关键状态字段。
+    """
+    rng = make_rng(seed)
+    grand_total_hp_loss = 0
+    grand_total_hits = 0
+    for start in range(0, num_simulations, chunk_size):
+        n = min(chunk_size, num_simulations - start)
+        rounds = [] if trace is not None else None
+        battle_hits, battle_hp_loss = simulate_battles(
+            action_function, attacker_stats, defender_stats, n, num_rounds, pro_level, rng, rounds, trace_field)
+        if rounds:
+            # (回合, 战斗) -> 按战斗、回合顺序展平
+            trace.write_rounds(*(np.stack(column, axis=1).ravel() for column in zip(*rounds)))
+        grand_total_hp_loss += int(battle_hp_loss.sum())
+        grand_total_hits += int(battle_hits.sum())
+        if hp_loss_stats is not None:
+            hp_loss_stats.add_batch(battle_hp_loss)
+
+    return grand_total_hits / num_simulations, grand_total_hp_loss / num_simulations
@@ -1,10 +1,19 @@
-import random
-import numpy as np
 from collections import Counter
 
-def roll_dice(dice_pool):
-    """根据给定的骰子池掷骰。"""
-    return {i: random.randint(1, side) for i, side in enumerate(dice_pool)}
+from dice_expr import pool_expr
+from dice_source import STDLIB_DICE, DiceSource
+from streaming_stats import StreamingStats
+
+DICE_TYPES = ('d4', 'd6', 'd8', 'd10', 'd12', 'd20')
+
+# run_simulation 在仿真次数达到该值时自动使用向量化批量引擎 (feast_batch)
+BATCH_THRESHOLD = 1000
+
+def roll_dice(dice_pool, dice_source=STDLIB_DICE):
+    """根据给定的骰子池掷骰，返回 {骰子下标: 点数}。"""
+    if not dice_pool:
+        return {}
+    return dict(enumerate(pool_expr(tuple(dice_pool)).roll_each(dice_source)))
 
 def find_and_process_matches(roll_results):
     """
@@ -29,10 +38,12 @@ def find_and_process_matches(roll_results):
                     
     return matched_score, bonus_dice, remaining_indices
 
-def simulate_cooking_session(initial_dice_pool, removal_strategy):
+def simulate_cooking_session(initial_dice_pool, removal_strategy, dice_source=STDLIB_DICE):
     """
     模拟一次完整的烹饪过程。
-    removal_strategy: 'largest', 'smallest', 'random'
+    removal_strategy: 没有匹配时移除哪颗骰子: 'largest', 'smallest', 'random'，
+                      或接收当前骰子池、返回要移除的面数的函数
+    dice_source: 骰子来源，传入 DiceSource(seed) 可复现
     返回: (总分, 总奖励骰)
     """
     if not initial_dice_pool:
@@ -45,7 +56,7 @@ def simulate_cooking_session(initial_dice_pool, removal_strategy):
     while len(current_dice_pool) > 1:
         # 将骰子池与其原始索引配对，以便在移除后仍能追踪
         indexed_pool = {i: side for i, side in enumerate(current_dice_pool)}
-        roll_results = {i: random.randint(1, side) for i, side in indexed_pool.items()}
+        roll_results = roll_dice(current_dice_pool, dice_source)
         
         score_from_matches, bonus_from_matches, remaining_indices = find_and_process_matches(roll_results)
         
@@ -58,62 +69,92 @@ def simulate_cooking_session(initial_dice_pool, removal_strategy):
             if not current_dice_pool:
                 break
             
-            if removal_strategy == 'random':
-                dice_to_remove = random.choice(current_dice_pool)
+            if removal_strategy == 'largest':
+                dice_to_remove = max(current_dice_pool)
+            elif removal_strategy == 'smallest':
+                dice_to_remove = min(current_dice_pool)
+            elif callable(removal_strategy):
+                # 自定义策略 (如 feast_strategy 求出的最优策略): 根据当前骰子池返回要移除的面数
+                dice_to_remove = removal_strategy(current_dice_pool)
             else:
-                # 保留随机作为默认，移除其他策略
-                dice_to_remove = random.choice(current_dice_pool)
+                dice_to_remove = dice_source.choice(current_dice_pool)
 
             current_dice_pool.remove(dice_to_remove)
 
     return total_score, total_bonus_dice
 
-def run_simulation(dice_counts, num_simulations):
-    """运行蒙特卡洛仿真。"""
+def run_simulation(dice_counts, num_simulations, dice_source=STDLIB_DICE, batch=None, removal_strategy='random'):
+    """
+    运行蒙特卡洛仿真。dice_source 为骰子来源，传入 DiceSource(seed) 可复现。
+    removal_strategy 同 simulate_cooking_session; 自定义函数只能逐次仿真。
+    batch: True 使用向量化批量引擎，False 逐次仿真，None 时仿真次数 >= BATCH_THRESHOLD 自动使用批量引擎。
+    返回: (分数的 StreamingStats, 奖励骰的 StreamingStats)，内存占用与仿真次数无关。
+    """
     initial_dice_pool = []
-    initial_dice_pool.extend([4] * dice_counts.get('d4', 0))
-    initial_dice_pool.extend([6] * dice_counts.get('d6', 0))
-    initial_dice_pool.extend([8] * dice_counts.get('d8', 0))
-    initial_dice_pool.extend([10] * dice_counts.get('d10', 0))
-    initial_dice_pool.extend([12] * dice_counts.get('d12', 0))
-    initial_dice_pool.extend([20] * dice_counts.get('d20', 0))
-    
-    scores = []
-    bonus_dices = []
+    for name in DICE_TYPES:
+        initial_dice_pool.extend([int(name[1:])] * dice_counts.get(name, 0))
+
+    score_stats = StreamingStats()
+    bonus_stats = StreamingStats()
+    if batch is None:
+        batch = num_simulations >= BATCH_THRESHOLD and not callable(removal_strategy)
+    if batch:
+        from feast_batch import run_sessions
+        run_sessions(initial_dice_pool, num_simulations, dice_source.generator(), score_stats, bonus_stats,
+                     removal_strategy=removal_strategy)
+        return score_stats, bonus_stats
+
     for _ in range(num_simulations):
-        score, bonus = simulate_cooking_session(initial_dice_pool, 'random')
-        scores.append(score)
-        bonus_dices.append(bonus)
+        score, bonus = simulate_cooking_session(initial_dice_pool, removal_strategy, dice_source)
+        score_stats.add(score)
+        bonus_stats.add(bonus)
         
-    return scores, bonus_dices
+    return score_stats, bonus_stats
+
+# 示例配置列表
+DEFAULT_CONFIGURATIONS = [
+    { 'd4': 8, 'd6': 0, 'd8': 0, 'd10': 0, 'd12': 0, 'd20': 0 },
+    { 'd4': 0, 'd6': 8, 'd8': 0, 'd10': 0, 'd12': 0, 'd20': 0 },
+    { 'd4': 0, 'd6': 0, 'd8': 8, 'd10': 0, 'd12': 0, 'd20': 0 },
+    { 'd4': 0, 'd6': 0, 'd8': 0, 'd10': 8, 'd12': 0, 'd20': 0 },
+    { 'd4': 0, 'd6': 0, 'd8': 0, 'd10': 0, 'd12': 8, 'd20': 0 },
+    { 'd4': 0, 'd6': 0, 'd8': 0, 'd10': 0, 'd12': 0, 'd20': 8 },
+    { 'd4': 16, 'd6': 0, 'd8': 0, 'd10': 0, 'd12': 0, 'd20': 0 },
+    { 'd4': 0, 'd6': 16, 'd8': 0, 'd10': 0, 'd12': 0, 'd20': 0 },
+    { 'd4': 0, 'd6': 0, 'd8': 16, 'd10': 0, 'd12': 0, 'd20': 0 },
+    { 'd4': 0, 'd6': 0, 'd8': 0, 'd10': 16, 'd12': 0, 'd20': 0 },
+    { 'd4': 0, 'd6': 0, 'd8': 0, 'd10': 0, 'd12': 16, 'd20': 0 },
+    { 'd4': 0, 'd6': 0, 'd8': 0, 'd10': 0, 'd12': 0, 'd20': 16 },
+]
+
+def main(dice_configurations=DEFAULT_CONFIGURATIONS, exact=True, simulations=10000, seed=None):
+    """
+    打印各骰池配置的结果。exact=True 时使用精确求解 (feast_solver)，结果没有抽样噪声;
+    False 时使用蒙特卡洛仿真，seed 设为整数可复现结果。
+    """
+    if exact:
+        from damage_distribution import pmf_quantile
+        from feast_solver import solve
+        print("精确求解\n")
+        for dice_configuration in dice_configurations:
+            print(f"配置: {dice_configuration}")
+            result = solve(dice_configuration)
+            quantiles = ", ".join(f"p{int(q * 100)}={pmf_quantile(result.score_distribution, q)}"
+                                  for q in (0.05, 0.5, 0.95))
+            print(f"  {result.mean_score:.2f} \\ {result.mean_bonus:.2f}")
+            print(f"  分数: {quantiles}, max={max(result.score_distribution)}")
+    else:
+        dice_source = DiceSource(seed)
+        print(f"仿真次数: {simulations}\n")
+
+        for dice_configuration in dice_configurations:
+            print(f"配置: {dice_configuration}")
+
+            score_stats, bonus_stats = run_simulation(dice_configuration, simulations, dice_source)
+
+            print(f"  {score_stats.mean:.2f} \\ {bonus_stats.mean:.2f}")
+            print(f"  分数: {score_stats.format_summary()}")
+            print(f"  奖励骰: {bonus_stats.format_summary()}")
 
 if __name__ == "__main__":
-    # 示例配置列表
-    dice_configurations = [
-        { 'd4': 8, 'd6': 0, 'd8': 0, 'd10': 0, 'd12': 0, 'd20': 0 },
-        { 'd4': 0, 'd6': 8, 'd8': 0, 'd10': 0, 'd12': 0, 'd20': 0 },
-        { 'd4': 0, 'd6': 0, 'd8': 8, 'd10': 0, 'd12': 0, 'd20': 0 },
-        { 'd4': 0, 'd6': 0, 'd8': 0, 'd10': 8, 'd12': 0, 'd20': 0 },
-        { 'd4': 0, 'd6': 0, 'd8': 0, 'd10': 0, 'd12': 8, 'd20': 0 },
-        { 'd4': 0, 'd6': 0, 'd8': 0, 'd10': 0, 'd12': 0, 'd20': 8 },
-        { 'd4': 16, 'd6': 0, 'd8': 0, 'd10': 0, 'd12': 0, 'd20': 0 },
-        { 'd4': 0, 'd6': 16, 'd8': 0, 'd10': 0, 'd12': 0, 'd20': 0 },
-        { 'd4': 0, 'd6': 0, 'd8': 16, 'd10': 0, 'd12': 0, 'd20': 0 },
-        { 'd4': 0, 'd6': 0, 'd8': 0, 'd10': 16, 'd12': 0, 'd20': 0 },
-        { 'd4': 0, 'd6': 0, 'd8': 0, 'd10': 0, 'd12': 16, 'd20': 0 },
-        { 'd4': 0, 'd6': 0, 'd8': 0, 'd10': 0, 'd12': 0, 'd20': 16 },
-    ]
-
-    simulations = 10000
-    print(f"仿真次数: {simulations}\n")
-
-    for dice_configuration in dice_configurations:
-        print(f"配置: {dice_configuration}")
-        
-        scores, bonus_dices = run_simulation(dice_configuration, simulations)
-        
-        mean_score = np.mean(scores)
-        variance_score = np.var(scores)
-        mean_bonus_dice = np.mean(bonus_dices)
-        
-        print(f"  {mean_score:.2f} \ {mean_bonus_dice:.2f}")
\ No newline at end of file
+    main()
@@ -0,0 +1,192 @@
+"""
+模拟器吞吐量基准测试与回归比较。
+
+覆盖:
+  - monte_carlo_simulator: 每个动作函数在 scalar (标准库random / DiceSource) 与 vectorized 引擎下的
+    战斗/秒，exact 引擎的 求解/秒 (每次求解前清空分布缓存，测的是完整求解)
+  - beast_feast: d4–d20 各骰池配置的 烹饪/秒 (标准库random / DiceSource / 向量化批量引擎)，
+    以及 feast_solver 精确求解的 求解/秒 (每次求解前清空缓存)
+  - material_drop_simulator: 狩猎/秒 (标准库random / DiceSource)，exact 与 grid 精确分析的 分析/秒
+
+用法:
+  python benchmark.py --output baseline.json          # 运行并保存结果
+  python benchmark.py --compare baseline.json new.json --threshold 10
+                                                      # 吞吐量下降超过10%的项目记为回归，退出码为1
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+import beast_feast
+import damage_distribution
+import dice_expr
+import exact_solver
+import feast_solver
+import material_drop_simulator
+import monte_carlo_simulator as mcs
+from dice_source import DiceSource
+
+# 每次计时至少持续的时间 (秒)，取多次重复中的最好成绩
+MIN_TIME = 0.2
+REPEATS = 3
+
+FEAST_POOLS = {f"8d{side}": {f"d{side}": 8} for side in (4, 6, 8, 10, 12, 20)}
+
+def measure(func, units_per_call, min_time=MIN_TIME, repeats=REPEATS):
+    """反复调用 func 直到累计 min_time 秒，返回 repeats 次中最高的 单位/秒。"""
+    best = 0.0
+    for _ in range(repeats):
+        calls = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < min_time:
+            func()
+            calls += 1
+            elapsed = time.perf_counter() - start
+        best = max(best, calls * units_per_call / elapsed)
+    return best
+
+def representative_weapons():
+    """每个动作函数取 WEAPON_CONFIG 中第一把使用它的武器。"""
+    weapons = {}
+    for name, config in mcs.WEAPON_CONFIG.items():
+        weapons.setdefault(config["action"].__name__, (name, config))
+    return weapons
+
+def clear_exact_caches():
+    """清空精确求解用到的分布与命中率缓存，否则第一次之后的求解大多只是缓存命中。"""
+    damage_distribution.cache_clear()
+    dice_expr.node_pmf.cache_clear()
+    dice_expr.highest_pmf.cache_clear()
+    exact_solver.hit_probability.cache_clear()
+
+def solve_cold(sim, num_rounds, pro_level):
+    clear_exact_caches()
+    return sim.run(None, num_rounds, pro_level)
+
+def simulator_benchmarks(pro_level=3, num_rounds=10, scalar_battles=500, vectorized_battles=50_000):
+    """(名称, 可调用对象, 每次调用的单位数, 单位)"""
+    cases = []
+    for action_name, (weapon, config) in representative_weapons().items():
+        attacker = mcs.build_attacker_stats(pro_level, config, mcs.ATTACKER_MOD)
+        scalar = mcs.Simulator(config["action"], attacker, mcs.DEFENDER, mode='scalar')
+        scalar_buffered = mcs.Simulator(config["action"], attacker, mcs.DEFENDER, mode='scalar', seed=0)
+        vectorized = mcs.Simulator(config["action"], attacker, mcs.DEFENDER, mode='vectorized', seed=0)
+        exact = mcs.Simulator(config["action"], attacker, mcs.DEFENDER, mode='exact')
+        cases.append((f"simulator/scalar/{action_name}",
+                      lambda s=scalar: s.run(scalar_battles, num_rounds, pro_level), scalar_battles, "battles/s"))
+        cases.append((f"simulator/scalar_dice_source/{action_name}",
+                      lambda s=scalar_buffered: s.run(scalar_battles, num_rounds, pro_level), scalar_battles, "battles/s"))
+        cases.append((f"simulator/vectorized/{action_name}",
+                      lambda s=vectorized: s.run(vectorized_battles, num_rounds, pro_level), vectorized_battles, "battles/s"))
+        cases.append((f"simulator/exact/{action_name}",
+                      lambda s=exact: solve_cold(s, num_rounds, pro_level), 1, "solves/s"))
+    return cases
+
+def feast_benchmarks(sessions=200, batch_sessions=20_000):
+    cases = []
+    dice_source = DiceSource(0)
+    for label, dice_counts in FEAST_POOLS.items():
+        cases.append((f"beast_feast/{label}",
+                      lambda d=dice_counts: beast_feast.run_simulation(d, sessions, batch=False), sessions, "sessions/s"))
+        cases.append((f"beast_feast/dice_source/{label}",
+                      lambda d=dice_counts: beast_feast.run_simulation(d, sessions, dice_source, batch=False),
+                      sessions, "sessions/s"))
+        cases.append((f"beast_feast/batch/{label}",
+                      lambda d=dice_counts: beast_feast.run_simulation(d, batch_sessions, dice_source, batch=True),
+                      batch_sessions, "sessions/s"))
+        cases.append((f"beast_feast/exact/{label}", lambda d=dice_counts: feast_solve_cold(d), 1, "solves/s"))
+    return cases
+
+def feast_solve_cold(dice_counts):
+    """清空 feast_solver 的缓存后求解，否则第一次之后只是缓存命中。"""
+    feast_solver.cache_clear()
+    return feast_solver.solve(dice_counts)
+
+def material_drop_benchmarks(hunts=2000):
+    config = material_drop_simulator.CONFIG
+    dice_source = DiceSource(0)
+
+    def run_hunts():
+        for _ in range(hunts):
+            material_drop_simulator.simulate_hunt(config)
+
+    def run_hunts_buffered():
+        for _ in range(hunts):
+            material_drop_simulator.simulate_hunt(config, dice_source)
+    return [("material_drop/simulate_hunt", run_hunts, hunts, "hunts/s"),
+            ("material_drop/dice_source/simulate_hunt", run_hunts_buffered, hunts, "hunts/s"),
+            ("material_drop/exact_analysis", lambda: material_drop_simulator.exact_analysis(config), 1, "analyses/s"),
+            ("material_drop/grid_analysis", lambda: material_drop_simulator.grid_analysis(config), 1, "grids/s")]
+
+def all_benchmarks():
+    return simulator_benchmarks() + feast_benchmarks() + material_drop_benchmarks()
+
+def run_benchmarks(name_filter=None, min_time=MIN_TIME, repeats=REPEATS):
+    """运行基准测试，返回可写入JSON的结果字典。"""
+    results = {}
+    for name, func, units, unit in all_benchmarks():
+        if name_filter and name_filter not in name:
+            continue
+        rate = measure(func, units, min_time, repeats)
+        results[name] = {"rate": rate, "unit": unit}
+        print(f"{name:<50} {rate:>14,.1f} {unit}")
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "min_time": min_time,
+            "repeats": repeats,
+        },
+        "results": results,
+    }
+
+def compare(baseline, current, threshold=10.0):
+    """
+    比较两次结果，返回回归项目列表 [(名称, 基线, 当前, 变化百分比)]。
+    吞吐量下降超过 threshold% 记为回归。
+    """
+    regressions = []
+    print(f"{'benchmark':<50} {'baseline':>14} {'current':>14} {'change':>9}")
+    for name, base in baseline["results"].items():
+        if name not in current["results"]:
+            print(f"{name:<50} {base['rate']:>14,.1f} {'(missing)':>14}")
+            continue
+        new_rate = current["results"][name]["rate"]
+        change = (new_rate - base["rate"]) / base["rate"] * 100 if base["rate"] else 0.0
+        flag = ""
+        if change < -threshold:
+            regressions.append((name, base["rate"], new_rate, change))
+            flag = "  <-- 回归"
+        print(f"{name:<50} {base['rate']:>14,.1f} {new_rate:>14,.1f} {change:>+8.1f}%{flag}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="模拟器吞吐量基准测试")
+    parser.add_argument("--output", help="把结果写入JSON文件")
+    parser.add_argument("--filter", help="只运行名称包含该字符串的项目")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="每次计时的最短时间 (秒)")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="重复次数，取最好成绩")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="比较两个结果文件")
+    parser.add_argument("--threshold", type=float, default=10.0, help="记为回归的吞吐量下降百分比")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.compare[1], encoding="utf-8") as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 个项目吞吐量下降超过 {args.threshold}%")
+            sys.exit(1)
+        print(f"\n没有超过 {args.threshold}% 的回归")
+    else:
+        report = run_benchmarks(args.filter, args.min_time, args.repeats)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"\n结果已写入 {args.output}")
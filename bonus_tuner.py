@@ -0,0 +1,176 @@
+"""
+bonus 曲线自动调参: 为 WEAPON_CONFIG 中的武器搜索六档整数 bonus (以及指定的 params)，
+使每个Pro等级的平均HP损失尽量接近目标曲线，输出对 WEAPON_CONFIG 源码的 diff。
+
+  - 目标曲线: 参考武器 (默认 原版长剑) 各Pro的HP损失，或直接给出六个数；
+  - 估计: 有精确模型的动作用 exact 引擎 (无状态动作走闭式期望)，否则用固定种子的向量化引擎，
+          结果按 (动作, 伤害表达式, params, Pro, bonus) 记忆，重复的候选不再计算；
+  - 搜索: 对每组 params 逐Pro调整 bonus。HP损失随 bonus 单调不减，从当前值朝目标方向逐步移动，
+          误差不再缩小即停止；各Pro误差平方的部分和已超过当前最优的 params 组合提前放弃。
+
+用法:
+  python bonus_tuner.py 斩斧 --param form_damage_bonus=0:12
+  python bonus_tuner.py 大锤 --target 6 9 9 12 12 14 --output tuned.diff
+"""
+import argparse
+import difflib
+import itertools
+import re
+
+from monte_carlo_simulator import (
+    ATTACKER_MOD, DEFENDER, WEAPON_CONFIG, Simulator, build_attacker_stats, damage_expression,
+)
+
+REFERENCE_WEAPON = "原版长剑"
+PRO_LEVELS = range(1, 7)
+BONUS_RANGE = (0, 30)
+
+class Evaluator:
+    """候选配置的HP损失估计，按候选记忆。hits/misses 为记忆命中与实际计算的次数。"""
+    def __init__(self, defender_stats=DEFENDER, num_rounds=10, num_simulations=20000, seed=0,
+                 attack_modifier=ATTACKER_MOD):
+        self.defender_stats = defender_stats
+        self.num_rounds = num_rounds
+        self.num_simulations = num_simulations
+        self.seed = seed
+        self.attack_modifier = attack_modifier
+        self.hits = 0
+        self.misses = 0
+        self._memo = {}
+
+    def hp_loss(self, config, pro_level, bonus, params=None):
+        """config 在该Pro下 bonus 取 bonus、params 取 params (默认沿用 config) 时的每场平均HP损失。"""
+        params = dict(config.get("params", {}) if params is None else params)
+        candidate = dict(config, params=params, bonus=[bonus] * len(config["bonus"]))
+        key = (config["action"].__name__, damage_expression(pro_level, candidate), tuple(sorted(params.items())),
+               pro_level)
+        if key in self._memo:
+            self.hits += 1
+            return self._memo[key]
+        self.misses += 1
+        from exact_solver import EXACT_MODELS
+        mode = 'exact' if config["action"].__name__ in EXACT_MODELS else 'vectorized'
+        attacker_stats = build_attacker_stats(pro_level, candidate, self.attack_modifier)
+        _, value = Simulator(config["action"], attacker_stats, self.defender_stats, mode=mode, seed=self.seed,
+                             analytic_stateless=True).run(self.num_simulations, self.num_rounds, pro_level)
+        self._memo[key] = value
+        return value
+
+def target_curve(evaluator, reference=REFERENCE_WEAPON, pro_levels=PRO_LEVELS):
+    """参考武器各Pro的HP损失。"""
+    config = WEAPON_CONFIG[reference]
+    return [evaluator.hp_loss(config, pro, config["bonus"][pro - 1]) for pro in pro_levels]
+
+def tune_bonus(evaluate, target, start, bounds=BONUS_RANGE):
+    """
+    单个Pro: 从 start 朝目标方向逐步调整整数 bonus，误差不再缩小即停止。
+    evaluate(bonus) 返回HP损失。返回 (bonus, HP损失)。
+    """
+    bonus = min(max(start, bounds[0]), bounds[1])
+    value = evaluate(bonus)
+    step = 1 if value < target else -1
+    while bounds[0] <= bonus + step <= bounds[1]:
+        next_value = evaluate(bonus + step)
+        if abs(next_value - target) >= abs(value - target):
+            break
+        bonus, value = bonus + step, next_value
+    return bonus, value
+
+def tune_weapon(config, target, evaluator, param_grid=None, pro_levels=PRO_LEVELS, bounds=BONUS_RANGE):
+    """
+    为一把武器搜索 bonus 与 param_grid ({参数名: 候选值}) 中的 params。
+    返回 (bonus列表, params, 各Pro的HP损失, 误差平方和)；param_grid 为空时只调 bonus。
+    """
+    base_params = dict(config.get("params", {}))
+    names = list(param_grid or {})
+    # 当前值排在最前，使第一组候选就给出一个较紧的上界
+    candidates = [sorted(param_grid[name], key=lambda v, cur=base_params.get(name): v != cur) for name in names]
+    best = None
+    for values in itertools.product(*candidates):
+        params = {**base_params, **dict(zip(names, values))}
+        bonus, hp_loss, error = list(config["bonus"]), [], 0.0
+        for i, pro in enumerate(pro_levels):
+            b, value = tune_bonus(lambda x: evaluator.hp_loss(config, pro, x, params), target[i],
+                                  config["bonus"][pro - 1], bounds)
+            bonus[pro - 1] = b
+            hp_loss.append(value)
+            error += (value - target[i]) ** 2
+            if best is not None and error >= best[3]:
+                break  # 部分误差已不优于当前最优，放弃这组 params
+        else:
+            if best is None or error < best[3]:
+                best = (bonus, params, hp_loss, error)
+    return best
+
+def config_diff(tuned, source_path=None):
+    """
+    tuned 为 {武器名: (bonus列表, params)}，返回修改 WEAPON_CONFIG 源码对应行的 unified diff 文本。
+    """
+    import monte_carlo_simulator
+    source_path = source_path or monte_carlo_simulator.__file__
+    with open(source_path, encoding="utf-8") as f:
+        lines = f.readlines()
+    new_lines = list(lines)
+    for name, (bonus, params) in tuned.items():
+        prefix = f'    "{name}":'
+        index = next((i for i, line in enumerate(lines) if line.startswith(prefix)), None)
+        if index is None:
+            raise ValueError(f"在 {source_path} 中找不到 {name!r} 的配置行")
+        line = re.sub(r'"bonus": \[[^\]]*\]', '"bonus": [' + ",".join(map(str, bonus)) + ']', lines[index])
+        for key, value in params.items():
+            line = re.sub(rf'("{re.escape(key)}":\s*)-?\d+', rf'\g<1>{value}', line)
+        new_lines[index] = line
+    return "".join(difflib.unified_diff(lines, new_lines, "a/monte_carlo_simulator.py", "b/monte_carlo_simulator.py"))
+
+def parse_param(text):
+    """'form_damage_bonus=0:12' 或 'form_damage_bonus=2,4,6' -> (名称, 候选值列表)。"""
+    name, _, values = text.partition("=")
+    if not values:
+        raise ValueError(f"参数格式应为 名称=最小:最大 或 名称=a,b,c: {text!r}")
+    if ":" in values:
+        low, high = values.split(":")
+        return name, list(range(int(low), int(high) + 1))
+    return name, [int(v) for v in values.split(",")]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="WEAPON_CONFIG bonus 曲线自动调参")
+    parser.add_argument("prefix", help="要调整的武器名前缀，如 斩斧")
+    parser.add_argument("--reference", default=REFERENCE_WEAPON, help="目标曲线的参考武器")
+    parser.add_argument("--target", type=float, nargs=6, help="直接给出Pro1..6的目标HP损失")
+    parser.add_argument("--param", action="append", default=[], help="同时搜索的参数，如 form_damage_bonus=0:12")
+    parser.add_argument("--rounds", type=int, default=10, help="每场战斗回合数")
+    parser.add_argument("--simulations", type=int, default=20000, help="没有精确模型时每个候选的模拟次数")
+    parser.add_argument("--min-bonus", type=int, default=BONUS_RANGE[0])
+    parser.add_argument("--max-bonus", type=int, default=BONUS_RANGE[1])
+    parser.add_argument("--output", help="把 diff 写入文件，默认打印")
+    args = parser.parse_args()
+
+    evaluator = Evaluator(num_rounds=args.rounds, num_simulations=args.simulations)
+    target = args.target or target_curve(evaluator, args.reference)
+    param_grid = dict(parse_param(text) for text in args.param)
+    weapons = {name: config for name, config in WEAPON_CONFIG.items()
+               if name.startswith(args.prefix) and name != args.reference}
+    if not weapons:
+        parser.error(f"没有以 {args.prefix!r} 开头的武器")
+
+    print("目标: " + " ".join(f"{v:.2f}" for v in target))
+    tuned = {}
+    for name, config in weapons.items():
+        grid = {key: values for key, values in param_grid.items() if key in config.get("params", {})}
+        bonus, params, hp_loss, error = tune_weapon(config, target, evaluator, grid,
+                                                    bounds=(args.min_bonus, args.max_bonus))
+        before = [evaluator.hp_loss(config, pro, config["bonus"][pro - 1]) for pro in PRO_LEVELS]
+        tuned[name] = (bonus, {key: params[key] for key in grid})
+        print(f"\n{name}: 误差平方和 {error:.4f}")
+        print(f"  原 bonus {config['bonus']} -> " + " ".join(f"{v:.2f}" for v in before))
+        print(f"  新 bonus {bonus} -> " + " ".join(f"{v:.2f}" for v in hp_loss)
+              + "".join(f", {key}={params[key]}" for key in grid))
+    print(f"\n估计: 计算 {evaluator.misses} 个候选, 记忆命中 {evaluator.hits} 次")
+
+    diff = config_diff(tuned)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(diff)
+        print(f"diff 已写入 {args.output}")
+    else:
+        print("\n" + (diff or "WEAPON_CONFIG 无需修改"))
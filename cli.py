@@ -0,0 +1,208 @@
+"""
+统一命令行入口: 各模拟器的子命令，场景可以从 JSON/TOML 文件读取 (格式见 scenario)。
+
+  python cli.py sweep --weapon 原版长剑 --pro 3 --mode exact     # 单个单元的快速查询
+  python cli.py sweep --scenario my.toml --format table
+  python cli.py feast --pool d6=8 --pool d4=4,d8=4
+  python cli.py drops --mode grid
+  python cli.py duality --advantage 0 2 --modifier 1
+
+命令行参数优先于场景文件，场景文件优先于模块中的默认配置。
+pandas/tabulate 只在 --format table 时导入，NumPy 只在向量化引擎、带种子的骰子来源或精确求解需要时导入。
+"""
+import argparse
+import sys
+
+from scenario import defender_stats, drops_config, load_scenario, section, select_weapons, weapon_config
+
+FORMATS = ("text", "table", "csv", "json")
+
+def _pick(value, scenario_section, key, default):
+    """命令行参数 > 场景文件 > 默认值。"""
+    if value is not None:
+        return value
+    return scenario_section.get(key, default)
+
+def parse_pool(text):
+    """'d4=8,d6=2' -> {'d4': 8, 'd6': 2}"""
+    pool = {}
+    for item in text.split(","):
+        name, _, count = item.strip().partition("=")
+        if not count:
+            raise ValueError(f"骰池格式应为 d4=8,d6=2: {text!r}")
+        pool[name] = int(count)
+    return pool
+
+# --- sweep ---
+def sweep_rows(weapons, defender, pro_levels, num_simulations, num_rounds, mode, seed=None, attack_modifier=0,
+               cache=None):
+    """
+    逐单元运行扫描，返回 [{'Weapon', 'Pro', 'Hits', 'HP Loss'}]。cache 为 ResultCache 时先查缓存；
+    不带种子的抽样结果每次不同，不使用缓存。
+    """
+    from monte_carlo_simulator import Simulator, build_attacker_stats
+
+    if seed is None and mode != 'exact':
+        cache = None
+    rows = []
+    for pro_level in pro_levels:
+        for name, config in weapons.items():
+            key = None
+            if cache is not None:
+                from result_cache import cell_key
+                key = cell_key(config, pro_level, defender, num_rounds, num_simulations, seed, mode, runner='cli',
+                               attack_modifier=attack_modifier, analytic_stateless=True)
+                cached = cache.get(key)
+                if cached is not None:
+                    rows.append({'Weapon': name, 'Pro': pro_level, **cached})
+                    continue
+            attacker_stats = build_attacker_stats(pro_level, config, attack_modifier)
+            avg_hits, avg_hp_loss = Simulator(config["action"], attacker_stats, defender, mode=mode, seed=seed,
+                                              analytic_stateless=True).run(num_simulations, num_rounds, pro_level)
+            result = {'Hits': avg_hits, 'HP Loss': avg_hp_loss}
+            if key is not None:
+                cache.put(key, result)
+            rows.append({'Weapon': name, 'Pro': pro_level, **result})
+    return rows
+
+def _display_width(text):
+    """终端显示宽度，全角字符 (中文) 占两格。"""
+    from unicodedata import east_asian_width
+    return sum(2 if east_asian_width(ch) in "WF" else 1 for ch in text)
+
+def format_text(rows, weapon_order, pro_levels):
+    """不依赖 pandas 的 武器×Pro 文本表。"""
+    values = {(row['Weapon'], row['Pro']): row['HP Loss'] for row in rows}
+    width = max(_display_width(name) for name in weapon_order + ["Weapon"]) + 2
+    pad = lambda text: text + " " * (width - _display_width(text))
+    lines = [pad("Weapon") + "".join(f"{pro:>8}" for pro in pro_levels)]
+    for name in weapon_order:
+        lines.append(pad(name) + "".join(f"{values[(name, pro)]:>8.2f}" for pro in pro_levels))
+    return "\n".join(lines)
+
+def write_rows(rows, weapon_order, pro_levels, output_format):
+    if output_format == "table":
+        from monte_carlo_simulator import pivot_results, print_table
+        print_table(pivot_results(rows, weapon_order))
+    elif output_format == "csv":
+        import csv
+        writer = csv.DictWriter(sys.stdout, fieldnames=['Weapon', 'Pro', 'Hits', 'HP Loss'])
+        writer.writeheader()
+        writer.writerows(rows)
+    elif output_format == "json":
+        import json
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print(format_text(rows, weapon_order, pro_levels))
+
+def cmd_sweep(args, scenario):
+    options = section(scenario, "sweep")
+    weapons = select_weapons(weapon_config(scenario), args.weapon or options.get("weapons"))
+    pro_levels = _pick(args.pro, options, "pro", list(range(1, 7)))
+    cache = None
+    if args.cache:
+        from result_cache import ResultCache
+        cache = ResultCache()
+    try:
+        rows = sweep_rows(weapons, defender_stats(scenario), pro_levels,
+                          _pick(args.simulations, options, "simulations", 10000),
+                          _pick(args.rounds, options, "rounds", 10),
+                          _pick(args.mode, options, "mode", "scalar"),
+                          _pick(args.seed, options, "seed", None),
+                          _pick(args.attack_modifier, options, "attack_modifier", 0), cache)
+    finally:
+        if cache is not None:
+            cache.close()
+    write_rows(rows, list(weapons), pro_levels, args.format)
+
+# --- feast / drops / duality ---
+def cmd_feast(args, scenario):
+    import beast_feast
+    options = section(scenario, "feast")
+    pools = [parse_pool(text) for text in args.pool] if args.pool else options.get("pools",
+                                                                                 beast_feast.DEFAULT_CONFIGURATIONS)
+    beast_feast.main(pools, _pick(args.exact, options, "exact", True),
+                     _pick(args.simulations, options, "simulations", 10000), _pick(args.seed, options, "seed", None))
+
+def cmd_drops(args, scenario):
+    import material_drop_simulator
+    config = drops_config(scenario)
+    if args.simulations is not None:
+        config["simulation_runs"] = args.simulations
+    if args.seed is not None:
+        config["seed"] = args.seed
+    mode = _pick(args.mode, section(scenario, "drops"), "mode", "sample")
+    if mode == "exact":
+        material_drop_simulator.main_exact(config)
+    elif mode == "grid":
+        material_drop_simulator.main_grid(config)
+    else:
+        material_drop_simulator.main(config)
+
+def cmd_duality(args, scenario):
+    from duality_dice import DC_RANGE, DEFAULT_CASES, format_markdown
+    options = section(scenario, "duality")
+    dcs = range(_pick(args.dc_min, options, "dc_min", DC_RANGE.start),
+                _pick(args.dc_max, options, "dc_max", DC_RANGE.stop - 1) + 1)
+    text = format_markdown(tuple(_pick(args.advantage, options, "advantage", DEFAULT_CASES)),
+                           _pick(args.modifier, options, "modifier", 0), dcs)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"结果已写入 {args.output}")
+    else:
+        print(text, end="")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="DaggerHeart 骰子模拟命令行")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(subparser):
+        subparser.add_argument("--scenario", help="场景文件 (.json / .toml)")
+        subparser.add_argument("--seed", type=int, help="随机种子")
+        subparser.add_argument("--simulations", type=int, help="模拟次数")
+
+    sweep = subparsers.add_parser("sweep", help="武器×Pro平衡扫描")
+    add_common(sweep)
+    sweep.add_argument("--weapon", action="append", help="武器名或名称前缀，可重复；默认全部")
+    sweep.add_argument("--pro", type=int, nargs="+", help="Pro等级")
+    sweep.add_argument("--rounds", type=int, help="每场战斗回合数")
+    sweep.add_argument("--mode", choices=("scalar", "vectorized", "exact"), help="模拟引擎 (默认 scalar)")
+    sweep.add_argument("--attack-modifier", type=int, help="攻击者的命中调整值")
+    sweep.add_argument("--format", choices=FORMATS, default="text", help="输出格式，table 需要 pandas/tabulate")
+    sweep.add_argument("--cache", action="store_true", help="使用本地结果缓存 (抽样引擎需同时给出 --seed)")
+    sweep.set_defaults(handler=cmd_sweep)
+
+    feast = subparsers.add_parser("feast", help="猛兽盛宴骰池")
+    add_common(feast)
+    feast.add_argument("--pool", action="append", help="骰池，如 d4=8,d6=2，可重复")
+    feast.add_argument("--exact", action=argparse.BooleanOptionalAction, default=None,
+                       help="精确求解 (默认) 或 --no-exact 蒙特卡洛仿真")
+    feast.set_defaults(handler=cmd_feast)
+
+    drops = subparsers.add_parser("drops", help="素材掉落")
+    add_common(drops)
+    drops.add_argument("--mode", choices=("sample", "exact", "grid"), help="默认 sample")
+    drops.set_defaults(handler=cmd_drops)
+
+    duality = subparsers.add_parser("duality", help="二元骰检定概率表")
+    duality.add_argument("--scenario", help="场景文件 (.json / .toml)")
+    duality.add_argument("--advantage", type=int, nargs="+", help="各张表的优势骰数，负数为劣势骰数")
+    duality.add_argument("--modifier", type=int, help="调整值")
+    duality.add_argument("--dc-min", type=int)
+    duality.add_argument("--dc-max", type=int)
+    duality.add_argument("--output", help="写入文件 (如 dice.md)，默认打印")
+    duality.set_defaults(handler=cmd_duality)
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        scenario = load_scenario(args.scenario) if args.scenario else {}
+        args.handler(args, scenario)
+    except ValueError as e:
+        parser.error(str(e))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+伤害与HP损失的精确分布，按伤害规格 (dice_expr.DiceExpr) 缓存。
+
+damage_pmf(spec) 为 base_damage_roll 的精确分布 (由表达式卷积得到)；
+hp_loss_pmf(spec, thresholds, ...) 再按阈值对得到 0/1/2/3 点HP损失的分布。
+两者都放在有上限的LRU缓存之后，返回的分布被所有调用方共享，请勿修改。
+"""
+from collections import defaultdict
+from functools import lru_cache
+
+DAMAGE_CACHE_SIZE = 512
+HP_LOSS_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=64)
+def dice_sum_pmf(num_dice, num_sides):
+    """num_dice 个 num_sides 面骰之和的概率分布 {点数: 概率}。"""
+    pmf = {0: 1.0}
+    face_prob = 1.0 / num_sides
+    for _ in range(num_dice):
+        new_pmf = defaultdict(float)
+        for total, p in pmf.items():
+            for face in range(1, num_sides + 1):
+                new_pmf[total + face] += p * face_prob
+        pmf = dict(new_pmf)
+    return pmf
+
+def convolve_pmf(pmf_a, pmf_b):
+    """两个独立随机变量之和的概率分布。"""
+    result = defaultdict(float)
+    for a, pa in pmf_a.items():
+        for b, pb in pmf_b.items():
+            result[a + b] += pa * pb
+    return dict(result)
+
+def damage_pmf(spec):
+    """base_damage_roll 的精确概率分布 {伤害: 概率}，由 spec.pmf() 缓存。"""
+    return spec.pmf()
+
+@lru_cache(maxsize=DAMAGE_CACHE_SIZE)
+def damage_sum_pmf(spec, num_hits):
+    """num_hits 次独立 base_damage_roll 之和的概率分布。"""
+    if num_hits == 0:
+        return {0: 1.0}
+    if num_hits == 1:
+        return damage_pmf(spec)
+    return convolve_pmf(damage_sum_pmf(spec, num_hits - 1), damage_pmf(spec))
+
+def bucket_hp_loss(pmf, thresholds):
+    """按阈值对把伤害分布转换为HP损失分布 (P(0), P(1), P(2), P(3))，规则同 convert_damage_to_hp_loss。"""
+    threshold1, threshold2 = thresholds
+    buckets = [0.0, 0.0, 0.0, 0.0]
+    for damage, p in pmf.items():
+        if damage <= 0:
+            buckets[0] += p
+        elif damage < threshold1:
+            buckets[1] += p
+        elif damage < threshold2:
+            buckets[2] += p
+        else:
+            buckets[3] += p
+    return tuple(buckets)
+
+@lru_cache(maxsize=HP_LOSS_CACHE_SIZE)
+def hp_loss_pmf(spec, thresholds, add=0, mult=1):
+    """(base_damage + add) * mult 的HP损失分布。thresholds 必须是元组。"""
+    return bucket_hp_loss({(d + add) * mult: p for d, p in damage_pmf(spec).items()}, thresholds)
+
+@lru_cache(maxsize=HP_LOSS_CACHE_SIZE)
+def hp_loss_pmf_of_sum(spec, thresholds, num_hits):
+    """num_hits 次 base_damage 之和的HP损失分布。thresholds 必须是元组。"""
+    return bucket_hp_loss(damage_sum_pmf(spec, num_hits), thresholds)
+
+def expected_hp_loss(hp_pmf):
+    """HP损失分布的期望。"""
+    return sum(hp * p for hp, p in enumerate(hp_pmf))
+
+def pmf_quantile(pmf, q):
+    """离散分布 {数值: 概率} 的 q 分位数 (最小的 x 使 P(X <= x) >= q)。"""
+    cumulative = 0.0
+    for x, p in sorted(pmf.items()):
+        cumulative += p
+        if cumulative >= q - 1e-12:
+            return x
+    return max(pmf)
+
+def cache_info():
+    """各缓存的命中情况，便于调整缓存上限。"""
+    return {
+        'damage_sum_pmf': damage_sum_pmf.cache_info(),
+        'hp_loss_pmf': hp_loss_pmf.cache_info(),
+        'hp_loss_pmf_of_sum': hp_loss_pmf_of_sum.cache_info(),
+    }
+
+def cache_clear():
+    """清空本模块的分布缓存 (例如基准测试中测量不命中缓存的求解)。"""
+    for func in (dice_sum_pmf, damage_sum_pmf, hp_loss_pmf, hp_loss_pmf_of_sum):
+        func.cache_clear()
@@ -0,0 +1,141 @@
+"""
+防御者扫描: 一次得到 武器 × Pro × 阈值档 × 防御 的HP损失立方体。
+
+向量化引擎下，每个 (武器, Pro) 只跑一遍: 所有防御者变体 (防御值 × 阈值档) 沿战斗轴堆叠，
+共用同一串命中骰与伤害骰 (共同随机数)。各列之间的差异只来自防御者本身，
+不再叠加独立抽样的噪声，相邻防御值的曲线是平滑的。
+精确引擎不抽样，逐个防御者求解。
+
+用法:
+  python defender_sweep.py --simulations 20000 --pro 3 --output defender_cube.csv
+"""
+import argparse
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from batch_engine import DEFAULT_CHUNK_SIZE, simulate_battles
+from monte_carlo_simulator import (
+    ATTACKER_MOD, DEFENDER, WEAPON_CONFIG, Simulator, build_attacker_stats, print_table,
+)
+from parallel_sweep import chunk_seed
+
+# --- 扫描配置 ---
+DEFENSES = range(8, 21)
+THRESHOLD_PROFILES = {
+    "标准": DEFENDER.thresholds,
+    "低阈值": [[6, 12], [10, 20], [10, 20], [15, 27], [15, 27], [27, 50]],
+    "高阈值": [[10, 20], [16, 32], [16, 32], [25, 44], [25, 44], [45, 82]],
+}
+
+class CommonRandomNumbers:
+    """
+    共同随机数: 包装 NumPy Generator，每次抽样只抽 1/copies，再原样复制给各个防御者变体。
+    堆叠后第 r 个变体的第 i 场战斗与其他变体的第 i 场战斗使用完全相同的随机数。
+    """
+    draw_all = True  # 见 batch_engine.damage_on_hit
+
+    def __init__(self, rng, copies):
+        self.rng = rng
+        self.copies = copies
+
+    def _tiled(self, draw, size):
+        size = (size,) if np.isscalar(size) else tuple(size)
+        values = draw((size[0] // self.copies,) + size[1:])
+        return np.tile(values, (self.copies,) + (1,) * (values.ndim - 1))
+
+    def integers(self, low, high, size):
+        return self._tiled(lambda s: self.rng.integers(low, high, size=s), size)
+
+    def random(self, size):
+        return self._tiled(self.rng.random, size)
+
+def defender_variants(defenses=DEFENSES, profiles=THRESHOLD_PROFILES):
+    """[(阈值档名, 防御值, 防御者)]，阈值档在外层。"""
+    return [(profile, defense, SimpleNamespace(defense=defense, thresholds=thresholds))
+            for profile, thresholds in profiles.items() for defense in defenses]
+
+def stack_defenders(defenders, n):
+    """把各防御者按 n 场一组沿战斗轴堆叠，防御与阈值都变成长度为 len(defenders)*n 的数组。"""
+    defense = np.repeat([d.defense for d in defenders], n)
+    thresholds = [tuple(np.repeat([d.thresholds[k][j] for d in defenders], n) for j in range(2))
+                  for k in range(len(defenders[0].thresholds))]
+    return SimpleNamespace(defense=defense, thresholds=thresholds)
+
+def _crn_cell(config, attacker_stats, defenders, num_simulations, num_rounds, pro_level, seeds, chunk_size):
+    """一个 (武器, Pro) 单元: 所有防御者共用随机数，返回每个防御者的平均HP损失。"""
+    copies = len(defenders)
+    battles_per_chunk = max(1, chunk_size // copies)
+    totals = np.zeros(copies)
+    for chunk_index, start in enumerate(range(0, num_simulations, battles_per_chunk)):
+        n = min(battles_per_chunk, num_simulations - start)
+        rng = CommonRandomNumbers(np.random.default_rng(seeds(chunk_index)), copies)
+        _, battle_hp_loss = simulate_battles(config["action"], attacker_stats, stack_defenders(defenders, n),
+                                             copies * n, num_rounds, pro_level, rng)
+        totals += battle_hp_loss.reshape(copies, n).sum(axis=1)
+    return totals / num_simulations
+
+def run_defender_sweep(weapon_config=None, defenses=DEFENSES, profiles=THRESHOLD_PROFILES, pro_levels=range(1, 7),
+                       num_simulations=10000, num_rounds=10, mode='vectorized', master_seed=0,
+                       chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    返回 SimpleNamespace(cube, weapons, pro_levels, profiles, defenses)，
+    cube[武器, Pro, 阈值档, 防御] 为每场平均HP损失。mode 为 'vectorized' (共同随机数) 或 'exact'。
+    """
+    weapon_config = WEAPON_CONFIG if weapon_config is None else weapon_config
+    defenses, pro_levels = list(defenses), list(pro_levels)
+    variants = defender_variants(defenses, profiles)
+    defenders = [defender for _, _, defender in variants]
+    cube = np.zeros((len(weapon_config), len(pro_levels), len(profiles), len(defenses)))
+
+    for w, (name, config) in enumerate(weapon_config.items()):
+        for p, pro_level in enumerate(pro_levels):
+            attacker_stats = build_attacker_stats(pro_level, config, ATTACKER_MOD)
+            if mode == 'exact':
+                hp_loss = [Simulator(config["action"], attacker_stats, defender, mode='exact')
+                           .run(None, num_rounds, pro_level)[1] for defender in defenders]
+            else:
+                seeds = lambda chunk_index: chunk_seed(master_seed, name, pro_level, chunk_index)
+                hp_loss = _crn_cell(config, attacker_stats, defenders, num_simulations, num_rounds, pro_level,
+                                    seeds, chunk_size)
+            cube[w, p] = np.reshape(hp_loss, (len(profiles), len(defenses)))
+
+    return SimpleNamespace(cube=cube, weapons=list(weapon_config), pro_levels=pro_levels,
+                           profiles=list(profiles), defenses=defenses)
+
+def cube_to_frame(result):
+    """把立方体展开为 Weapon/Pro/Profile/Defense/HP Loss 的长表。"""
+    index = pd.MultiIndex.from_product([result.weapons, result.pro_levels, result.profiles, result.defenses],
+                                       names=['Weapon', 'Pro', 'Profile', 'Defense'])
+    return pd.DataFrame({'HP Loss': result.cube.ravel()}, index=index).reset_index()
+
+def defense_table(result, pro_level, profile):
+    """某Pro等级、某阈值档下 武器×防御 的HP损失表。"""
+    p = result.pro_levels.index(pro_level)
+    t = result.profiles.index(profile)
+    return pd.DataFrame(result.cube[:, p, t, :], index=pd.Index(result.weapons, name='Weapon'),
+                        columns=result.defenses)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="防御者扫描: 武器 × Pro × 防御 的HP损失立方体")
+    parser.add_argument("--simulations", type=int, default=10000, help="每个 (武器, Pro) 单元的模拟次数")
+    parser.add_argument("--rounds", type=int, default=10, help="每场战斗回合数")
+    parser.add_argument("--mode", choices=("vectorized", "exact"), default="vectorized", help="模拟引擎")
+    parser.add_argument("--seed", type=int, default=0, help="主种子")
+    parser.add_argument("--pro", type=int, nargs="+", default=list(range(1, 7)), help="扫描的Pro等级")
+    parser.add_argument("--defense-min", type=int, default=DEFENSES.start)
+    parser.add_argument("--defense-max", type=int, default=DEFENSES.stop - 1)
+    parser.add_argument("--output", help="把整个立方体写入CSV文件")
+    args = parser.parse_args()
+
+    result = run_defender_sweep(defenses=range(args.defense_min, args.defense_max + 1), pro_levels=args.pro,
+                                num_simulations=args.simulations, num_rounds=args.rounds, mode=args.mode,
+                                master_seed=args.seed)
+    for profile in result.profiles:
+        for pro_level in result.pro_levels:
+            print(f"\n阈值档={profile}, Pro={pro_level}, 每场战斗 {args.rounds} 回合, 引擎={args.mode}")
+            print_table(defense_table(result, pro_level, profile))
+    if args.output:
+        cube_to_frame(result).to_csv(args.output, index=False, encoding="utf-8")
+        print(f"\n结果已写入 {args.output}")
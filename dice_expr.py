@@ -0,0 +1,263 @@
+"""
+骰子表达式: 解析一次，编译为可逐次掷骰、批量抽样与求精确分布的对象，按表达式文本缓存。
+
+语法:
+  2d12+3              NdS 为 N 颗 S 面骰之和，N 省略时为 1
+  (3d10+1d8+2)*2      + - * 与括号，乘法可以是两个随机量相乘
+  2d12 adv d6         adv NdS: 加上 N 颗 S 面骰中的最高值 (优势)；dis NdS: 减去 (劣势)
+
+compile_dice(text) 返回 DiceExpr:
+  expr.roll(dice_source)   标量掷骰，dice_source 见 dice_source 模块
+  expr.compiled(roll_sum)  同上，但由 roll_sum(num_dice, num_sides, modifier=0) 提供骰子之和，
+                           monte_carlo_simulator 借此让伤害骰与 roll_dice 使用同一骰子来源与计数
+  expr.sample(rng, n)      批量抽样，返回长度为 n 的 NumPy 数组
+  expr.pmf()               精确分布 {数值: 概率} (缓存，请勿修改)
+  expr.roll_each / sample_each   只由骰子相加组成的表达式 (骰子池) 逐颗返回点数
+NumPy 只在批量抽样时导入，标量掷骰与精确分布不依赖它。
+"""
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+from damage_distribution import convolve_pmf, dice_sum_pmf
+from dice_source import STDLIB_DICE
+
+EXPR_CACHE_SIZE = 1024
+PMF_CACHE_SIZE = 1024
+
+_TOKEN = re.compile(r"\s*(?:(\d*)d(\d+)|(\d+)|(adv|dis)|([-+*()]))")
+
+# --- 解析: 表达式树为带标签的元组，可哈希，可直接作为缓存键 ---
+# ('const', 值) / ('dice', 个数, 面数) / ('highest', 个数, 面数) / ('add', a, b) / ('neg', a) / ('mul', a, b)
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if match is None or match.end() == pos:
+            raise ValueError(f"无法解析的骰子表达式: {text!r} (位置 {pos})")
+        count, sides, number, keyword, symbol = match.groups()
+        if sides is not None:
+            if int(sides) < 1:
+                raise ValueError(f"骰子面数必须为正: {text!r}")
+            tokens.append(('dice', int(count) if count else 1, int(sides)))
+        elif number is not None:
+            tokens.append(('const', int(number)))
+        else:
+            tokens.append((keyword or symbol,))
+        pos = match.end()
+    return tokens
+
+class _Parser:
+    def __init__(self, text):
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        if self.pos >= len(self.tokens):
+            raise ValueError(f"骰子表达式不完整: {self.text!r}")
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        node = self._additive()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"骰子表达式中有多余内容: {self.text!r}")
+        return node
+
+    def _additive(self):
+        node = self._term()
+        while self._peek() in ('+', '-', 'adv', 'dis'):
+            op = self._next()[0]
+            if op in ('adv', 'dis'):
+                dice = self._next()
+                if dice[0] != 'dice':
+                    raise ValueError(f"{op} 后面必须是骰子 (如 d6): {self.text!r}")
+                right = ('highest', dice[1], dice[2])
+                node = ('add', node, right if op == 'adv' else ('neg', right))
+            else:
+                right = self._term()
+                node = ('add', node, right if op == '+' else ('neg', right))
+        return node
+
+    def _term(self):
+        node = self._unary()
+        while self._peek() == '*':
+            self._next()
+            node = ('mul', node, self._unary())
+        return node
+
+    def _unary(self):
+        if self._peek() == '-':
+            self._next()
+            return ('neg', self._unary())
+        token = self._next()
+        if token[0] in ('const', 'dice'):
+            return token
+        if token[0] == '(':
+            node = self._additive()
+            if self._next()[0] != ')':
+                raise ValueError(f"括号不匹配: {self.text!r}")
+            return node
+        raise ValueError(f"骰子表达式中意外的 {token[0]!r}: {self.text!r}")
+
+# --- 编译: 标量掷骰的闭包 ---
+def _compile_scalar(node):
+    """返回 f(roll_sum)。NdS+常数 合并为一次 roll_sum(N, S, 常数) 调用。"""
+    kind = node[0]
+    if kind == 'const':
+        value = node[1]
+        return lambda roll_sum: value
+    if kind == 'dice':
+        _, count, sides = node
+        return lambda roll_sum: roll_sum(count, sides)
+    if kind == 'highest':
+        _, count, sides = node
+        return lambda roll_sum: max(roll_sum(1, sides) for _ in range(count))
+    if kind == 'neg':
+        operand = _compile_scalar(node[1])
+        return lambda roll_sum: -operand(roll_sum)
+    left, right = node[1], node[2]
+    if kind == 'add' and left[0] == 'dice' and right[0] == 'const':
+        _, count, sides = left
+        modifier = right[1]
+        return lambda roll_sum: roll_sum(count, sides, modifier)
+    left, right = _compile_scalar(left), _compile_scalar(right)
+    if kind == 'add':
+        return lambda roll_sum: left(roll_sum) + right(roll_sum)
+    return lambda roll_sum: left(roll_sum) * right(roll_sum)
+
+def _sample(node, rng, n):
+    import numpy as np
+    kind = node[0]
+    if kind == 'const':
+        return np.full(n, node[1], dtype=np.int64)
+    if kind == 'dice':
+        return rng.integers(1, node[2] + 1, size=(n, node[1])).sum(axis=1)
+    if kind == 'highest':
+        return rng.integers(1, node[2] + 1, size=(n, node[1])).max(axis=1)
+    if kind == 'neg':
+        return -_sample(node[1], rng, n)
+    left = _sample(node[1], rng, n)
+    right = _sample(node[2], rng, n)
+    return left + right if kind == 'add' else left * right
+
+# --- 精确分布 ---
+@lru_cache(maxsize=64)
+def highest_pmf(count, sides):
+    """count 颗 sides 面骰取最高的分布；count 为 0 时恒为 0。"""
+    if count == 0:
+        return {0: 1.0}
+    return {face: (face ** count - (face - 1) ** count) / sides ** count for face in range(1, sides + 1)}
+
+@lru_cache(maxsize=PMF_CACHE_SIZE)
+def node_pmf(node):
+    """表达式树的精确分布 {数值: 概率}。"""
+    kind = node[0]
+    if kind == 'const':
+        return {node[1]: 1.0}
+    if kind == 'dice':
+        return dice_sum_pmf(node[1], node[2])
+    if kind == 'highest':
+        return highest_pmf(node[1], node[2])
+    if kind == 'neg':
+        return {-v: p for v, p in node_pmf(node[1]).items()}
+    left, right = node_pmf(node[1]), node_pmf(node[2])
+    if kind == 'add':
+        return convolve_pmf(left, right)
+    result = defaultdict(float)
+    for a, pa in left.items():
+        for b, pb in right.items():
+            result[a * b] += pa * pb
+    return dict(result)
+
+def _pool_terms(node):
+    """只由骰子相加组成时返回 [(个数, 面数), ...] (按书写顺序)，否则返回 None。"""
+    if node[0] == 'dice':
+        return [(node[1], node[2])]
+    if node[0] == 'add':
+        left, right = _pool_terms(node[1]), _pool_terms(node[2])
+        if left is not None and right is not None:
+            return left + right
+    return None
+
+class DiceExpr:
+    """编译后的骰子表达式。按表达式树比较与哈希，可作为缓存键。"""
+    def __init__(self, text, node):
+        self.text = text
+        self.node = node
+        self.compiled = _compile_scalar(node)
+        terms = _pool_terms(node)
+        self.pool_terms = tuple(terms) if terms is not None else None
+        # 全部为单颗骰子 (如 d12+d12+d8) 时逐颗调用 dice_source.roll
+        single = terms is not None and all(count == 1 for count, _ in terms)
+        self._single_sides = tuple(sides for _, sides in terms) if single else None
+
+    def __repr__(self):
+        return f"DiceExpr({self.text!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, DiceExpr) and self.node == other.node
+
+    def __hash__(self):
+        return hash(self.node)
+
+    def roll(self, dice_source=STDLIB_DICE):
+        """掷一次，返回结果。"""
+        return self.compiled(lambda count, sides, modifier=0: dice_source.sum(count, sides) + modifier)
+
+    def sample(self, rng, n):
+        """批量掷 n 次，返回长度为 n 的 int64 数组。"""
+        if n == 0:
+            import numpy as np
+            return np.zeros(0, dtype=np.int64)
+        return _sample(self.node, rng, n)
+
+    def pmf(self):
+        """精确分布 {数值: 概率}，被所有调用方共享，请勿修改。"""
+        return node_pmf(self.node)
+
+    @property
+    def mean(self):
+        return sum(v * p for v, p in self.pmf().items())
+
+    def _require_pool(self):
+        if self.pool_terms is None:
+            raise ValueError(f"只有骰子相加组成的表达式才能逐颗掷骰: {self.text!r}")
+        return self.pool_terms
+
+    def roll_each(self, dice_source=STDLIB_DICE):
+        """骰子池逐颗掷骰，返回点数列表 (顺序与表达式中的骰子相同)。"""
+        terms = self._require_pool()
+        if len(terms) == 1:
+            return dice_source.roll_many(*terms[0])
+        if self._single_sides is not None:
+            roll = dice_source.roll
+            return [roll(sides) for sides in self._single_sides]
+        faces = []
+        for count, sides in terms:
+            faces.extend(dice_source.roll_many(count, sides))
+        return faces
+
+    def sample_each(self, rng, n):
+        """骰子池批量逐颗掷骰，返回 (n, 骰子数) 的点数数组。"""
+        import numpy as np
+        terms = self._require_pool()
+        return np.concatenate([rng.integers(1, sides + 1, size=(n, count)) for count, sides in terms], axis=1)
+
+@lru_cache(maxsize=EXPR_CACHE_SIZE)
+def compile_dice(text):
+    """解析并编译骰子表达式，按文本缓存。"""
+    return DiceExpr(text, _Parser(text).parse())
+
+@lru_cache(maxsize=EXPR_CACHE_SIZE)
+def pool_expr(dice_pool):
+    """由面数元组 (如 (12, 12, 8)) 得到逐颗掷骰用的骰子池表达式。"""
+    return compile_dice("+".join(f"d{side}" for side in dice_pool))
@@ -0,0 +1,87 @@
+"""
+骰子来源: 所有模拟器通过它掷骰，可注入、可设种子。
+
+DiceSource 按面数从带种子的 NumPy Generator 一次预抽一大块点数，
+再从缓冲区逐个发放，用完自动补充，避免逐个调用 random.randint。
+StdlibDiceSource 提供相同接口，直接使用标准库 random (未注入时的默认行为)。
+"""
+import random
+from itertools import islice
+
+DEFAULT_BLOCK_SIZE = 1 << 16
+
+class DiceSource:
+    """基于 NumPy Generator 的缓冲骰子来源。"""
+    def __init__(self, seed=None, block_size=DEFAULT_BLOCK_SIZE):
+        import numpy as np
+        # seed 可以是 None、整数、SeedSequence 或已有的 Generator
+        self.rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+        self.block_size = block_size
+        self._streams = {}
+        self._uniform = self._uniform_stream()
+
+    def _face_stream(self, sides):
+        """无限的点数流，每次补充 block_size 个。"""
+        integers = self.rng.integers
+        block_size = self.block_size
+        while True:
+            yield from integers(1, sides + 1, size=block_size).tolist()
+
+    def _uniform_stream(self):
+        while True:
+            yield from self.rng.random(self.block_size).tolist()
+
+    def _stream(self, sides):
+        stream = self._streams.get(sides)
+        if stream is None:
+            stream = self._streams[sides] = self._face_stream(sides)
+        return stream
+
+    def roll(self, sides):
+        """掷一个 sides 面骰。"""
+        return next(self._stream(sides))
+
+    def roll_many(self, count, sides):
+        """掷 count 个 sides 面骰，返回点数列表。"""
+        return list(islice(self._stream(sides), count))
+
+    def sum(self, count, sides):
+        """掷 count 个 sides 面骰，返回总和。"""
+        return sum(islice(self._stream(sides), count))
+
+    def random(self):
+        """[0, 1) 均匀随机数。"""
+        return next(self._uniform)
+
+    def choice(self, seq):
+        """从非空序列中均匀选取一个元素。"""
+        return seq[int(next(self._uniform) * len(seq))]
+
+    def generator(self):
+        """供向量化引擎使用的 NumPy Generator (与缓冲区共享同一随机流)。"""
+        return self.rng
+
+class StdlibDiceSource:
+    """使用标准库 random 全局状态的骰子来源，接口与 DiceSource 相同。"""
+    def roll(self, sides):
+        return random.randint(1, sides)
+
+    def roll_many(self, count, sides):
+        return [random.randint(1, sides) for _ in range(count)]
+
+    def sum(self, count, sides):
+        return sum(random.randint(1, sides) for _ in range(count))
+
+    def random(self):
+        return random.random()
+
+    def choice(self, seq):
+        return random.choice(seq)
+
+    def generator(self):
+        """由标准库 random 的全局状态派生一个 NumPy Generator，random.seed 仍然控制结果。"""
+        import numpy as np
+        return np.random.default_rng(random.getrandbits(128))
+
+# 未注入骰子来源时的默认值
+STDLIB_DICE = StdlibDiceSource()
@@ -0,0 +1,108 @@
+"""
+二元骰 (希望骰/恐惧骰 2d12) 的检定概率表，生成 dice.md。
+
+一次检定的结果 = 希望骰 + 恐惧骰 ± 优劣势骰 + 调整值，两颗二元骰点数相同时为关键成功，
+无论总值多少都算成功。对每个 DC 给出 等于/成功/失败 三列:
+  - 等于: 总值恰好等于 DC 的概率；
+  - 成功: 总值 >= DC 或关键成功的概率；
+  - 失败: 1 - 成功。
+优势/劣势: n 颗 d6 取最高加到 (减去) 总值上，优势和劣势互相抵消。
+分布由卷积得到，各 DC 的成功率用一次累加求出，按配置缓存。
+
+用法:
+  python duality_dice.py --output dice.md
+  python duality_dice.py --advantage 0 2 -2 --modifier 3 --dc-min 5 --dc-max 25
+"""
+import argparse
+from collections import defaultdict
+from functools import lru_cache
+from itertools import accumulate
+
+from damage_distribution import convolve_pmf
+from dice_expr import highest_pmf
+
+DUALITY_SIDES = 12
+ADVANTAGE_SIDES = 6
+DC_RANGE = range(-4, 31)
+# dice.md 中的三张表: 无优劣势 / 单优势 / 单劣势
+DEFAULT_CASES = (0, 1, -1)
+TABLE_CACHE_SIZE = 256
+
+@lru_cache(maxsize=TABLE_CACHE_SIZE)
+def duality_pmf(advantage=0, modifier=0):
+    """
+    检定总值的分布。advantage > 0 为优势骰数，< 0 为劣势骰数。
+    返回 (总值分布, 非关键成功时的总值分布)，后者总和为 1 - P(关键成功)。
+    """
+    pmf = defaultdict(float)
+    non_crit_pmf = defaultdict(float)
+    face_prob = 1.0 / DUALITY_SIDES ** 2
+    for hope in range(1, DUALITY_SIDES + 1):
+        for fear in range(1, DUALITY_SIDES + 1):
+            pmf[hope + fear + modifier] += face_prob
+            if hope != fear:
+                non_crit_pmf[hope + fear + modifier] += face_prob
+    sign = 1 if advantage >= 0 else -1
+    extra = {sign * face: p for face, p in highest_pmf(abs(advantage), ADVANTAGE_SIDES).items()}
+    return convolve_pmf(dict(pmf), extra), convolve_pmf(dict(non_crit_pmf), extra)
+
+@lru_cache(maxsize=TABLE_CACHE_SIZE)
+def duality_table(advantage=0, modifier=0, dcs=DC_RANGE):
+    """[(DC, 等于, 成功, 失败)]，概率为 0..1。dcs 需为可哈希的 range 或元组。"""
+    pmf, non_crit_pmf = duality_pmf(advantage, modifier)
+    dcs = list(dcs)
+    lo = min(min(pmf), min(dcs))
+    hi = max(max(pmf), max(dcs))
+    equal = [0.0] * (hi - lo + 2)
+    non_crit = [0.0] * (hi - lo + 2)
+    for total, p in pmf.items():
+        equal[total - lo] = p
+    for total, p in non_crit_pmf.items():
+        non_crit[total - lo] = p
+    # 非关键成功时 总值 >= DC 的概率 (从高到低累加)
+    non_crit_at_least = list(accumulate(non_crit[::-1]))[::-1]
+    crit = 1.0 - non_crit_at_least[0]
+    rows = []
+    for dc in dcs:
+        success = min(1.0, crit + non_crit_at_least[dc - lo])
+        rows.append((dc, equal[dc - lo], success, 1.0 - success))
+    return rows
+
+def case_label(advantage):
+    if advantage == 0:
+        return "无优劣势"
+    count = {1: "单", 2: "双"}.get(abs(advantage), f"{abs(advantage)}颗")
+    return count + ("优势" if advantage > 0 else "劣势")
+
+def format_table(advantage=0, modifier=0, dcs=DC_RANGE):
+    """一张 markdown 表的各行。"""
+    label = case_label(advantage) + (f"{modifier:+d}" if modifier else "")
+    lines = [f"| {label} | 等于 | 成功 | 失败 |",
+             "|---|-------------|---------|------|"]
+    for dc, equal, success, fail in duality_table(advantage, modifier, dcs):
+        lines.append(f"| {dc:2d} | {equal * 100:11.2f} % | {success * 100:7.2f} % | {fail * 100:6.2f} % |")
+    return lines
+
+def format_markdown(cases=DEFAULT_CASES, modifier=0, dcs=DC_RANGE):
+    """把各张表横向拼成一张 markdown 表 (dice.md 的格式)。"""
+    tables = [format_table(advantage, modifier, dcs) for advantage in cases]
+    rows = [first + "".join(table[i][1:] for table in tables[1:]) for i, first in enumerate(tables[0])]
+    return "\n".join(rows) + "\n\n\n"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="二元骰检定概率表")
+    parser.add_argument("--advantage", type=int, nargs="+", default=list(DEFAULT_CASES),
+                        help="各张表的优势骰数，负数为劣势骰数")
+    parser.add_argument("--modifier", type=int, default=0, help="调整值")
+    parser.add_argument("--dc-min", type=int, default=DC_RANGE.start)
+    parser.add_argument("--dc-max", type=int, default=DC_RANGE.stop - 1)
+    parser.add_argument("--output", help="写入文件 (如 dice.md)，默认打印")
+    args = parser.parse_args()
+
+    text = format_markdown(tuple(args.advantage), args.modifier, range(args.dc_min, args.dc_max + 1))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"结果已写入 {args.output}")
+    else:
+        print(text, end="")
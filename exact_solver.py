@@ -0,0 +1,324 @@
+"""
+精确求解器: 把每把武器的有限状态视为马尔可夫链，逐回合推进 (状态, 累计HP损失) 的概率分布，
+不做任何抽样。
+
+每个动作在 EXACT_MODELS 中有一个转移模型:
+    model(ctx, state, current_round) -> [(概率, 新状态, 本回合HP损失, 本回合命中数), ...]
+状态是可哈希的元组，初始状态由 EXACT_MODELS 一并给出。
+"""
+from collections import defaultdict
+from functools import lru_cache
+from math import comb
+from types import SimpleNamespace
+
+from damage_distribution import convolve_pmf, damage_pmf, dice_sum_pmf, hp_loss_pmf, hp_loss_pmf_of_sum
+from monte_carlo_simulator import convert_damage_to_hp_loss
+
+# --- 命中概率 ---
+ATTACK_PMF = dice_sum_pmf(2, 12)
+ATTACK_WITH_D6_PMF = convolve_pmf(ATTACK_PMF, dice_sum_pmf(1, 6))
+
+@lru_cache(maxsize=None)
+def hit_probability(modifier, defense, extra_d6=False, strict=False):
+    """P(2d12 + modifier [+ 1d6] >= defense)。strict=True 时为 > defense。"""
+    target = defense + 1 if strict else defense
+    pmf = ATTACK_WITH_D6_PMF if extra_d6 else ATTACK_PMF
+    return sum(p for total, p in pmf.items() if total + modifier >= target)
+
+# --- 求解上下文: 分布取自 damage_distribution 的共享缓存 ---
+class _SolverContext:
+    def __init__(self, attacker, defender, pro_level):
+        self.attacker = attacker
+        self.defender = defender
+        self.pro_level = pro_level
+        self.spec = attacker.damage_spec
+        self.damage_pmf = damage_pmf(self.spec)
+        self.thresholds = tuple(defender.thresholds[pro_level - 1])
+        self.last_round = None  # 最后一回合 (盾斧在最后一回合强制超解)，由求解器设置
+
+    def hp_loss(self, damage):
+        return convert_damage_to_hp_loss(damage, self.defender, self.pro_level)
+
+    def hp_pmf(self, add=0, mult=1):
+        """(base_damage + add) * mult 对应的HP损失分布 (P(0), P(1), P(2), P(3))。"""
+        return hp_loss_pmf(self.spec, self.thresholds, add, mult)
+
+    def hp_pmf_of_sum(self, num_hits):
+        """num_hits 次独立 base_damage 之和对应的HP损失分布。"""
+        return hp_loss_pmf_of_sum(self.spec, self.thresholds, num_hits)
+
+def _hit_outcomes(p_hit, hp_buckets, state, hits=1, miss_state=None):
+    """单次命中判定的通用结果: 命中按HP损失分桶，未命中为0。"""
+    outcomes = [(1 - p_hit, state if miss_state is None else miss_state, 0, 0)]
+    for hp, p in enumerate(hp_buckets):
+        if p > 0:
+            outcomes.append((p_hit * p, state, hp, hits))
+    return outcomes
+
+# --- 转移模型: 与 monte_carlo_simulator 中的动作一一对应 ---
+
+def _simple_attack_model(ctx, state, current_round):
+    a = ctx.attacker
+    return _hit_outcomes(hit_probability(a.attack_modifier, ctx.defender.defense), ctx.hp_pmf(), state)
+
+def _long_sword_token_model(ctx, state, current_round):
+    a = ctx.attacker
+    tokens, = state
+    p_hit = hit_probability(a.attack_modifier, ctx.defender.defense)
+    new_tokens = min(tokens + 1, 3)
+    outcomes = [(1 - p_hit, (max(tokens - 1, 0),), 0, 0)]
+    for hp, p in enumerate(ctx.hp_pmf(add=new_tokens * 5)):
+        outcomes.append((p_hit * p, (new_tokens,), hp, 1))
+    return outcomes
+
+def _form_switching_model(ctx, state, current_round):
+    a = ctx.attacker
+    active, remaining, total = state
+    if active:
+        remaining -= 1
+        if remaining <= 0:
+            active, remaining = False, 0
+
+    p_hit = hit_probability(a.attack_modifier + (a.form_attack_bonus if active else 0), ctx.defender.defense)
+    hp_buckets = ctx.hp_pmf(add=a.form_damage_bonus if active else 0)
+    hit_state = (active, remaining, total)
+    if not active:
+        total += 1
+        hit_state = (True, a.form_duration, 0) if total >= a.form_switch_threshold else (False, 0, total)
+    return _hit_outcomes(p_hit, hp_buckets, hit_state, miss_state=(active, remaining, state[2]))
+
+def _charge_blade_model(ctx, state, current_round):
+    a = ctx.attacker
+    tokens, = state
+    p_hit = hit_probability(a.attack_modifier, ctx.defender.defense)
+    if tokens >= a.discharge_threshold or (current_round == ctx.last_round and tokens > 0):
+        hp_buckets = ctx.hp_pmf(add=(2 * tokens) ** 2, mult=a.num_aoe_targets)
+        return _hit_outcomes(p_hit, hp_buckets, (0,), hits=a.num_aoe_targets)
+    return _hit_outcomes(p_hit, ctx.hp_pmf(), (tokens + 1,), miss_state=state)
+
+def _multi_attack_model(ctx, state, current_round):
+    a = ctx.attacker
+    p_hit = hit_probability(a.attack_modifier, ctx.defender.defense)
+    outcomes = []
+    for num_hits in range(a.num_attacks + 1):
+        p_count = comb(a.num_attacks, num_hits) * p_hit ** num_hits * (1 - p_hit) ** (a.num_attacks - num_hits)
+        for hp, p in enumerate(ctx.hp_pmf_of_sum(num_hits)):
+            outcomes.append((p_count * p, state, hp, num_hits))
+    return outcomes
+
+def _wyvernstake_model(ctx, state, current_round):
+    a = ctx.attacker
+    active, countdown, accumulated = state
+    p_hit = hit_probability(a.attack_modifier, ctx.defender.defense)
+    if not active:
+        return _hit_outcomes(p_hit, ctx.hp_pmf(), (True, 3, 0), miss_state=state)
+
+    # 累积伤害只会与阈值比较，饱和到第二阈值不改变任何结果 (伤害非负时精确)
+    cap = ctx.thresholds[1]
+    countdown -= 1
+    outcomes = []
+    if countdown <= 0:
+        outcomes.append((1 - p_hit, (False, 0, 0), ctx.hp_loss(accumulated), 0))
+        for damage, p in ctx.damage_pmf.items():
+            outcomes.append((p_hit * p, (False, 0, 0), ctx.hp_loss(damage + min(accumulated + damage, cap)), 1))
+    else:
+        outcomes.append((1 - p_hit, (True, countdown, accumulated), 0, 0))
+        for damage, p in ctx.damage_pmf.items():
+            outcomes.append((p_hit * p, (True, countdown, min(accumulated + damage, cap)), ctx.hp_loss(damage), 1))
+    return outcomes
+
+def _insect_glaive_model(ctx, state, current_round):
+    a = ctx.attacker
+    tokens, = state
+    use_token = tokens > 0
+    if use_token:
+        tokens -= 1
+    p_hit = hit_probability(a.attack_modifier, ctx.defender.defense, extra_d6=use_token)
+    outcomes = [(1 - p_hit, (tokens,), 0, 0)]
+    for hp, p in enumerate(ctx.hp_pmf()):
+        outcomes.append((p_hit * p, (tokens + hp,), hp, 1))
+    return outcomes
+
+def _simple_aoe_model(ctx, state, current_round):
+    a = ctx.attacker
+    p_hit = hit_probability(a.attack_modifier, ctx.defender.defense)
+    return _hit_outcomes(p_hit, ctx.hp_pmf(mult=a.num_aoe_targets), state, hits=a.num_aoe_targets)
+
+def _great_hammer_model(ctx, state, current_round):
+    a = ctx.attacker
+    active, duration = state
+    if active:
+        duration -= 1
+        if duration <= 0:
+            active, duration = False, 0
+    p_hit = hit_probability(a.attack_modifier, ctx.defender.defense, extra_d6=active)
+    outcomes = [(1 - p_hit, (active, duration), 0, 0)]
+    for hp, p in enumerate(ctx.hp_pmf()):
+        trigger = hp >= 2 and not active
+        outcomes.append((p_hit * p, (True, 2) if trigger else (active, duration), hp, 1))
+    return outcomes
+
+def _lance_model(ctx, state, current_round):
+    a = ctx.attacker
+    p_first = hit_probability(a.attack_modifier, ctx.defender.defense, strict=True)
+    p_second = 0.5 * p_first
+    count_probs = [
+        (1 - p_first) * (1 - p_second),
+        p_first * (1 - p_second) + (1 - p_first) * p_second,
+        p_first * p_second,
+    ]
+    outcomes = []
+    for num_hits, p_count in enumerate(count_probs):
+        for hp, p in enumerate(ctx.hp_pmf_of_sum(num_hits)):
+            outcomes.append((p_count * p, state, hp, num_hits))
+    return outcomes
+
+def _light_bowgun_model(ctx, state, current_round):
+    a = ctx.attacker
+    defense = ctx.defender.defense
+    # 第一次结果 <= defense 时重骰
+    p_keep = hit_probability(a.attack_modifier, defense, strict=True)
+    p_hit = p_keep + (1 - p_keep) * hit_probability(a.attack_modifier, defense)
+    return _hit_outcomes(p_hit, ctx.hp_pmf(), state)
+
+def _heavy_bowgun_model(ctx, state, current_round):
+    a = ctx.attacker
+    p_hit = hit_probability(a.attack_modifier + a.buff_stacks, ctx.defender.defense)
+    return _hit_outcomes(p_hit, ctx.hp_pmf(add=a.buff_stacks), state)
+
+# 动作函数名 -> (初始状态, 转移模型)
+EXACT_MODELS = {
+    'simple_attack_action': ((), _simple_attack_model),
+    'long_sword_token_action': ((0,), _long_sword_token_model),
+    'form_switching_action': ((False, 0, 0), _form_switching_model),
+    'charge_blade_action': ((0,), _charge_blade_model),
+    'multi_attack_action': ((), _multi_attack_model),
+    'wyvernstake_action': ((False, 0, 0), _wyvernstake_model),
+    'insect_glaive_action': ((0,), _insect_glaive_model),
+    'simple_aoe_action': ((), _simple_aoe_model),
+    'great_hammer_action': ((False, 0), _great_hammer_model),
+    'lance_action': ((), _lance_model),
+    'light_bowgun_action': ((), _light_bowgun_model),
+    'heavy_bowgun_action': ((), _heavy_bowgun_model),
+}
+
+# 无状态动作: 每回合独立同分布，可直接得到闭式期望
+STATELESS_ACTIONS = frozenset(name for name, (initial_state, _) in EXACT_MODELS.items() if initial_state == ())
+
+def is_stateless(action_function):
+    return action_function.__name__ in STATELESS_ACTIONS
+
+def stateless_expectation(action_function, attacker_stats, defender_stats, pro_level=1):
+    """无状态动作每回合的闭式期望: (期望命中, 期望HP损失)。"""
+    _, model = EXACT_MODELS[action_function.__name__]
+    ctx = _SolverContext(attacker_stats, defender_stats, pro_level)
+    outcomes = model(ctx, (), 1)
+    return sum(p * hits for p, _, _, hits in outcomes), sum(p * hp for p, _, hp, _ in outcomes)
+
+# --- 求解器核心 ---
+class ExactSolver:
+    """与 Simulator 接口一致的精确求解器。"""
+    def __init__(self, action_function, attacker_stats, defender_stats):
+        if action_function.__name__ not in EXACT_MODELS:
+            raise ValueError(f"动作 {action_function.__name__} 没有精确模型")
+        if not hasattr(attacker_stats, 'damage_spec'):
+            raise ValueError("精确求解需要 attacker_stats.damage_spec，请使用 build_attacker_stats 构建攻击者")
+        self.action_function = action_function
+        self.attacker_stats = attacker_stats
+        self.defender_stats = defender_stats
+
+    def solve(self, num_rounds=10, pro_level=1):
+        """
+        逐回合推进 (状态, 累计HP损失) 的联合分布。
+        返回: SimpleNamespace(avg_hits, avg_hp_loss, hp_loss_distribution, error_bound)
+          hp_loss_distribution - 每场战斗总HP损失的分布 {HP损失: 概率}
+          error_bound          - 状态截断导致的概率质量误差上界 (当前所有模型均为精确，恒为0)
+        """
+        if is_stateless(self.action_function):
+            hits_per_round, hp_per_round = stateless_expectation(
+                self.action_function, self.attacker_stats, self.defender_stats, pro_level)
+            return SimpleNamespace(
+                avg_hits=hits_per_round * num_rounds,
+                avg_hp_loss=hp_per_round * num_rounds,
+                hp_loss_distribution=self._stateless_distribution(num_rounds, pro_level),
+                error_bound=0.0,
+            )
+
+        initial_state, model = EXACT_MODELS[self.action_function.__name__]
+        ctx = _SolverContext(self.attacker_stats, self.defender_stats, pro_level)
+        ctx.last_round = num_rounds
+
+        distribution = {(initial_state, 0): 1.0}
+        expected_hits = 0.0
+        for current_round in range(1, num_rounds + 1):
+            transitions = {}
+            new_distribution = defaultdict(float)
+            for (state, total_hp_loss), p_state in distribution.items():
+                if state not in transitions:
+                    transitions[state] = model(ctx, state, current_round)
+                for p, new_state, hp_loss, hits in transitions[state]:
+                    if p <= 0:
+                        continue
+                    new_distribution[(new_state, total_hp_loss + hp_loss)] += p_state * p
+                    expected_hits += p_state * p * hits
+            distribution = new_distribution
+
+        hp_loss_distribution = defaultdict(float)
+        for (_, total_hp_loss), p in distribution.items():
+            hp_loss_distribution[total_hp_loss] += p
+        hp_loss_distribution = dict(sorted(hp_loss_distribution.items()))
+        avg_hp_loss = sum(hp * p for hp, p in hp_loss_distribution.items())
+        return SimpleNamespace(
+            avg_hits=expected_hits,
+            avg_hp_loss=avg_hp_loss,
+            hp_loss_distribution=hp_loss_distribution,
+            error_bound=0.0,
+        )
+
+    def time_to_kill(self, hp, max_rounds=100, pro_level=1):
+        """
+        击杀回合的精确分布: 逐回合推进 (状态, 累计HP损失)，累计达到 hp 的概率质量在该回合吸收。
+        返回: {击杀回合: 概率}，总和为 max_rounds 内的击杀概率。
+        """
+        initial_state, model = EXACT_MODELS[self.action_function.__name__]
+        ctx = _SolverContext(self.attacker_stats, self.defender_stats, pro_level)
+        ctx.last_round = max_rounds
+
+        distribution = {(initial_state, 0): 1.0}
+        kill_distribution = {}
+        for current_round in range(1, max_rounds + 1):
+            transitions = {}
+            new_distribution = defaultdict(float)
+            killed = 0.0
+            for (state, total_hp_loss), p_state in distribution.items():
+                if state not in transitions:
+                    transitions[state] = model(ctx, state, current_round)
+                for p, new_state, hp_loss, _ in transitions[state]:
+                    if p <= 0:
+                        continue
+                    if total_hp_loss + hp_loss >= hp:
+                        killed += p_state * p
+                    else:
+                        new_distribution[(new_state, total_hp_loss + hp_loss)] += p_state * p
+            if killed:
+                kill_distribution[current_round] = killed
+            distribution = new_distribution
+            if not distribution:
+                break
+        return kill_distribution
+
+    def _stateless_distribution(self, num_rounds, pro_level):
+        """无状态动作的总HP损失分布: 单回合分布的 num_rounds 次卷积。"""
+        _, model = EXACT_MODELS[self.action_function.__name__]
+        round_pmf = defaultdict(float)
+        for p, _, hp, _ in model(_SolverContext(self.attacker_stats, self.defender_stats, pro_level), (), 1):
+            round_pmf[hp] += p
+        distribution = {0: 1.0}
+        for _ in range(num_rounds):
+            distribution = convolve_pmf(distribution, round_pmf)
+        return dict(sorted(distribution.items()))
+
+    def run(self, num_simulations=None, num_rounds=10, pro_level=1):
+        """与 Simulator.run 返回格式相同: (每场平均命中, 每场平均HP损失)。num_simulations 被忽略。"""
+        result = self.solve(num_rounds, pro_level)
+        return result.avg_hits, result.avg_hp_loss
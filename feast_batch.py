@@ -0,0 +1,77 @@
+"""
+beast_feast 烹饪过程的向量化批量引擎: 成千上万次烹饪同时以NumPy数组推进。
+
+骰子池是固定宽度的数组加存活掩码 (会话数 × 初始骰子数)，每轮:
+  - 只对存活的骰子掷骰，按行统计各点数出现次数 (bincount)；
+  - 出现两次以上的点数计分，掷出这些点数的骰子从掩码中移除；
+  - 没有匹配的行按移除策略 (random / largest / smallest) 移除一颗存活的骰子；
+  - 剩余骰子不超过1颗的会话退出批次。
+结果分布与 beast_feast.simulate_cooking_session 相同。
+"""
+import numpy as np
+
+# 单次分块的会话数，用于限制内存
+DEFAULT_CHUNK_SIZE = 100_000
+
+def simulate_sessions(initial_dice_pool, n, rng, removal_strategy='random'):
+    """
+    向量化运行 n 次烹饪。removal_strategy: 'random', 'largest' 或 'smallest'。
+    返回: (每次总分数组, 每次奖励骰数组)
+    """
+    scores = np.zeros(n, dtype=np.int64)
+    bonuses = np.zeros(n, dtype=np.int64)
+    width = len(initial_dice_pool)
+    if width <= 1 or n == 0:
+        return scores, bonuses
+
+    sides = np.asarray(initial_dice_pool, dtype=np.int64)
+    num_faces = int(sides.max()) + 1      # 点数 0 表示该位置的骰子已移除
+    values = np.arange(num_faces)
+    alive = np.ones((n, width), dtype=bool)
+    active = np.arange(n)                 # 仍在进行的会话在结果数组中的行号
+
+    while active.size:
+        rows = active.size
+        # 掷骰: 已移除的骰子记为点数 0
+        rolls = (rng.random((rows, width)) * sides).astype(np.int64) + 1
+        rolls[~alive] = 0
+
+        # 按行统计各点数的出现次数
+        offsets = np.arange(rows)[:, None] * num_faces
+        face_counts = np.bincount((rolls + offsets).ravel(), minlength=rows * num_faces).reshape(rows, num_faces)
+        face_counts[:, 0] = 0
+        matched = face_counts >= 2
+        round_scores = matched @ values
+        scores[active] += round_scores
+        bonuses[active] += np.maximum(face_counts - 2, 0).sum(axis=1)
+
+        # 移除掷出匹配点数的骰子
+        alive &= ~np.take_along_axis(matched, rolls, axis=1)
+
+        # 没有匹配的行按策略移除一颗存活的骰子 (同面数的骰子可以互换，取第一颗即可)
+        no_match = np.flatnonzero(round_scores == 0)
+        if no_match.size:
+            if removal_strategy == 'largest':
+                keys = np.broadcast_to(sides, (no_match.size, width)).astype(float)
+            elif removal_strategy == 'smallest':
+                keys = np.broadcast_to(-sides, (no_match.size, width)).astype(float)
+            else:
+                keys = rng.random((no_match.size, width))
+            keys[~alive[no_match]] = -np.inf
+            alive[no_match, keys.argmax(axis=1)] = False
+
+        # 剩余不超过1颗骰子的会话退出批次
+        still_active = alive.sum(axis=1) > 1
+        active = active[still_active]
+        alive = alive[still_active]
+
+    return scores, bonuses
+
+def run_sessions(initial_dice_pool, num_simulations, rng, score_stats, bonus_stats, chunk_size=DEFAULT_CHUNK_SIZE,
+                 removal_strategy='random'):
+    """分块运行 num_simulations 次烹饪，结果逐块记入两个 StreamingStats。"""
+    for start in range(0, num_simulations, chunk_size):
+        n = min(chunk_size, num_simulations - start)
+        scores, bonuses = simulate_sessions(initial_dice_pool, n, rng, removal_strategy)
+        score_stats.add_batch(scores)
+        bonus_stats.add_batch(bonuses)
@@ -0,0 +1,315 @@
+"""
+烹饪过程 (beast_feast.simulate_cooking_session) 的精确求解器。
+
+骰子池的状态完全由剩余的 d4/d6/d8/d10/d12/d20 个数决定，按这个计数元组记忆化。
+单轮掷骰不逐个列举点数组合，而是按面数计数的多项分布逐步分解:
+
+  - 点数从大到小处理。处理到点数 v 时，所有尚未落点且面数 >= v 的骰子都在 1..v 上均匀，
+    因此掷出 v 的个数只取决于它们的总数 (二项分布)，与种类无关。
+  - 以各面数为界把点数分段 (如 20..13, 12..11, ..., 4..1)，每段内只按总数推进，
+    得到 (保留数, 落入更小点数的个数, 得分) 的分布 (_stage_kernel，与种类无关，可共享)。
+  - 段与段之间再用多元超几何分布把保留/落入下一段的骰子分配回各个种类。
+
+得到单轮 (剩余计数, 本轮得分) 的分布后，对剩余计数递归求解整个烹饪过程。
+
+只需要期望值时 (策略求解、全配置扫描) 使用 round_moments: 它不逐段拆分骰池，
+而是直接数每个保留组合的落点方式，表格在不同骰子池间共享，比 round_outcomes 快几个数量级。
+"""
+from collections import defaultdict
+from functools import lru_cache
+from math import comb, factorial
+from types import SimpleNamespace
+
+import numpy as np
+
+from beast_feast import DICE_TYPES
+
+SIDES = tuple(int(name[1:]) for name in DICE_TYPES)
+
+PARTITION_CACHE_SIZE = 1 << 16
+ROUND_CACHE_SIZE = 1024
+
+def counts_from_dice(dice_counts):
+    """{'d4': 8, ...} -> 按 DICE_TYPES 顺序的计数元组。"""
+    return tuple(dice_counts.get(name, 0) for name in DICE_TYPES)
+
+def _add_into(acc, arr, offset=0):
+    """acc[offset:offset+len(arr)] += arr，必要时加长 acc。返回 acc。"""
+    end = offset + len(arr)
+    if end > len(acc):
+        acc = np.concatenate([acc, np.zeros(end - len(acc))])
+    acc[offset:end] += arr
+    return acc
+
+@lru_cache(maxsize=None)
+def _binomial_pmf(n, p):
+    """Binomial(n, p) 的概率列表。"""
+    return tuple(comb(n, k) * p ** k * (1 - p) ** (n - k) for k in range(n + 1))
+
+@lru_cache(maxsize=None)
+def _stage_kernel(entry, hi, lo):
+    """
+    entry 颗在 1..hi 上均匀的骰子，只处理点数 hi..lo:
+    {(保留数, 落入 1..lo-1 的个数): (得分分布数组, 概率×奖励骰)}。
+    """
+    layer = {(entry, 0, 0): (1.0, 0.0)}  # (未落点数, 保留数, 得分) -> (概率, 概率×奖励骰)
+    for value in range(hi, lo - 1, -1):
+        new_layer = defaultdict(lambda: [0.0, 0.0])
+        for (unassigned, kept, score), (p, b) in layer.items():
+            for t, pt in enumerate(_binomial_pmf(unassigned, 1.0 / value)):
+                if pt == 0.0:
+                    continue
+                key = (unassigned - t, kept + (t == 1), score + value if t >= 2 else score)
+                acc = new_layer[key]
+                acc[0] += p * pt
+                acc[1] += (b + p * max(t - 2, 0)) * pt
+        layer = new_layer
+    kernel = {}
+    for (unassigned, kept, score), (p, b) in layer.items():
+        arr, bonus = kernel.get((kept, unassigned), (np.zeros(0), 0.0))
+        arr = _add_into(arr, np.array([p]), score)
+        kernel[(kept, unassigned)] = (arr, bonus + b)
+    return kernel
+
+def _stages(counts):
+    """按面数分段: 生成 (段最高点数, 段最低点数, 本段加入的骰子种类下标)。"""
+    sides_present = sorted({SIDES[i] for i, c in enumerate(counts) if c}, reverse=True)
+    for stage, hi in enumerate(sides_present):
+        lo = sides_present[stage + 1] + 1 if stage + 1 < len(sides_present) else 1
+        yield hi, lo, [i for i, s in enumerate(SIDES) if s == hi]
+
+@lru_cache(maxsize=PARTITION_CACHE_SIZE)
+def _partitions(pool, kept_total, passed_total):
+    """
+    把各种类的骰子 pool 随机分成 保留/落入下一段/移除 三组 (组大小给定) 的所有方式:
+    [(保留计数, 落入计数, 概率)]，概率为多元超几何分布。
+    """
+    entry = sum(pool)
+    denominator = comb(entry, kept_total) * comb(entry - kept_total, passed_total)
+
+    def walk(i, kept_left, passed_left):
+        if i == len(pool):
+            if kept_left == 0 and passed_left == 0:
+                yield (), (), 1
+            return
+        n = pool[i]
+        for k in range(min(n, kept_left) + 1):
+            for q in range(min(n - k, passed_left) + 1):
+                ways = comb(n, k) * comb(n - k, q)
+                for kept, passed, rest in walk(i + 1, kept_left - k, passed_left - q):
+                    yield (k,) + kept, (q,) + passed, ways * rest
+
+    return [(kept, passed, ways / denominator) for kept, passed, ways in walk(0, kept_total, passed_total)]
+
+@lru_cache(maxsize=ROUND_CACHE_SIZE)
+def round_outcomes(counts):
+    """
+    单轮掷骰的结果分布: {剩余计数: (本轮得分分布数组, 概率×本轮奖励骰)}。
+    剩余计数等于 counts 表示没有任何匹配 (得分为0)。
+    """
+    zero = (0,) * len(counts)
+    # (未落点的各种类计数, 保留的各种类计数) -> (得分分布数组, 概率×奖励骰)
+    layer = {(zero, zero): (np.array([1.0]), 0.0)}
+    for hi, lo, joining in _stages(counts):
+        new_layer = {}
+        for (pool, kept), (arr, b) in layer.items():
+            pool = tuple(c + counts[i] if i in joining else c for i, c in enumerate(pool))
+            p_path = arr.sum()
+            for (kept_total, passed_total), (k_arr, k_b) in _stage_kernel(sum(pool), hi, lo).items():
+                combined = np.convolve(arr, k_arr)
+                p_kernel = k_arr.sum()
+                for kept_add, passed, w in _partitions(pool, kept_total, passed_total):
+                    key = (passed, tuple(a + c for a, c in zip(kept, kept_add)))
+                    bonus = w * (b * p_kernel + p_path * k_b)
+                    if key in new_layer:
+                        old_arr, old_b = new_layer[key]
+                        new_layer[key] = (_add_into(old_arr, w * combined), old_b + bonus)
+                    else:
+                        new_layer[key] = (w * combined, bonus)
+        layer = new_layer
+    return {kept: value for (_, kept), value in layer.items()}
+
+def kept_strides(counts):
+    """保留计数向量的混合进制编码: 下标 = sum(kept[i] * strides[i])。返回 (strides, 编码总数)。"""
+    strides = []
+    size = 1
+    for c in counts:
+        strides.append(size)
+        size *= c + 1
+    return tuple(strides), size
+
+# --- 单轮结果的矩 (用于期望值和策略求解) ---
+# 固定哪些骰子最终被保留 (S: 点数唯一) 、哪些被移除 (T: 点数出现两次以上)，
+# 按点数从大到小数合法的落点方式: 某种骰子加入后与之前加入的骰子可以互换，
+# 所以只需记录尚未落点的 S、T 总数 (a, t)。以后各段加入的骰子中保留多少颗 (k_j)
+# 作为数组的前几个轴，整张表只取决于面数较小的各种骰子的个数，可在不同骰子池间共享。
+# 方式数按 a!t! 归一 (指数生成函数)，段内的落点核就是各点数因子的乘积。
+STAGES = tuple(
+    (hi, (sorted(SIDES, reverse=True) + [0])[rank + 1] + 1, SIDES.index(hi))
+    for rank, hi in enumerate(sorted(SIDES, reverse=True))
+)  # (段最高点数, 段最低点数, 段开始时加入的骰子种类下标)，从大到小
+TABLE_DICE = 16
+FUTURE_CACHE_SIZE = 256
+
+def _product_rule(a, b):
+    """(方式数, 方式数×得分, 方式数×奖励骰) 三元组的乘法。"""
+    return a[0] * b[0], a[1] * b[0] + a[0] * b[1], a[2] * b[0] + a[0] * b[2]
+
+@lru_cache(maxsize=None)
+def _placement_kernel(hi, lo, capacity):
+    """
+    点数 hi..lo 内放下 x 颗 S 骰 (各占一个点数) 和 y 颗 T 骰 (每个点数两颗以上) 的归一方式数。
+    返回形状 (3, capacity+1, capacity+1) 的数组: 方式数/(x!y!)，及其与本段得分、奖励骰的乘积。
+    """
+    size = capacity + 1
+    inv_factorial = np.array([1.0 / factorial(j) for j in range(size)])
+    kernel = np.zeros((3, size, size))
+    kernel[0, 0, 0] = 1.0
+    for value in range(hi, lo - 1, -1):
+        new = kernel.copy()                       # 该点数空着
+        new[:, 1:, :] += kernel[:, :-1, :]        # 放一颗 S 骰
+        for j in range(2, size):                  # 放 j 颗 T 骰
+            group = (inv_factorial[j], value * inv_factorial[j], (j - 2) * inv_factorial[j])
+            shifted = kernel[:, :, :size - j]
+            for channel, term in enumerate(_product_rule(shifted, group)):
+                new[channel, :, j:] += term
+        kernel = new
+    kernel.flags.writeable = False
+    return kernel
+
+@lru_cache(maxsize=None)
+def _convolution_matrix(hi, lo, capacity):
+    """
+    与 _placement_kernel 做二维卷积的矩阵形式: 形状 (3, (capacity+1)², (capacity+1)²)，
+    [c, (a', t'), (a, t)] = kernel[c, a-a', t-t'] (a >= a', t >= t')。
+    """
+    size = capacity + 1
+    kernel = _placement_kernel(hi, lo, capacity)
+    conv = np.zeros((3, size, size, size, size))
+    for a0 in range(size):
+        for t0 in range(size):
+            conv[:, a0, t0, a0:, t0:] = kernel[:, :size - a0, :size - t0]
+    conv = conv.reshape(3, size * size, size * size)
+    conv.flags.writeable = False
+    return conv
+
+@lru_cache(maxsize=FUTURE_CACHE_SIZE)
+def _future_table(stage, future, capacity):
+    """
+    第 stage 段开始时 (本段骰子已加入) 尚有 a 颗 S、t 颗 T 未落点 (a+t <= capacity)，
+    以后各段依次加入 future[j] 颗骰子、其中 k_j 颗为 S 时，全部落点于 1..本段最高点数的归一方式数。
+    返回形状 (3, future[0]+1, ..., future[-1]+1, capacity+1, capacity+1)。
+    """
+    hi, lo, _ = STAGES[stage]
+    kernel = _placement_kernel(hi, lo, capacity)
+    if stage == len(STAGES) - 1:
+        return kernel
+    size = capacity + 1
+    n = future[0]
+    after = _future_table(stage + 1, future[1:], capacity + n)
+    # 下一段加入 n 颗骰子，其中 k 颗为 S: 下一段的表在 (a+k, t+n-k) 处取值，再换回 a!t! 归一
+    fact = np.array([float(factorial(a)) for a in range(capacity + n + 1)])
+    joined = np.empty((3, n + 1) + after.shape[1:-2] + (size, size))
+    for k in range(n + 1):
+        scale = np.outer(fact[k:k + size] / fact[:size], fact[n - k:n - k + size] / fact[:size])
+        joined[:, k] = after[..., k:k + size, n - k:n - k + size] * scale
+    # 与本段落点核做二维卷积 (截断到 capacity)，写成对展平的 (a, t) 轴的矩阵乘法
+    conv = _convolution_matrix(hi, lo, capacity)
+    flat = joined.reshape(3, -1, size * size)
+    table = flat @ conv[0]                 # 三元组乘法: (c, s, b)·(kc, ks, kb)
+    table[1] += flat[0] @ conv[1]
+    table[2] += flat[0] @ conv[2]
+    table = table.reshape(joined.shape)
+    table.flags.writeable = False
+    return table
+
+@lru_cache(maxsize=ROUND_CACHE_SIZE)
+def round_moments(counts):
+    """
+    单轮结果的矩 (不保留得分分布，用于期望值和策略求解)。
+    返回形状为 (3, 编码总数) 的数组，第 idx 列是保留计数编码为 idx 时的
+    (概率, 概率×本轮得分, 概率×本轮奖励骰)，编码见 kept_strides。
+    """
+    _, _, first = STAGES[0]
+    n_first = counts[first]
+    future = tuple(counts[i] for _, _, i in STAGES[1:])
+    capacity = max(n_first, TABLE_DICE - sum(future))
+    table = _future_table(0, future, capacity)
+    # 第一段的 n_first 颗骰子中 k 颗为 S: 取 (a, t) = (k, n_first-k) 并还原 a!t!
+    moments = np.stack([table[..., k, n_first - k] * (factorial(k) * factorial(n_first - k))
+                        for k in range(n_first + 1)], axis=1)
+    # 轴顺序为 d20, d12, ..., d4，C 顺序展开后恰好是 kept_strides 的编码
+    for axis, (_, _, i) in enumerate(STAGES):
+        shape = [1] * moments.ndim
+        shape[axis + 1] = counts[i] + 1
+        choose = np.array([comb(counts[i], k) / SIDES[i] ** counts[i] for k in range(counts[i] + 1)])
+        moments = moments * choose.reshape(shape)
+    moments = moments.reshape(3, -1)
+    moments.flags.writeable = False
+    return moments
+
+def removal_weights(counts, removal_strategy='random'):
+    """没有匹配时各种骰子被移除的概率: [(种类下标, 概率)]。"""
+    present = [i for i, c in enumerate(counts) if c]
+    if removal_strategy == 'largest':
+        return [(max(present, key=SIDES.__getitem__), 1.0)]
+    if removal_strategy == 'smallest':
+        return [(min(present, key=SIDES.__getitem__), 1.0)]
+    n = sum(counts)
+    return [(i, counts[i] / n) for i in present]
+
+@lru_cache(maxsize=None)
+def solve_counts(counts, removal_strategy='random'):
+    """
+    从计数元组出发的整个烹饪过程: (总分分布数组, 期望奖励骰)。
+    removal_strategy: 'random', 'largest' 或 'smallest'。
+    返回的数组被所有调用方共享，请勿修改。
+    """
+    n = sum(counts)
+    if n <= 1:
+        pmf = np.array([1.0])
+        pmf.flags.writeable = False
+        return pmf, 0.0
+    pmf = np.zeros(1)
+    expected_bonus = 0.0
+    for kept, (arr, b) in round_outcomes(counts).items():
+        p = arr.sum()
+        if kept == counts:
+            # 没有匹配: 按策略移除一颗骰子
+            for i, w in removal_weights(counts, removal_strategy):
+                weight = p * w
+                sub_pmf, sub_bonus = solve_counts(counts[:i] + (counts[i] - 1,) + counts[i + 1:], removal_strategy)
+                pmf = _add_into(pmf, weight * sub_pmf)
+                expected_bonus += weight * sub_bonus
+        else:
+            sub_pmf, sub_bonus = solve_counts(kept, removal_strategy)
+            pmf = _add_into(pmf, np.convolve(arr, sub_pmf))
+            expected_bonus += b + p * sub_bonus
+    pmf.flags.writeable = False
+    return pmf, expected_bonus
+
+def solve(dice_counts, removal_strategy='random'):
+    """
+    dice_counts 形如 {'d4': 8, 'd6': 0, ...}。
+    返回 SimpleNamespace(mean_score, mean_bonus, score_distribution={分数: 概率})。
+    """
+    pmf, expected_bonus = solve_counts(counts_from_dice(dice_counts), removal_strategy)
+    return SimpleNamespace(
+        mean_score=float(np.dot(np.arange(len(pmf)), pmf)),
+        mean_bonus=expected_bonus,
+        score_distribution={s: float(p) for s, p in enumerate(pmf) if p > 0},
+    )
+
+def cache_info():
+    return {
+        'round_outcomes': round_outcomes.cache_info(),
+        'round_moments': round_moments.cache_info(),
+        '_future_table': _future_table.cache_info(),
+        'solve_counts': solve_counts.cache_info(),
+    }
+
+def cache_clear():
+    """清空本模块的全部缓存 (例如基准测试中测量不命中缓存的求解)。"""
+    for func in (_binomial_pmf, _stage_kernel, _partitions, round_outcomes, _placement_kernel, _convolution_matrix,
+                 _future_table, round_moments, solve_counts):
+        func.cache_clear()
@@ -0,0 +1,203 @@
+"""
+beast_feast 移除策略的求解与全配置扫描。
+
+没有匹配时必须移除一颗骰子，移除哪一种会影响之后的得分。对每个骰子池状态
+(d4/d6/d8/d10/d12/d20 的个数) 用价值迭代求出:
+  - 'random' / 'largest' / 'smallest' 三种固定策略的期望总分与期望奖励骰；
+  - 'optimal': 每个状态都移除使期望总分最大的那种骰子。
+
+每轮之后骰子数严格减少，状态图无环，所以按骰子总数从少到多一遍即收敛。
+各状态的结果存入共享的价值表，所有骰子池都从同一张表取值；
+同一骰子总数的状态互不依赖，分给多个进程并行计算。整个扫描共用一个进程池，
+每层算完后写入临时目录，工作进程只读入自己还没有的层，不必每层重新传送整张表。
+
+用法:
+  python feast_strategy.py --max-dice 16 --output feast_strategies.csv
+"""
+import argparse
+import csv
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import product
+
+import numpy as np
+
+from beast_feast import DICE_TYPES
+from feast_solver import SIDES, STAGES, kept_strides, round_moments
+
+STRATEGIES = ('random', 'largest', 'smallest', 'optimal')
+RULES = STRATEGIES[:3]
+
+# 工作进程中的价值表: 状态 -> (各策略期望总分..., 各策略期望奖励骰..., 最优策略移除的种类下标)
+_values = {}
+# 工作进程已读入的层数 (骰子总数 0.._loaded_layers-1)
+_loaded_layers = 0
+
+def compositions(total, parts=len(DICE_TYPES)):
+    """骰子总数为 total 的所有计数元组。"""
+    if parts == 1:
+        yield (total,)
+        return
+    for first in range(total + 1):
+        for rest in compositions(total - first, parts - 1):
+            yield (first,) + rest
+
+def _without(counts, i):
+    return counts[:i] + (counts[i] - 1,) + counts[i + 1:]
+
+def _kept_states(counts):
+    """按 round_moments 的编码顺序列出所有保留计数 (轴顺序 d20..d4，C 顺序展开)。"""
+    order = [i for _, _, i in STAGES]
+    for stage_kept in product(*(range(counts[i] + 1) for i in order)):
+        kept = [0] * len(counts)
+        for i, k in zip(order, stage_kept):
+            kept[i] = k
+        yield tuple(kept)
+
+def solve_state(counts, values=None):
+    """
+    由价值表中骰子更少的状态求出 counts 的一行:
+    (random..optimal 的期望总分, random..optimal 的期望奖励骰, 最优策略移除的种类下标或 -1)。
+    """
+    values = _values if values is None else values
+    n = sum(counts)
+    size = len(STRATEGIES)
+    if n <= 1:
+        return (0.0,) * (2 * size) + (-1,)
+
+    p, s, b = round_moments(counts)
+    strides, _ = kept_strides(counts)
+    self_index = sum(c * stride for c, stride in zip(counts, strides))
+    p_no_match = p[self_index]
+
+    # 有匹配时接下来的状态: 所有骰子都保留 (没有匹配) 的那一列单独处理
+    table = np.array([values[kept] if kept != counts else (0.0,) * (2 * size) + (-1,)
+                      for kept in _kept_states(counts)])
+    continuation = p @ table[:, :2 * size]
+    continuation[:size] += s.sum()
+    continuation[size:] += b.sum()
+
+    present = [i for i, c in enumerate(counts) if c]
+    removed = {i: values[_without(counts, i)] for i in present}
+    largest = max(present, key=SIDES.__getitem__)
+    smallest = min(present, key=SIDES.__getitem__)
+    best = max(present, key=lambda i: (removed[i][3], removed[i][size + 3], SIDES[i]))
+
+    row = []
+    for offset in (0, size):
+        after_removal = (
+            sum(counts[i] / n * removed[i][offset] for i in present),
+            removed[largest][offset + 1],
+            removed[smallest][offset + 2],
+            removed[best][offset + 3],
+        )
+        row.extend(continuation[offset + j] + p_no_match * after_removal[j] for j in range(size))
+    return tuple(row) + (best,)
+
+def _layer_path(directory, total):
+    return os.path.join(directory, f"layer_{total:03d}.pickle")
+
+def _init_worker():
+    global _values, _loaded_layers
+    _values = {}
+    _loaded_layers = 0
+
+def _solve_chunk(directory, total, states):
+    """工作进程: 先读入骰子总数小于 total 的各层中还没有的部分，再求解 states。"""
+    global _loaded_layers
+    while _loaded_layers < total:
+        with open(_layer_path(directory, _loaded_layers), "rb") as f:
+            _values.update(pickle.load(f))
+        _loaded_layers += 1
+    return [(counts, solve_state(counts)) for counts in states]
+
+def _solve_chunk_star(args):
+    return _solve_chunk(*args)
+
+def _chunks(states, count):
+    step = max(1, -(-len(states) // count))
+    return [states[i:i + step] for i in range(0, len(states), step)]
+
+def sweep(max_dice=16, workers=None):
+    """
+    求出骰子总数不超过 max_dice 的所有配置的价值表 {计数元组: 行}，行的格式见 solve_state。
+    同一骰子总数的配置分给 workers 个进程并行计算。
+    """
+    workers = workers or os.cpu_count() or 1
+    values = {}
+    parallel = workers > 1
+    with tempfile.TemporaryDirectory() if parallel else nullcontext() as directory, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if parallel else nullcontext() as executor:
+        for total in range(max_dice + 1):
+            # 面数较小的骰子个数相同的配置相邻，round_moments 的共享表缓存命中率更高
+            states = sorted(compositions(total), key=lambda c: c[::-1])
+            if not parallel or total < 4:
+                rows = [(counts, solve_state(counts, values)) for counts in states]
+            else:
+                jobs = [(directory, total, chunk) for chunk in _chunks(states, workers * 4)]
+                rows = [row for chunk in executor.map(_solve_chunk_star, jobs) for row in chunk]
+            values.update(rows)
+            if parallel:
+                with open(_layer_path(directory, total), "wb") as f:
+                    pickle.dump(dict(rows), f, protocol=pickle.HIGHEST_PROTOCOL)
+    return values
+
+def best_rule(row, tolerance=1e-9):
+    """三种固定策略中期望总分最高的一种；并列时用 '/' 连接 (如单一骰子种类时三者相同)。"""
+    best = max(row[:len(RULES)])
+    return "/".join(name for j, name in enumerate(RULES) if row[j] >= best - tolerance)
+
+def optimal_policy(values):
+    """由价值表得到可传给 simulate_cooking_session 的最优移除策略函数。"""
+    def remove(dice_pool):
+        counts = tuple(dice_pool.count(side) for side in SIDES)
+        return SIDES[values[counts][-1]]
+    return remove
+
+def write_csv(values, path):
+    size = len(STRATEGIES)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(list(DICE_TYPES) + ['dice']
+                        + [f'{name}_score' for name in STRATEGIES] + [f'{name}_bonus' for name in STRATEGIES]
+                        + ['best_rule', 'optimal_drop'])
+        for counts, row in sorted(values.items(), key=lambda item: (sum(item[0]), item[0][::-1])):
+            drop = DICE_TYPES[row[-1]] if row[-1] >= 0 else ''
+            writer.writerow(list(counts) + [sum(counts)] + [f'{v:.6f}' for v in row[:2 * size]]
+                            + [best_rule(row), drop])
+
+def print_summary(values, max_dice, top=15):
+    states = [counts for counts in values if sum(counts) >= 2]
+    wins = {}
+    gaps = []
+    for counts in states:
+        row = values[counts]
+        rule = best_rule(row)
+        wins[rule] = wins.get(rule, 0) + 1
+        gaps.append((row[3] - max(row[:len(RULES)]), counts))
+    print(f"共 {len(states)} 种配置 (2..{max_dice} 颗骰子)")
+    print("固定策略中最好的: " + ", ".join(f"{name}={count}" for name, count in sorted(wins.items())))
+
+    print(f"\n最优策略领先最多的 {top} 种配置:")
+    print(f"{'配置':<40}" + "".join(f"{name:>10}" for name in STRATEGIES) + f"{'最优移除':>10}")
+    for gap, counts in sorted(gaps, reverse=True)[:top]:
+        row = values[counts]
+        label = " ".join(f"{c}{name}" for name, c in zip(DICE_TYPES, counts) if c)
+        print(f"{label:<40}" + "".join(f"{row[j]:>10.3f}" for j in range(len(STRATEGIES)))
+              + f"{DICE_TYPES[row[-1]]:>10}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="beast_feast 移除策略的全配置扫描")
+    parser.add_argument("--max-dice", type=int, default=16, help="扫描的最大骰子总数")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认为CPU核数")
+    parser.add_argument("--output", help="把每种配置的结果写入CSV文件")
+    args = parser.parse_args()
+
+    values = sweep(args.max_dice, args.workers)
+    print_summary(values, args.max_dice)
+    if args.output:
+        write_csv(values, args.output)
+        print(f"\n结果已写入 {args.output}")
@@ -0,0 +1,88 @@
+"""
+Simulator 回合循环的可选统计与计时。
+
+用法:
+    inst = Instrumentation("太刀 Pro3")
+    Simulator(action, attacker, defender, instrumentation=inst).run(...)
+    print(inst.report())
+
+只在标量引擎下生效。未启用时 Simulator 走原来的循环，没有任何额外开销；
+启用时临时把动作函数所在模块的 roll_dice 换成计数版本，run 结束后恢复。
+"""
+import time
+from collections import Counter, defaultdict
+
+class Instrumentation:
+    """收集一个扫描单元的动作耗时、掷骰次数、状态分布和HP损失分桶。"""
+    def __init__(self, label=""):
+        self.label = label
+        self.battles = 0
+        self.action_calls = 0
+        self.action_time_ns = 0
+        self.roll_dice_calls = 0
+        self.dice_rolled = 0
+        self.hp_loss_buckets = Counter()
+        self.state_values = defaultdict(Counter)  # 状态键 -> {值: 出现的回合数}
+
+    # --- 由 Simulator 调用 ---
+    def wrap_roll_dice(self, roll_dice):
+        """返回计数版本的 roll_dice。"""
+        def counted_roll_dice(num_dice, num_sides, modifier=0):
+            self.roll_dice_calls += 1
+            self.dice_rolled += num_dice
+            return roll_dice(num_dice, num_sides, modifier)
+        return counted_roll_dice
+
+    def patch(self, *module_globals):
+        """在给定的模块全局字典中替换 roll_dice，返回用于恢复的列表。"""
+        patched = []
+        for g in module_globals:
+            if 'roll_dice' in g and not any(g is p for p, _ in patched):
+                patched.append((g, g['roll_dice']))
+                g['roll_dice'] = self.wrap_roll_dice(g['roll_dice'])
+        return patched
+
+    @staticmethod
+    def unpatch(patched):
+        for g, original in patched:
+            g['roll_dice'] = original
+
+    def record_round(self, elapsed_ns, state, hp_loss):
+        self.action_calls += 1
+        self.action_time_ns += elapsed_ns
+        self.hp_loss_buckets[hp_loss] += 1
+        for key, value in state.items():
+            self.state_values[key][value] += 1
+
+    # --- 报告 ---
+    def report(self):
+        """紧凑的单元报告。"""
+        rounds = self.action_calls or 1
+        lines = [
+            f"[{self.label}] 战斗 {self.battles} 场, 动作调用 {self.action_calls} 次, "
+            f"平均 {self.action_time_ns / rounds / 1000:.2f} µs/次, "
+            f"roll_dice {self.roll_dice_calls} 次 ({self.roll_dice_calls / rounds:.2f}/回合), "
+            f"掷骰 {self.dice_rolled} 个",
+            "  HP损失分桶: " + ", ".join(
+                f"{hp}:{count / rounds:.1%}" for hp, count in sorted(self.hp_loss_buckets.items())),
+        ]
+        for key, values in sorted(self.state_values.items()):
+            top = sorted(values.items(), key=lambda kv: (-kv[1], str(kv[0])))[:6]
+            lines.append(f"  状态 {key}: " + ", ".join(f"{value}:{count / rounds:.1%}" for value, count in top))
+        return "\n".join(lines)
+
+    def as_dict(self):
+        return {
+            'label': self.label,
+            'battles': self.battles,
+            'action_calls': self.action_calls,
+            'action_time_ns': self.action_time_ns,
+            'roll_dice_calls': self.roll_dice_calls,
+            'dice_rolled': self.dice_rolled,
+            'hp_loss_buckets': dict(self.hp_loss_buckets),
+            'state_values': {key: {str(v): c for v, c in values.items()} for key, values in self.state_values.items()},
+        }
+
+    @staticmethod
+    def clock():
+        return time.perf_counter_ns()
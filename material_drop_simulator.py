@@ -1,7 +1,15 @@
-import random
+import argparse
+from types import SimpleNamespace
+
+from damage_distribution import convolve_pmf, pmf_quantile
+from dice_expr import compile_dice
+from dice_source import STDLIB_DICE, DiceSource
+from streaming_stats import StreamingStats
+
 # --- 配置 ---
 CONFIG = {
     "simulation_runs": 100000,
+    "seed": None,  # 设为整数可复现结果
     "team_size": 4,
     "dice_per_person": 4,
     "dice_sides": 10,
@@ -12,9 +20,17 @@ CONFIG = {
         "宝玉": {"roll": [9], "value": 8},
         "逆鳞": {"roll": [10], "value": 8}
     },
-    "rare_materials": ["宝玉", "逆鳞"]
+    "rare_materials": ["宝玉", "逆鳞"],
+    # 网格模式扫描的参数
+    "grid": {
+        "team_size": range(1, 7),
+        "dice_per_person": range(1, 7),
+        "dice_sides": [6, 8, 10, 12],
+    },
 }
 
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
 def get_material_for_roll(roll, materials_config):
     """根据出目获取对应的素材"""
     for name, data in materials_config.items():
@@ -27,55 +43,191 @@ def get_material_for_roll(roll, materials_config):
                 return name, data["value"]
     return None, 0
 
-def simulate_hunt(config):
-    """模拟一次狩猎"""
-    total_dice_count = config["team_size"] * config["dice_per_person"]
+def build_roll_table(config, dice_sides=None):
+    """
+    由 CONFIG 预先计算 出目 -> (素材名, 分值, 是否稀有) 的查找表，下标为出目 (0 未使用)。
+    没有对应素材的出目为 (None, 0, False)。
+    """
+    dice_sides = config["dice_sides"] if dice_sides is None else dice_sides
+    rare = set(config["rare_materials"])
+    table = [(None, 0, False)]
+    for roll in range(1, dice_sides + 1):
+        name, value = get_material_for_roll(roll, config["materials"])
+        table.append((name, value, name in rare))
+    return table
+
+def hunt_dice(config):
+    """一次狩猎全队掷的骰子 (dice_expr 骰子池表达式)。"""
+    return compile_dice(f"{config['team_size'] * config['dice_per_person']}d{config['dice_sides']}")
+
+def simulate_hunt(config, dice_source=STDLIB_DICE, roll_table=None, dice=None):
+    """
+    模拟一次狩猎。dice_source 为骰子来源，传入 DiceSource(seed) 可复现。
+    roll_table 为 build_roll_table 的结果，dice 为 hunt_dice 的结果，多次调用时传入可避免重复计算。
+    """
+    if roll_table is None:
+        roll_table = build_roll_table(config)
+    if dice is None:
+        dice = hunt_dice(config)
     total_value = 0
     value_without_rares = 0
     rare_counts = {name: 0 for name in config["rare_materials"]}
 
-    for _ in range(total_dice_count):
-        roll = random.randint(1, config["dice_sides"])
-        material_name, material_value = get_material_for_roll(roll, config["materials"])
-
-        if material_name:
-            total_value += material_value
-            if material_name in config["rare_materials"]:
-                rare_counts[material_name] += 1
-            else:
-                value_without_rares += material_value
+    for roll in dice.roll_each(dice_source):
+        material_name, material_value, is_rare = roll_table[roll]
+        total_value += material_value
+        if is_rare:
+            rare_counts[material_name] += 1
+        else:
+            value_without_rares += material_value
 
     return total_value, value_without_rares, rare_counts
 
-def main():
+# --- 精确分析: 每颗骰子的素材是独立的类别分布，整场狩猎的分值是它们的卷积 ---
+def die_distributions(roll_table):
+    """单颗骰子的 (分值分布, 除去稀有素材的分值分布, {稀有素材: 概率})。"""
+    face_pmf = compile_dice(f"d{len(roll_table) - 1}").pmf()
+    value_pmf = {}
+    value_without_rares_pmf = {}
+    rare_probabilities = {}
+    for roll, p in face_pmf.items():
+        name, value, is_rare = roll_table[roll]
+        value_pmf[value] = value_pmf.get(value, 0.0) + p
+        kept_value = 0 if is_rare else value
+        value_without_rares_pmf[kept_value] = value_without_rares_pmf.get(kept_value, 0.0) + p
+        if is_rare:
+            rare_probabilities[name] = rare_probabilities.get(name, 0.0) + p
+    return value_pmf, value_without_rares_pmf, rare_probabilities
+
+def _pmf_powers(pmf, max_count):
+    """生成 1..max_count 颗独立骰子之和的分布 (逐次卷积，一遍得到所有骰子数)。"""
+    total = {0: 1.0}
+    for _ in range(max_count):
+        total = convolve_pmf(total, pmf)
+        yield total
+
+def _pmf_power(pmf, count):
+    """count 颗独立骰子之和的分布。"""
+    total = {0: 1.0}
+    for _ in range(count):
+        total = convolve_pmf(total, pmf)
+    return total
+
+def _summarize(value_pmf, value_without_rares_pmf, rare_probabilities, dice_count, config):
+    return SimpleNamespace(
+        dice_count=dice_count,
+        mean_value=sum(v * p for v, p in value_pmf.items()),
+        mean_value_without_rares=sum(v * p for v, p in value_without_rares_pmf.items()),
+        value_distribution=value_pmf,
+        value_without_rares_distribution=value_without_rares_pmf,
+        mean_rare_counts={name: dice_count * rare_probabilities.get(name, 0.0) for name in config["rare_materials"]},
+    )
+
+def exact_analysis(config=CONFIG, roll_table=None):
+    """
+    不抽样，直接求出一次狩猎的精确结果。
+    返回 SimpleNamespace(dice_count, mean_value, mean_value_without_rares, value_distribution,
+                         value_without_rares_distribution, mean_rare_counts)。
+    """
+    if roll_table is None:
+        roll_table = build_roll_table(config)
+    dice_count = config["team_size"] * config["dice_per_person"]
+    value_pmf, value_without_rares_pmf, rare_probabilities = die_distributions(roll_table)
+    return _summarize(_pmf_power(value_pmf, dice_count), _pmf_power(value_without_rares_pmf, dice_count),
+                      rare_probabilities, dice_count, config)
+
+def grid_analysis(config=CONFIG):
+    """
+    按 config["grid"] 扫描 小队人数 × 每人骰子数 × 骰子面数 的精确结果。
+    同一面数只做一遍逐次卷积，所有 人数×每人骰子数 组合都从中取对应骰子数的分布。
+    返回 [(team_size, dice_per_person, dice_sides, exact_analysis 同格式的结果)]。
+    """
+    grid = config["grid"]
+    results = []
+    max_count = max(grid["team_size"]) * max(grid["dice_per_person"])
+    for dice_sides in grid["dice_sides"]:
+        value_pmf, value_without_rares_pmf, rare_probabilities = die_distributions(build_roll_table(config, dice_sides))
+        totals = list(zip(_pmf_powers(value_pmf, max_count), _pmf_powers(value_without_rares_pmf, max_count)))
+        for team_size in grid["team_size"]:
+            for dice_per_person in grid["dice_per_person"]:
+                dice_count = team_size * dice_per_person
+                total_value_pmf, total_without_rares_pmf = totals[dice_count - 1]
+                results.append((team_size, dice_per_person, dice_sides,
+                                _summarize(total_value_pmf, total_without_rares_pmf, rare_probabilities,
+                                           dice_count, config)))
+    return results
+
+def format_quantiles(pmf, quantiles=QUANTILES):
+    return ", ".join(f"p{int(q * 100)}={pmf_quantile(pmf, q)}" for q in quantiles)
+
+def main(config=CONFIG, dice_source=None):
     """主函数，运行模拟并打印结果"""
-    config = CONFIG
+    if dice_source is None:
+        dice_source = DiceSource(config.get("seed"))
 
-    total_value_sum = 0
-    total_value_without_rares_sum = 0
+    value_stats = StreamingStats()
+    value_without_rares_stats = StreamingStats()
     total_rare_counts = {name: 0 for name in config["rare_materials"]}
     
     runs = config["simulation_runs"]
+    roll_table = build_roll_table(config)
+    dice = hunt_dice(config)
 
     for _ in range(runs):
-        hunt_value, hunt_value_without_rares, hunt_rare_counts = simulate_hunt(config)
-        total_value_sum += hunt_value
-        total_value_without_rares_sum += hunt_value_without_rares
+        hunt_value, hunt_value_without_rares, hunt_rare_counts = simulate_hunt(config, dice_source, roll_table, dice)
+        value_stats.add(hunt_value)
+        value_without_rares_stats.add(hunt_value_without_rares)
         for name, count in hunt_rare_counts.items():
             total_rare_counts[name] += count
 
     # --- 计算并打印平均值 ---
-    avg_total_value = total_value_sum / runs
-    avg_value_without_rares = total_value_without_rares_sum / runs
+    avg_total_value = value_stats.mean
+    avg_value_without_rares = value_without_rares_stats.mean
     avg_rare_counts = {name: count / runs for name, count in total_rare_counts.items()}
 
     print(f"--- 模拟了 {runs} 次狩猎 ---")
     print(f"配置: {config['team_size']}人小队, 每人{config['dice_per_person']}个d{config['dice_sides']}")
     print(f"\n平均总分值: {avg_total_value:.4f}")
     print(f"除去宝玉和逆鳞的平均总分值: {avg_value_without_rares:.4f}")
+    print(f"\n总分值分布: {value_stats.format_summary(4)}")
+    print(f"除去稀有素材的分值分布: {value_without_rares_stats.format_summary(4)}")
     print("\n平均获得的稀有素材:")
     for name, avg_count in avg_rare_counts.items():
         print(f"  - {name}: {avg_count:.4f} 个")
 
+def main_exact(config=CONFIG):
+    """打印精确分析结果"""
+    result = exact_analysis(config)
+    print("--- 精确分析 ---")
+    print(f"配置: {config['team_size']}人小队, 每人{config['dice_per_person']}个d{config['dice_sides']}")
+    print(f"\n平均总分值: {result.mean_value:.4f}")
+    print(f"除去宝玉和逆鳞的平均总分值: {result.mean_value_without_rares:.4f}")
+    print(f"\n总分值分位数: {format_quantiles(result.value_distribution)}")
+    print(f"除去稀有素材的分值分位数: {format_quantiles(result.value_without_rares_distribution)}")
+    print("\n平均获得的稀有素材:")
+    for name, avg_count in result.mean_rare_counts.items():
+        print(f"  - {name}: {avg_count:.4f} 个")
+
+def main_grid(config=CONFIG):
+    """打印网格扫描结果"""
+    rare_names = config["rare_materials"]
+    header = f"{'人数':>4} {'每人':>4} {'面数':>4} {'平均总分值':>10} {'除去稀有':>8} " + \
+             " ".join(f"{name:>6}" for name in rare_names) + "  总分值分位数"
+    print(header)
+    for team_size, dice_per_person, dice_sides, result in grid_analysis(config):
+        rare = " ".join(f"{result.mean_rare_counts[name]:>6.3f}" for name in rare_names)
+        print(f"{team_size:>4} {dice_per_person:>4} {dice_sides:>4} {result.mean_value:>10.3f} "
+              f"{result.mean_value_without_rares:>8.3f} {rare}  {format_quantiles(result.value_distribution)}")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="素材掉落模拟")
+    parser.add_argument("--mode", choices=("sample", "exact", "grid"), default="sample",
+                        help="sample: 蒙特卡洛抽样; exact: 精确分析; grid: 按 CONFIG['grid'] 扫描精确结果")
+    args = parser.parse_args()
+
+    if args.mode == "exact":
+        main_exact()
+    elif args.mode == "grid":
+        main_grid()
+    else:
+        main()
@@ -1,11 +1,25 @@
-import random
+import argparse
+import inspect
+from contextlib import contextmanager
+from functools import lru_cache
 from types import SimpleNamespace
-import pandas as pd
-from tabulate import tabulate
+
+from alias_table import damage_alias_table
+from dice_expr import compile_dice
+from dice_source import STDLIB_DICE, DiceSource
+from instrumentation import Instrumentation
+from streaming_stats import StreamingStats
+
+# 当前骰子来源，Simulator(dice_source=...) 在运行期间替换，见 dice_source
+_dice_source = STDLIB_DICE
 
 def roll_dice(num_dice, num_sides, modifier=0):
     """模拟掷骰子并返回总和。"""
-    return sum(random.randint(1, num_sides) for _ in range(num_dice)) + modifier
+    return _dice_source.sum(num_dice, num_sides) + modifier
+
+def random_unit():
+    """[0, 1) 均匀随机数，与 roll_dice 使用同一骰子来源。"""
+    return _dice_source.random()
 
 # --- Helper Functions ---
 def convert_damage_to_hp_loss(damage, defender_stats, pro_level):
@@ -22,78 +36,189 @@ def convert_damage_to_hp_loss(damage, defender_stats, pro_level):
     else:
         return 3
 
+# --- 动作状态与登记表 ---
+# 每个动作登记一个 __slots__ 状态类。Simulator 每次 run 只创建一个状态对象，每场战斗开始前原地 reset，
+# 动作函数把热路径上的字段读进局部变量，回合结束时写回。
+
+class ActionState:
+    """
+    动作状态基类。FIELDS 为 {字段名: 初始值}，子类以 __slots__ = tuple(FIELDS) 声明字段。
+    KEY_FIELD 为轨迹记录中的关键状态字段 (见 trace_recorder)。
+    """
+    __slots__ = ()
+    FIELDS = {}
+    KEY_FIELD = None
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """恢复所有字段的初始值 (每场战斗开始前调用)。"""
+        for name, value in self.FIELDS.items():
+            setattr(self, name, value)
+
+    def items(self):
+        """(字段名, 当前值)，供 instrumentation 统计状态分布。"""
+        return [(name, getattr(self, name)) for name in self.FIELDS]
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{k}={v!r}' for k, v in self.items())})"
+
+class TokenState(ActionState):
+    """太刀/盾斧/虫棍: Token数。"""
+    FIELDS = {'tokens': 0}
+    KEY_FIELD = 'tokens'
+    __slots__ = tuple(FIELDS)
+
+class FormState(ActionState):
+    """斩斧: 形态是否激活、剩余攻击次数、累计命中次数。"""
+    FIELDS = {'form_active': False, 'form_attacks_remaining': 0, 'successful_attacks_total': 0}
+    KEY_FIELD = 'form_attacks_remaining'
+    __slots__ = tuple(FIELDS)
+
+class StakeState(ActionState):
+    """铳枪: 龙杭是否插入、倒计时、累积伤害。"""
+    FIELDS = {'stake_active': False, 'countdown': 0, 'damage_accumulated': 0}
+    KEY_FIELD = 'countdown'
+    __slots__ = tuple(FIELDS)
+
+class VulnerableState(ActionState):
+    """大锤: 脆弱是否激活、剩余回合。"""
+    FIELDS = {'vulnerable_active': False, 'vulnerable_duration': 0}
+    KEY_FIELD = 'vulnerable_duration'
+    __slots__ = tuple(FIELDS)
+
+class DictState(dict):
+    """未登记动作的状态: 普通字典，reset 即清空。"""
+    __slots__ = ()
+    KEY_FIELD = None
+    reset = dict.clear
+
+# 动作函数名 -> SimpleNamespace(function, state_class)，与 batch_engine.BATCH_ACTIONS、exact_solver.EXACT_MODELS 同键
+ACTIONS = {}
+
+def register_action(state_class=ActionState):
+    """登记动作函数及其状态类的装饰器。无状态动作使用空的 ActionState。"""
+    def decorator(action_function):
+        ACTIONS[action_function.__name__] = SimpleNamespace(function=action_function, state_class=state_class)
+        return action_function
+    return decorator
+
+def get_action(name):
+    """按名称取登记的动作函数。"""
+    try:
+        return ACTIONS[name].function
+    except KeyError:
+        raise ValueError(f"未知的动作: {name!r}，可选: {sorted(ACTIONS)}") from None
+
+def state_key_field(action_function):
+    """动作状态的关键字段名 (轨迹记录用)，无状态或未登记的动作为 None。"""
+    entry = ACTIONS.get(action_function.__name__)
+    return entry.state_class.KEY_FIELD if entry is not None else None
+
+def new_action_state(action_function):
+    """为动作创建一个状态对象；未登记的动作使用 DictState。"""
+    entry = ACTIONS.get(action_function.__name__)
+    return entry.state_class() if entry is not None else DictState()
+
+def round_action(action_function):
+    """
+    回合循环调用的动作: 登记的动作签名为 (state, attacker, defender, pro_level, current_round, last_round)；
+    未登记的旧式动作若只接受前5个参数，包装为忽略 last_round 的版本。
+    """
+    if action_function.__name__ in ACTIONS:
+        return action_function
+    try:
+        inspect.signature(action_function).bind(None, None, None, None, None, None)
+    except TypeError:
+        def legacy_action(state, attacker, defender, pro_level, current_round=0, last_round=None):
+            return action_function(state, attacker, defender, pro_level, current_round)
+        return legacy_action
+    except ValueError:  # 取不到签名的可调用对象，按新签名调用
+        pass
+    return action_function
+
 # --- Action Functions: 每个函数代表一种武器或攻击模式的完整回合逻辑 ---
 
-def simple_attack_action(state, attacker, defender, pro_level, current_round=0):
+@register_action()
+def simple_attack_action(state, attacker, defender, pro_level, current_round=0, last_round=None):
     """动作: 基础单体攻击，无任何特性。"""
     attack_roll = roll_dice(2, 12, attacker.attack_modifier)
     if attack_roll >= defender.defense:
         return attacker.base_damage_roll(), 1
     return 0, 0
 
-def long_sword_token_action(state, attacker, defender, pro_level, current_round=0):
+@register_action(TokenState)
+def long_sword_token_action(state, attacker, defender, pro_level, current_round=0, last_round=None):
     """动作: 太刀 - 见切。通过Token系统获得伤害加成。"""
-    tokens = state.get('tokens', 0)
+    tokens = state.tokens
     attack_roll = roll_dice(2, 12, attacker.attack_modifier)
     
     if attack_roll >= defender.defense:
         # 命中: 获得一个Token，上限为3
-        tokens = min(tokens + 1, 3)
-        state['tokens'] = tokens
+        if tokens < 3:
+            tokens += 1
+        state.tokens = tokens
         bonus_damage = tokens * 5
         damage = attacker.base_damage_roll() + bonus_damage
         return damage, 1
     else:
         # 未命中: 失去一个Token，下限为0
-        tokens = max(tokens - 1, 0)
-        state['tokens'] = tokens
+        if tokens > 0:
+            state.tokens = tokens - 1
         return 0, 0
 
-def form_switching_action(state, attacker, defender, pro_level, current_round=0):
+@register_action(FormState)
+def form_switching_action(state, attacker, defender, pro_level, current_round=0, last_round=None):
     """动作: 成功攻击N次后切换形态，在形态内获得命中和伤害加成。"""
     # 检查并更新激活的形态
-    if state.get('form_active', False):
-        state['form_attacks_remaining'] -= 1
-        if state['form_attacks_remaining'] <= 0:
-            state['form_active'] = False
-            state.pop('form_attacks_remaining', None)
+    form_active = state.form_active
+    if form_active:
+        remaining = state.form_attacks_remaining - 1
+        if remaining <= 0:
+            form_active = state.form_active = False
+            remaining = 0
+        state.form_attacks_remaining = remaining
 
     # 计算动态攻击调整值
     current_attack_modifier = attacker.attack_modifier
-    if state.get('form_active', False):
+    if form_active:
         current_attack_modifier += attacker.form_attack_bonus
 
     # 执行攻击
     attack_roll = roll_dice(2, 12, current_attack_modifier)
     if attack_roll >= defender.defense:
-        bonus_damage = attacker.form_damage_bonus if state.get('form_active', False) else 0
-        damage = attacker.base_damage_roll() + bonus_damage
+        damage = attacker.base_damage_roll()
+        if form_active:
+            return damage + attacker.form_damage_bonus, 1
         
         # 如果形态未激活，则累积命中次数以触发
-        if not state.get('form_active', False):
-            state['successful_attacks_total'] = state.get('successful_attacks_total', 0) + 1
-            if state['successful_attacks_total'] >= attacker.form_switch_threshold:
-                state['form_active'] = True
-                state['form_attacks_remaining'] = attacker.form_duration
-                state['successful_attacks_total'] = 0
+        successful_attacks_total = state.successful_attacks_total + 1
+        if successful_attacks_total >= attacker.form_switch_threshold:
+            state.form_active = True
+            state.form_attacks_remaining = attacker.form_duration
+            successful_attacks_total = 0
+        state.successful_attacks_total = successful_attacks_total
         return damage, 1
     else:
         return 0, 0
 
-def charge_blade_action(state, attacker, defender, pro_level, current_round=0):
+@register_action(TokenState)
+def charge_blade_action(state, attacker, defender, pro_level, current_round=0, last_round=None):
     """动作: 盾斧。积攒Token，然后通过“超解”释放巨大伤害。"""
-    tokens = state.get('tokens', 0)
+    tokens = state.tokens
 
-    # 如果Token达到阈值，或在第10回合且有Token，则执行“超解”
-    if (tokens >= attacker.discharge_threshold) or (current_round == 10 and tokens > 0):
-        state['tokens'] = 0 # 消耗所有Token
+    # 如果Token达到阈值，或在最后一回合且有Token，则执行“超解”
+    if (tokens >= attacker.discharge_threshold) or (current_round == last_round and tokens > 0):
+        state.tokens = 0 # 消耗所有Token
         attack_roll = roll_dice(2, 12, attacker.attack_modifier)
         if attack_roll >= defender.defense:
             # 超解命中
             bonus_damage = ((2*tokens) ** 2)
             single_target_damage = attacker.base_damage_roll()
-            total_damage = (single_target_damage + bonus_damage) * attacker.num_aoe_targets
-            return total_damage, attacker.num_aoe_targets
+            num_aoe_targets = attacker.num_aoe_targets
+            total_damage = (single_target_damage + bonus_damage) * num_aoe_targets
+            return total_damage, num_aoe_targets
         else:
             # 超解未命中
             return 0, 0
@@ -102,35 +227,40 @@ def charge_blade_action(state, attacker, defender, pro_level, current_round=0):
     attack_roll = roll_dice(2, 12, attacker.attack_modifier)
     if attack_roll >= defender.defense:
         # 命中，获得Token
-        state['tokens'] = tokens + 1
+        state.tokens = tokens + 1
         return attacker.base_damage_roll(), 1
     else:
         # 未命中
         return 0, 0
 
-def multi_attack_action(state, attacker, defender, pro_level, current_round=0):
+@register_action()
+def multi_attack_action(state, attacker, defender, pro_level, current_round=0, last_round=None):
     """动作: 每回合进行多次独立的攻击。"""
     total_damage_this_turn = 0
     total_hits_this_turn = 0
+    attack_modifier = attacker.attack_modifier
+    defense = defender.defense
+    base_damage_roll = attacker.base_damage_roll
     # 在一回合内循环执行多次攻击
     for _ in range(attacker.num_attacks):
-        attack_roll = roll_dice(2, 12, attacker.attack_modifier)
-        if attack_roll >= defender.defense:
+        attack_roll = roll_dice(2, 12, attack_modifier)
+        if attack_roll >= defense:
             total_hits_this_turn += 1
-            total_damage_this_turn += attacker.base_damage_roll()
+            total_damage_this_turn += base_damage_roll()
     return total_damage_this_turn, total_hits_this_turn
 
-def wyvernstake_action(state, attacker, defender, pro_level, current_round=0):
+@register_action(StakeState)
+def wyvernstake_action(state, attacker, defender, pro_level, current_round=0, last_round=None):
     """动作: 起爆龙杭。插入动作是一次攻击，成功后开始倒计时。"""
     
     # 如果龙杭未激活，则本回合的动作是“尝试插入”
-    if not state.get('stake_active', False):
+    if not state.stake_active:
         attack_roll = roll_dice(2, 12, attacker.attack_modifier)
         if attack_roll >= defender.defense:
             # 插入成功: 造成伤害并激活状态
-            state['stake_active'] = True
-            state['countdown'] = 3
-            state['damage_accumulated'] = 0
+            state.stake_active = True
+            state.countdown = 3
+            state.damage_accumulated = 0
             return attacker.base_damage_roll(), 1
         else:
             # 插入失败
@@ -138,6 +268,7 @@ def wyvernstake_action(state, attacker, defender, pro_level, current_round=0):
 
     # --- 如果龙杭已激活，则执行常规攻击并更新状态 ---
     damage_this_turn, hits_this_turn = 0, 0
+    damage_accumulated = state.damage_accumulated
     
     # 1. 执行本回合的常规攻击
     attack_roll = roll_dice(2, 12, attacker.attack_modifier)
@@ -146,30 +277,32 @@ def wyvernstake_action(state, attacker, defender, pro_level, current_round=0):
         damage = attacker.base_damage_roll()
         damage_this_turn += damage
         # 累积伤害用于最终引爆
-        state['damage_accumulated'] += damage
+        damage_accumulated += damage
     
     # 2. 更新倒计时
-    state['countdown'] -= 1
+    countdown = state.countdown - 1
 
     # 3. 检查是否在本回合结束后引爆
-    if state['countdown'] <= 0:
-        explosion_damage = (state.get('damage_accumulated', 0))
-        damage_this_turn += explosion_damage
+    if countdown <= 0:
+        damage_this_turn += damage_accumulated
         # 重置状态，以便下回合可以重新插入
-        state['stake_active'] = False
-        state.pop('damage_accumulated', None)
-        state.pop('countdown', None)
+        state.stake_active = False
+        damage_accumulated = 0
+        countdown = 0
+    state.countdown = countdown
+    state.damage_accumulated = damage_accumulated
     
     return damage_this_turn, hits_this_turn
 
-def insect_glaive_action(state, attacker, defender, pro_level, current_round=0):
+@register_action(TokenState)
+def insect_glaive_action(state, attacker, defender, pro_level, current_round=0, last_round=None):
     """动作: 虫棍。敌人掉x点血就获得x个token，花费1个token使命中+1d6. 策略是有token就用。"""
-    tokens = state.get('tokens', 0)
+    tokens = state.tokens
     
     # 策略：有token就用
     hit_roll_modifier = attacker.attack_modifier
     if tokens > 0:
-        state['tokens'] = tokens - 1
+        tokens -= 1
         hit_roll_modifier += roll_dice(1, 6)
 
     # 执行攻击
@@ -181,36 +314,41 @@ def insect_glaive_action(state, attacker, defender, pro_level, current_round=0):
         hp_loss = convert_damage_to_hp_loss(damage, defender, pro_level)
         
         # 获得token
-        state['tokens'] = state.get('tokens', 0) + hp_loss
+        state.tokens = tokens + hp_loss
         
         return damage, 1
     else:
         # --- 未命中 ---
         # 未命中不获得token
+        state.tokens = tokens
         return 0, 0
 
-def simple_aoe_action(state, attacker, defender, pro_level, current_round=0):
+@register_action()
+def simple_aoe_action(state, attacker, defender, pro_level, current_round=0, last_round=None):
     """动作: 简单的AoE攻击，一次判定，伤害应用到所有目标。"""
     attack_roll = roll_dice(2, 12, attacker.attack_modifier)
     if attack_roll >= defender.defense:
-        damage = attacker.base_damage_roll() * attacker.num_aoe_targets
         hits = attacker.num_aoe_targets
+        damage = attacker.base_damage_roll() * hits
         return damage, hits
     return 0, 0
 
-def great_hammer_action(state, attacker, defender, pro_level, current_round=0):
+@register_action(VulnerableState)
+def great_hammer_action(state, attacker, defender, pro_level, current_round=0, last_round=None):
     """动作: 大锤。敌人掉2点及以上血时，怪物脆弱2回合。命中+1d6。"""
     
     # 检查并更新脆弱状态
-    if state.get('vulnerable_active', False):
-        state['vulnerable_duration'] -= 1
-        if state['vulnerable_duration'] <= 0:
-            state['vulnerable_active'] = False
-            state.pop('vulnerable_duration', None)
+    vulnerable_active = state.vulnerable_active
+    if vulnerable_active:
+        duration = state.vulnerable_duration - 1
+        if duration <= 0:
+            vulnerable_active = state.vulnerable_active = False
+            duration = 0
+        state.vulnerable_duration = duration
 
     # 计算本次攻击的命中加成
     hit_roll_modifier = attacker.attack_modifier
-    if state.get('vulnerable_active', False):
+    if vulnerable_active:
         hit_roll_modifier += roll_dice(1, 6)
 
     # 执行攻击
@@ -218,53 +356,59 @@ def great_hammer_action(state, attacker, defender, pro_level, current_round=0):
     
     if attack_roll >= defender.defense:
         damage = attacker.base_damage_roll()
-        hp_loss = convert_damage_to_hp_loss(damage, defender, pro_level)
         
         # 如果HP损失>=2，触发脆弱
-        if hp_loss >= 2 and not state.get('vulnerable_active', False):
-            state['vulnerable_active'] = True
-            state['vulnerable_duration'] = 2 # 从下回合开始，持续2回合
+        if not vulnerable_active and convert_damage_to_hp_loss(damage, defender, pro_level) >= 2:
+            state.vulnerable_active = True
+            state.vulnerable_duration = 2 # 从下回合开始，持续2回合
             
         return damage, 1
     
     return 0, 0
 
-def lance_action(state, attacker, defender, pro_level, current_round=0):
+@register_action()
+def lance_action(state, attacker, defender, pro_level, current_round=0, last_round=None):
     """动作: 长枪。有40%的概率进行一次追击。"""
     total_damage_this_turn = 0
     total_hits_this_turn = 0
+    attack_modifier = attacker.attack_modifier
+    defense = defender.defense
 
     # 第一次攻击
-    attack_roll_1 = roll_dice(2, 12, attacker.attack_modifier)
-    if attack_roll_1 > defender.defense:
+    attack_roll_1 = roll_dice(2, 12, attack_modifier)
+    if attack_roll_1 > defense:
         total_hits_this_turn += 1
         total_damage_this_turn += attacker.base_damage_roll()
 
     # 40%概率追击
-    if random.random() < 0.5:
-        attack_roll_2 = roll_dice(2, 12, attacker.attack_modifier)
-        if attack_roll_2 > defender.defense:
+    if random_unit() < 0.5:
+        attack_roll_2 = roll_dice(2, 12, attack_modifier)
+        if attack_roll_2 > defense:
             total_hits_this_turn += 1
             total_damage_this_turn += attacker.base_damage_roll()
             
     return total_damage_this_turn, total_hits_this_turn
 
-def light_bowgun_action(state, attacker, defender, pro_level, current_round=0):
+@register_action()
+def light_bowgun_action(state, attacker, defender, pro_level, current_round=0, last_round=None):
     """动作: 轻弩。攻击失败时可以重骰一次。"""
+    attack_modifier = attacker.attack_modifier
+    defense = defender.defense
     # 第一次攻击检定
-    attack_roll = roll_dice(2, 12, attacker.attack_modifier)
+    attack_roll = roll_dice(2, 12, attack_modifier)
     
     # 如果第一次失败，则重骰
-    if attack_roll <= defender.defense:
-        attack_roll = roll_dice(2, 12, attacker.attack_modifier)
+    if attack_roll <= defense:
+        attack_roll = roll_dice(2, 12, attack_modifier)
 
     # 以最终结果判断命中
-    if attack_roll >= defender.defense:
+    if attack_roll >= defense:
         return attacker.base_damage_roll(), 1
     
     return 0, 0
 
-def heavy_bowgun_action(state, attacker, defender, pro_level, current_round=0):
+@register_action()
+def heavy_bowgun_action(state, attacker, defender, pro_level, current_round=0, last_round=None):
     """动作: 重弩。根据固定的buff层数获得攻击和伤害加成。"""
     # Buff层数由attacker对象提供，是固定的
     buff_stacks = attacker.buff_stacks
@@ -282,32 +426,214 @@ def heavy_bowgun_action(state, attacker, defender, pro_level, current_round=0):
     else:
         return 0, 0
 
+# --- 攻击者构建 ---
+# 伤害表达式模板 (见 dice_expr)，{pro}/{dice}/{bonus} 由Pro等级、武器骰面数和该等级的加值填入
+DEFAULT_DAMAGE = "{pro}d{dice}+{bonus}"
+
+def damage_expression(pro_level, config):
+    """武器在该Pro等级下的伤害表达式文本。"""
+    template = config.get("damage", DEFAULT_DAMAGE)
+    return template.format(pro=pro_level, dice=config['dice'], bonus=config['bonus'][pro_level - 1])
+
+def make_damage_spec(pro_level, config):
+    """根据武器配置和Pro等级生成伤害规格 (编译后的 DiceExpr，按表达式缓存)。"""
+    return compile_dice(damage_expression(pro_level, config))
+
+def create_damage_roll(spec, alias=True):
+    """
+    根据伤害规格构建base_damage_roll函数，与命中骰使用同一骰子来源。
+    alias=True 时从缓存的别名表 (alias_table) 抽样，每次只需一个均匀随机数；
+    否则按表达式逐颗掷骰 (经由 roll_dice)。
+    """
+    if not alias:
+        roll = spec.compiled
+        def roll_func():
+            return roll(roll_dice)
+        return roll_func
+
+    table = damage_alias_table(spec)
+    size, values, alias_values, threshold = table.size, table.values, table.alias_values, table.threshold
+    def alias_roll_func():
+        u = random_unit() * size
+        i = int(u)
+        return values[i] if u - i < threshold[i] else alias_values[i]
+    return alias_roll_func
+
+class AttackerSpec:
+    """
+    冻结的攻击者属性。字段由 attacker_spec_class 按武器参数确定并声明为 __slots__，
+    构建后不可修改，需要改动时用 replace 生成新对象。
+    """
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        missing = set(self.__slots__) - set(fields)
+        unknown = set(fields) - set(self.__slots__)
+        if missing or unknown:
+            raise ValueError(f"攻击者属性不匹配: 缺少 {sorted(missing)}，多余 {sorted(unknown)}")
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"攻击者属性是只读的，不能设置 {name!r} (请使用 replace)")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"攻击者属性是只读的，不能删除 {name!r}")
+
+    def _asdict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def replace(self, **changes):
+        """返回修改了部分字段的新对象；字段集合变化时换用对应的类。"""
+        fields = {**self._asdict(), **changes}
+        return attacker_spec_class(tuple(fields))(**fields)
+
+    def __repr__(self):
+        return f"AttackerSpec({', '.join(f'{k}={v!r}' for k, v in self._asdict().items())})"
+
+@lru_cache(maxsize=None)
+def attacker_spec_class(fields):
+    """字段元组对应的 AttackerSpec 子类，按字段缓存，参数相同的武器共用。"""
+    return type('AttackerSpec', (AttackerSpec,), {'__slots__': fields})
+
+def build_attacker_stats(pro_level, config, attack_modifier=0, alias=True):
+    """根据武器配置构建攻击者属性 (AttackerSpec)。damage_spec 供向量化/精确引擎使用，alias 见 create_damage_roll。"""
+    params = config.get("params", {})
+    spec = make_damage_spec(pro_level, config)
+    fields = dict(
+        attack_modifier=attack_modifier + params.get("attack_modifier_bonus", 0),
+        base_damage_roll=create_damage_roll(spec, alias),
+        damage_spec=spec,
+        **params
+    )
+    return attacker_spec_class(tuple(fields))(**fields)
+
 # --- 模拟器核心 ---
 class Simulator:
-    def __init__(self, action_function, attacker_stats, defender_stats):
+    """
+    模拟器。mode 选择引擎:
+      'scalar'     - 逐场逐回合的纯Python实现 (默认)
+      'vectorized' - 所有战斗同时以NumPy数组推进，见 batch_engine
+      'exact'      - 马尔可夫链精确求解，不抽样，见 exact_solver (忽略 num_simulations)
+    标量引擎每次 run 只创建一个动作状态 (状态类见 ACTIONS 登记表)，每场战斗前原地重置。
+    analytic_stateless=True 时，无状态动作 (simple_attack_action 等) 在任何模式下都跳过抽样，
+    直接使用闭式期望。
+    抽样模式下，每次 run 后 self.hp_loss_stats 保存每场HP损失的流式统计 (StreamingStats)，
+    不抽样的路径为 None。
+    instrumentation 为 instrumentation.Instrumentation 时 (仅标量引擎的 run)，记录动作耗时、
+    roll_dice 调用、状态分布与HP损失分桶；此时即使 analytic_stateless=True 也逐场模拟，
+    伤害也改为经由 roll_dice 逐颗掷骰 (别名表抽样不经过 roll_dice，无法计数)。
+    dice_source 为骰子来源 (见 dice_source)；标量模式下未给出但给了 seed 时，使用 DiceSource(seed)，
+    未给出 seed 时使用标准库 random。向量化模式下 DiceSource 的 Generator 会被直接使用。
+    variance_reduction 为 ('antithetic', 'control') 的子集时 (仅向量化引擎) 使用方差缩减估计，
+    每次 run 后 self.variance_report 保存标准误与方差缩减倍数，见 variance_reduction。
+    trace 为 trace_recorder.TraceWriter 时 (标量/向量化引擎)，run 把逐场逐回合的记录分块写入轨迹文件，
+    战斗数与回合数须与 TraceWriter 一致；此时不走闭式期望路径。
+    """
+    MODES = ('scalar', 'vectorized', 'exact')
+
+    def __init__(self, action_function, attacker_stats, defender_stats, mode='scalar', seed=None,
+                 analytic_stateless=False, instrumentation=None, dice_source=None, variance_reduction=(), trace=None):
+        if mode not in self.MODES:
+            raise ValueError(f"未知的模拟模式: {mode!r}，可选: {self.MODES}")
+        if instrumentation is not None and mode != 'scalar':
+            raise ValueError("instrumentation 只支持 'scalar' 模式")
+        if variance_reduction and mode != 'vectorized':
+            raise ValueError("variance_reduction 只支持 'vectorized' 模式")
+        if trace is not None and (mode == 'exact' or variance_reduction or instrumentation is not None):
+            raise ValueError("trace 只支持不带 instrumentation/variance_reduction 的 'scalar' 或 'vectorized' 模式")
         self.action_function = action_function
+        self._round_action = round_action(action_function)
         self.attacker_stats = attacker_stats
         self.defender_stats = defender_stats
+        self.mode = mode
+        self.seed = seed
+        self.analytic_stateless = analytic_stateless
+        self.hp_loss_stats = None
+        self.instrumentation = instrumentation
+        self.variance_reduction = tuple(variance_reduction)
+        self.variance_report = None
+        self.trace = trace
+        if dice_source is None and seed is not None and mode == 'scalar':
+            dice_source = DiceSource(seed)
+        self.dice_source = dice_source
 
     def _convert_damage_to_hp_loss(self, damage, pro_level):
         """根据伤害阈值将伤害转换为HP损失。"""
         return convert_damage_to_hp_loss(damage, self.defender_stats, pro_level)
 
     def run(self, num_simulations=10000, num_rounds=10, pro_level=1):
+        self.hp_loss_stats = None
+        self.variance_report = None
+        if self.trace is not None:
+            if (self.trace.num_battles, self.trace.num_rounds) != (num_simulations, num_rounds):
+                self.trace.abort()
+                raise ValueError(f"轨迹预定 {self.trace.num_battles} 场 × {self.trace.num_rounds} 回合，"
+                                 f"与本次 {num_simulations} 场 × {num_rounds} 回合不一致")
+            return self._run_traced(num_simulations, num_rounds, pro_level)
+        if self._use_analytic():
+            from exact_solver import stateless_expectation
+            hits_per_round, hp_loss_per_round = stateless_expectation(
+                self.action_function, self.attacker_stats, self.defender_stats, pro_level)
+            return hits_per_round * num_rounds, hp_loss_per_round * num_rounds
+
+        if self.mode == 'vectorized' and self.variance_reduction:
+            from variance_reduction import run_reduced
+            self.hp_loss_stats = StreamingStats()
+            self.variance_report = run_reduced(self.action_function, self.attacker_stats, self.defender_stats,
+                                               num_simulations, num_rounds, pro_level, seed=self._vectorized_seed(),
+                                               methods=self.variance_reduction, hp_loss_stats=self.hp_loss_stats)
+            return self.variance_report.avg_hits, self.variance_report.avg_hp_loss
+        if self.mode == 'vectorized':
+            from batch_engine import run_batch
+            self.hp_loss_stats = StreamingStats()
+            return run_batch(self.action_function, self.attacker_stats, self.defender_stats,
+                             num_simulations, num_rounds, pro_level, seed=self._vectorized_seed(),
+                             hp_loss_stats=self.hp_loss_stats)
+        if self.mode == 'exact':
+            from exact_solver import ExactSolver
+            return ExactSolver(self.action_function, self.attacker_stats, self.defender_stats).run(
+                num_simulations, num_rounds, pro_level)
+
+        with self._bind_dice_source():
+            if self.instrumentation is not None:
+                return self._run_instrumented(num_simulations, num_rounds, pro_level)
+            return self._run_scalar(num_simulations, num_rounds, pro_level)
+
+    def _vectorized_seed(self):
+        """向量化引擎的随机来源: 优先使用注入的 DiceSource 的 Generator。"""
+        return self.dice_source.rng if isinstance(self.dice_source, DiceSource) else self.seed
+
+    @contextmanager
+    def _bind_dice_source(self):
+        """运行期间把骰子来源绑定到动作函数 (及伤害函数) 所在模块的 roll_dice。"""
+        if self.dice_source is None:
+            yield
+            return
+        module_globals = [self.action_function.__globals__,
+                          getattr(self.attacker_stats.base_damage_roll, '__globals__', {})]
+        previous = []
+        for g in module_globals:
+            if '_dice_source' in g and not any(g is p for p, _ in previous):
+                previous.append((g, g['_dice_source']))
+                g['_dice_source'] = self.dice_source
+        try:
+            yield
+        finally:
+            for g, source in previous:
+                g['_dice_source'] = source
+
+    def _run_scalar(self, num_simulations, num_rounds, pro_level):
         grand_total_hp_loss = 0
         grand_total_hits = 0
+        hp_loss_stats = self.hp_loss_stats = StreamingStats()
+        state = new_action_state(self.action_function)
 
         for _ in range(num_simulations):
-            state = {}
-            battle_total_hp_loss = 0
-            
-            for current_round in range(1, num_rounds + 1):
-                damage_this_round, hits_this_round = self.action_function(state, self.attacker_stats, self.defender_stats, pro_level, current_round)
-                hp_loss_this_round = self._convert_damage_to_hp_loss(damage_this_round, pro_level)
-                battle_total_hp_loss += hp_loss_this_round
-                grand_total_hits += hits_this_round
-            
+            battle_hits, battle_total_hp_loss = self._run_battle(num_rounds, pro_level, state)
+            grand_total_hits += battle_hits
             grand_total_hp_loss += battle_total_hp_loss
+            hp_loss_stats.add(battle_total_hp_loss)
 
         # 计算每场战斗的平均值
         avg_hp_loss_per_battle = grand_total_hp_loss / num_simulations
@@ -316,92 +642,389 @@ class Simulator:
         # 返回每场战斗的平均扣血和平均命中
         return avg_hits_per_battle, avg_hp_loss_per_battle
 
+    def _run_battle(self, num_rounds, pro_level, state=None):
+        """标量引擎运行一场战斗，返回 (命中数, HP损失)。state 为复用的动作状态，开战前原地重置。"""
+        if state is None:
+            state = new_action_state(self.action_function)
+        else:
+            state.reset()
+        action_function, attacker, defender = self._round_action, self.attacker_stats, self.defender_stats
+        threshold1, threshold2 = defender.thresholds[pro_level - 1]
+        battle_hits = 0
+        battle_total_hp_loss = 0
+        for current_round in range(1, num_rounds + 1):
+            damage_this_round, hits_this_round = action_function(state, attacker, defender, pro_level, current_round, num_rounds)
+            # 同 convert_damage_to_hp_loss
+            if damage_this_round > 0:
+                battle_total_hp_loss += 1 if damage_this_round < threshold1 else 2 if damage_this_round < threshold2 else 3
+            battle_hits += hits_this_round
+        return battle_hits, battle_total_hp_loss
+
+    def _battle_time_to_kill(self, hp, max_rounds, pro_level, state):
+        """标量引擎运行一场战斗直到累计HP损失 >= hp，返回击杀回合，max_rounds 内未击杀为 0。"""
+        state.reset()
+        action_function, attacker, defender = self._round_action, self.attacker_stats, self.defender_stats
+        threshold1, threshold2 = defender.thresholds[pro_level - 1]
+        battle_total_hp_loss = 0
+        for current_round in range(1, max_rounds + 1):
+            damage_this_round, _ = action_function(state, attacker, defender, pro_level, current_round, max_rounds)
+            if damage_this_round > 0:
+                battle_total_hp_loss += 1 if damage_this_round < threshold1 else 2 if damage_this_round < threshold2 else 3
+                if battle_total_hp_loss >= hp:
+                    return current_round
+        return 0
+
+    def run_time_to_kill(self, num_simulations=10000, hp=None, max_rounds=100, pro_level=1):
+        """
+        击杀所需回合数: 防御者有 hp 点HP (默认 defender_stats.hp)，每场战斗在累计HP损失达到 hp 时结束，
+        最多 max_rounds 回合 (盾斧的“最后一回合”即 max_rounds)。
+        返回: SimpleNamespace(mean_rounds, p5, p50, p95, kill_rate, num_simulations)
+          回合数的均值与分位数只统计 max_rounds 内击杀的战斗，kill_rate 为这部分所占比例。
+          精确模式不抽样，num_simulations 为 0。
+        """
+        hp = getattr(self.defender_stats, 'hp', None) if hp is None else hp
+        if hp is None or hp <= 0:
+            raise ValueError("击杀回合模式需要正的HP: 传入 hp 或设置 defender_stats.hp")
+        if self.mode == 'exact':
+            from exact_solver import ExactSolver
+            kill_distribution = ExactSolver(self.action_function, self.attacker_stats, self.defender_stats) \
+                .time_to_kill(hp, max_rounds, pro_level)
+            kill_rate = sum(kill_distribution.values())
+            conditional = {r: p / kill_rate for r, p in kill_distribution.items()} if kill_rate else {0: 1.0}
+            from damage_distribution import pmf_quantile
+            return SimpleNamespace(
+                mean_rounds=sum(r * p for r, p in conditional.items()),
+                p5=pmf_quantile(conditional, 0.05), p50=pmf_quantile(conditional, 0.50),
+                p95=pmf_quantile(conditional, 0.95), kill_rate=kill_rate, num_simulations=0)
+
+        if self.mode == 'vectorized':
+            from batch_engine import time_to_kill_battles
+            kill_rounds = time_to_kill_battles(self.action_function, self.attacker_stats, self.defender_stats,
+                                               num_simulations, hp, max_rounds, pro_level, self._vectorized_seed())
+            kill_rounds = kill_rounds[kill_rounds > 0]
+        else:
+            state = new_action_state(self.action_function)
+            with self._bind_dice_source():
+                kill_rounds = [self._battle_time_to_kill(hp, max_rounds, pro_level, state)
+                               for _ in range(num_simulations)]
+            kill_rounds = [r for r in kill_rounds if r > 0]
+        stats = StreamingStats()
+        stats.add_batch(kill_rounds)
+        if stats.count == 0:
+            return SimpleNamespace(mean_rounds=float('nan'), p5=None, p50=None, p95=None, kill_rate=0.0,
+                                   num_simulations=num_simulations)
+        return SimpleNamespace(mean_rounds=stats.mean, p5=stats.quantile(0.05), p50=stats.quantile(0.50),
+                               p95=stats.quantile(0.95), kill_rate=stats.count / num_simulations,
+                               num_simulations=num_simulations)
+
+    def _run_traced(self, num_simulations, num_rounds, pro_level):
+        """记录轨迹的运行，与 run 的结果口径一致。写满后关闭轨迹文件，中途出错 (含中断) 时放弃该文件。"""
+        trace = self.trace
+        try:
+            result = self._write_trace(num_simulations, num_rounds, pro_level)
+        except BaseException:
+            trace.abort()
+            raise
+        trace.close()
+        return result
+
+    def _write_trace(self, num_simulations, num_rounds, pro_level):
+        trace = self.trace
+        key_field = state_key_field(self.action_function)
+        hp_loss_stats = self.hp_loss_stats = StreamingStats()
+        if self.mode == 'vectorized':
+            from batch_engine import run_batch
+            return run_batch(self.action_function, self.attacker_stats, self.defender_stats,
+                             num_simulations, num_rounds, pro_level, seed=self._vectorized_seed(),
+                             hp_loss_stats=hp_loss_stats, trace=trace, trace_field=key_field)
+
+        from trace_recorder import TRACE_CHUNK_ROWS, state_code
+        action_function, attacker, defender = self._round_action, self.attacker_stats, self.defender_stats
+        state = new_action_state(self.action_function)
+        columns = damage_column, hits_column, hp_loss_column, state_column = [], [], [], []
+        grand_total_hits = 0
+        grand_total_hp_loss = 0
+        with self._bind_dice_source():
+            for _ in range(num_simulations):
+                state.reset()
+                battle_total_hp_loss = 0
+                for current_round in range(1, num_rounds + 1):
+                    damage_this_round, hits_this_round = action_function(state, attacker, defender, pro_level, current_round, num_rounds)
+                    hp_loss_this_round = convert_damage_to_hp_loss(damage_this_round, defender, pro_level)
+                    damage_column.append(damage_this_round)
+                    hits_column.append(hits_this_round)
+                    hp_loss_column.append(hp_loss_this_round)
+                    state_column.append(state_code(state, key_field))
+                    battle_total_hp_loss += hp_loss_this_round
+                    grand_total_hits += hits_this_round
+                grand_total_hp_loss += battle_total_hp_loss
+                hp_loss_stats.add(battle_total_hp_loss)
+                if len(damage_column) >= TRACE_CHUNK_ROWS:
+                    trace.write_rounds(*columns)
+                    for column in columns:
+                        column.clear()
+        trace.write_rounds(*columns)
+        return grand_total_hits / num_simulations, grand_total_hp_loss / num_simulations
+
+    def _run_instrumented(self, num_simulations, num_rounds, pro_level):
+        """带统计与计时的标量循环，与 run 的结果口径一致。"""
+        inst = self.instrumentation
+        clock = inst.clock
+        action_function, attacker, defender = self._round_action, self.attacker_stats, self.defender_stats
+        if hasattr(attacker, 'damage_spec') and hasattr(attacker, 'replace'):
+            attacker = attacker.replace(base_damage_roll=create_damage_roll(attacker.damage_spec, alias=False))
+        patched = inst.patch(self.action_function.__globals__, getattr(attacker.base_damage_roll, '__globals__', {}))
+        grand_total_hp_loss = 0
+        grand_total_hits = 0
+        hp_loss_stats = self.hp_loss_stats = StreamingStats()
+        state = new_action_state(self.action_function)
+        try:
+            for _ in range(num_simulations):
+                state.reset()
+                battle_total_hp_loss = 0
+                for current_round in range(1, num_rounds + 1):
+                    start = clock()
+                    damage_this_round, hits_this_round = action_function(state, attacker, defender, pro_level, current_round, num_rounds)
+                    elapsed = clock() - start
+                    hp_loss_this_round = self._convert_damage_to_hp_loss(damage_this_round, pro_level)
+                    inst.record_round(elapsed, state, hp_loss_this_round)
+                    battle_total_hp_loss += hp_loss_this_round
+                    grand_total_hits += hits_this_round
+                inst.battles += 1
+                grand_total_hp_loss += battle_total_hp_loss
+                hp_loss_stats.add(battle_total_hp_loss)
+        finally:
+            inst.unpatch(patched)
+
+        return grand_total_hits / num_simulations, grand_total_hp_loss / num_simulations
+
+    def _simulate_batch(self, n, num_rounds, pro_level, rng=None):
+        """运行一批 n 场战斗，返回 (每场命中数, 每场HP损失)，向量化模式下为NumPy数组。"""
+        if self.mode == 'vectorized':
+            from batch_engine import simulate_battles
+            return simulate_battles(self.action_function, self.attacker_stats, self.defender_stats,
+                                    n, num_rounds, pro_level, rng)
+        state = new_action_state(self.action_function)
+        battles = [self._run_battle(num_rounds, pro_level, state) for _ in range(n)]
+        return [hits for hits, _ in battles], [hp_loss for _, hp_loss in battles]
+
+    def run_adaptive(self, target_half_width=0.05, num_rounds=10, pro_level=1, confidence=0.95,
+                     batch_size=1000, max_simulations=1_000_000):
+        """
+        分批模拟，直到平均HP损失置信区间的半宽 <= target_half_width 或达到 max_simulations。
+        返回: SimpleNamespace(avg_hits, avg_hp_loss, std_error, half_width, num_simulations)
+        精确/闭式路径没有抽样误差，std_error 为0，num_simulations 为0。
+        """
+        if self.instrumentation is not None:
+            raise ValueError("instrumentation 只支持 run，不支持 run_adaptive")
+        if self.mode == 'exact' or self._use_analytic():
+            avg_hits, avg_hp_loss = self.run(0, num_rounds, pro_level)
+            return SimpleNamespace(avg_hits=avg_hits, avg_hp_loss=avg_hp_loss, std_error=0.0,
+                                   half_width=0.0, num_simulations=0)
+        if batch_size < 1:
+            raise ValueError(f"batch_size 应为正整数: {batch_size}")
+        if max_simulations < 2:
+            raise ValueError(f"max_simulations 至少为 2 才能估计方差: {max_simulations}")
+
+        from statistics import NormalDist
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        rng = None
+        if self.mode == 'vectorized':
+            from batch_engine import make_rng
+            rng = make_rng(self._vectorized_seed())
+
+        with self._bind_dice_source():
+            return self._run_adaptive_batches(target_half_width, num_rounds, pro_level, z, batch_size,
+                                              max_simulations, rng)
+
+    def _run_adaptive_batches(self, target_half_width, num_rounds, pro_level, z, batch_size, max_simulations, rng):
+        total_hits = 0
+        hp_loss_stats = self.hp_loss_stats = StreamingStats()
+        # 首批至少 2 场，保证结束时总能给出有限的区间
+        n = max(2, min(batch_size, max_simulations))
+        while True:
+            hits, hp_loss = self._simulate_batch(n, num_rounds, pro_level, rng)
+            total_hits += int(sum(hits))
+            hp_loss_stats.add_batch(hp_loss)
+            half_width = z * hp_loss_stats.std_error
+
+            # 至少两批后才检查停止条件，避免首批方差偶然偏小
+            if hp_loss_stats.count >= max_simulations or (
+                    hp_loss_stats.count >= 2 * batch_size and half_width <= target_half_width):
+                break
+            n = min(batch_size, max_simulations - hp_loss_stats.count)
+
+        return SimpleNamespace(
+            avg_hits=total_hits / hp_loss_stats.count,
+            avg_hp_loss=hp_loss_stats.mean,
+            std_error=hp_loss_stats.std_error,
+            half_width=half_width,
+            num_simulations=hp_loss_stats.count,
+        )
+
+    def _use_analytic(self):
+        """run 是否走闭式期望路径: 需开启 analytic_stateless，且没有要逐回合记录的 instrumentation。"""
+        return self.analytic_stateless and self.instrumentation is None and self._is_analytic()
+
+    def _is_analytic(self):
+        """当前动作是否可走闭式期望路径。"""
+        if not hasattr(self.attacker_stats, 'damage_spec'):
+            return False
+        from exact_solver import is_stateless
+        return is_stateless(self.action_function)
+
+# --- 默认防御者 ---
+DEFENDER = SimpleNamespace(
+    defense=13,
+    thresholds=[[8, 16], [13, 26], [13, 26], [20, 35], [20, 35], [36, 66]]
+)
+ATTACKER_MOD = 0
+
+# --- 武器配置中心 ---
+# "damage" 为伤害表达式模板 (默认 DEFAULT_DAMAGE)，见 damage_expression
+WEAPON_CONFIG = {
+    "原版长剑":   {"dice": 10, "bonus": [6,9,9,12,12,15],   "action": simple_attack_action}, # 相当于高一位阶的武器
+    "大剑":       {"dice": 12, "bonus": [3,6,6,9,9,12],   "action": simple_attack_action, "damage": "({pro}d12+{bonus})*2"},
+    "片手":       {"dice": 6,  "bonus": [2,6,6,10,10,14], "action": simple_attack_action, "damage": "{pro}d6+{bonus}+{pro}d8"},
+    "双刀":       {"dice": 8,  "bonus": [0,1,1,4,4,7],    "action": multi_attack_action,  "params": {"num_attacks": 2}},
+    "太刀":       {"dice": 8, "bonus": [0,3,3,6,6,9],   "action": long_sword_token_action},
+    "大锤":       {"dice": 12, "bonus": [1,4,4,7,7,10],   "action": great_hammer_action},
+    "狩猎笛":     {"dice": 8,  "bonus": [0,3,3,6,6,9],   "action": simple_attack_action, "damage": "{pro}d8+{bonus}+2", "params": {"attack_modifier_bonus": 1}},
+    "长枪":       {"dice": 10,  "bonus": [1,4,4,7,7,10],   "action": lance_action},
+    "铳枪":       {"dice": 10, "bonus": [3,6,6,9,9,12],   "action": wyvernstake_action},
+    "斩斧 (N=1)": {"dice": 10, "bonus": [3,6,6,9,9,12],   "action": form_switching_action,"params": {"form_switch_threshold": 1, "form_duration": 1, "form_damage_bonus": 2, "form_attack_bonus": 1}},
+    "斩斧 (N=2)": {"dice": 10, "bonus": [3,6,6,9,9,12],   "action": form_switching_action,"params": {"form_switch_threshold": 2, "form_duration": 2, "form_damage_bonus": 4, "form_attack_bonus": 2}},
+    "斩斧 (N=3)": {"dice": 10, "bonus": [3,6,6,9,9,12],   "action": form_switching_action,"params": {"form_switch_threshold": 3, "form_duration": 3, "form_damage_bonus": 6, "form_attack_bonus": 3}},
+    "斩斧 (N=4)": {"dice": 10, "bonus": [3,6,6,9,9,12],   "action": form_switching_action,"params": {"form_switch_threshold": 4, "form_duration": 4, "form_damage_bonus": 8, "form_attack_bonus": 4}},
+    "斩斧 (N=5)": {"dice": 10, "bonus": [3,6,6,9,9,12],   "action": form_switching_action,"params": {"form_switch_threshold": 5, "form_duration": 5, "form_damage_bonus": 10, "form_attack_bonus": 5}},
+    "盾斧 (N=1)": {"dice": 12, "bonus": [3,6,6,9,9,12],   "action": charge_blade_action,  "params": {"discharge_threshold": 1, "num_aoe_targets": 1}},
+    "盾斧 (N=2)": {"dice": 12, "bonus": [3,6,6,9,9,12],   "action": charge_blade_action,  "params": {"discharge_threshold": 2, "num_aoe_targets": 2}},
+    "盾斧 (N=3)": {"dice": 12, "bonus": [3,6,6,9,9,12],   "action": charge_blade_action,  "params": {"discharge_threshold": 3, "num_aoe_targets": 3}},
+    "盾斧 (N=4)": {"dice": 12, "bonus": [3,6,6,9,9,12],   "action": charge_blade_action,  "params": {"discharge_threshold": 4, "num_aoe_targets": 3}},
+    "盾斧 (N=5)": {"dice": 12, "bonus": [3,6,6,9,9,12],   "action": charge_blade_action,  "params": {"discharge_threshold": 5, "num_aoe_targets": 3}},
+    "虫棍":       {"dice": 8,  "bonus": [1,4,4,7,7,10],   "action": insect_glaive_action},
+    "龙矢":       {"dice": 8,  "bonus": [3,6,6,9,9,12],   "action": simple_aoe_action,    "params": {"num_aoe_targets": 3}},
+    "轻弩":       {"dice": 6,  "bonus": [1,4,4,7,7,10],    "action": light_bowgun_action},
+    "重弩 (N=1)": {"dice": 8,  "bonus": [0,3,3,6,6,9],    "action": heavy_bowgun_action,  "params": {"buff_stacks": 1}},
+    "重弩 (N=2)": {"dice": 8,  "bonus": [0,3,3,6,6,9],    "action": heavy_bowgun_action,  "params": {"buff_stacks": 2}},
+    "重弩 (N=3)": {"dice": 8,  "bonus": [0,3,3,6,6,9],    "action": heavy_bowgun_action,  "params": {"buff_stacks": 3}},
+    "重弩 (N=4)": {"dice": 8,  "bonus": [0,3,3,6,6,9],    "action": heavy_bowgun_action,  "params": {"buff_stacks": 4}},
+}
+
+def pivot_results(results_data, weapon_order):
+    """
+    把 [{'Weapon','Pro','HP Loss',...}] 结果整理为 武器×Pro 的透视表。
+    结果中带有 'HP Loss ±' 时，每个Pro列后面紧跟一列 '<Pro> ±'。
+    """
+    import pandas as pd
+    df = pd.DataFrame(results_data)
+    df['Weapon'] = pd.Categorical(df['Weapon'], categories=weapon_order, ordered=True)
+    df.sort_values('Weapon', inplace=True)
+    if 'HP Loss ±' not in df.columns:
+        return df.pivot(index='Weapon', columns='Pro', values='HP Loss')
+
+    values = df.pivot(index='Weapon', columns='Pro', values='HP Loss')
+    errors = df.pivot(index='Weapon', columns='Pro', values='HP Loss ±')
+    pivot_df = pd.DataFrame(index=values.index)
+    for pro in values.columns:
+        pivot_df[str(pro)] = values[pro]
+        pivot_df[f"{pro} ±"] = errors[pro]
+    return pivot_df
+
+def print_table(pivot_df):
+    """打印透视表，优先使用tabulate。"""
+    import pandas as pd
+    pd.set_option('display.float_format', '{:.2f}'.format)
+    try:
+        from tabulate import tabulate
+        print(tabulate(pivot_df, headers='keys', tablefmt='psql'))
+    except ImportError:
+        print("\n[提示] 'tabulate' 库未安装，建议运行 'pip install tabulate' 以获得更美观的表格输出。")
+        print(pivot_df)
+
 if __name__ == "__main__":
+    import pandas as pd
+
+    from result_cache import ResultCache, cell_key
+
     # --- 通用配置 ---
     NUM_SIMULATIONS = 10000
     NUM_ROUNDS = 10
-    DEFENDER = SimpleNamespace(
-        defense=13,
-        thresholds=[[8, 16], [13, 26], [13, 26], [20, 35], [20, 35], [36, 66]]
-    )
-    ATTACKER_MOD = 0
-
-    # --- 武器配置中心 ---
-    WEAPON_CONFIG = {
-        "原版长剑":   {"dice": 10, "bonus": [6,9,9,12,12,15],   "action": simple_attack_action}, # 相当于高一位阶的武器
-        "大剑":       {"dice": 12, "bonus": [3,6,6,9,9,12],   "action": simple_attack_action, "params": {"damage_multiplier": 2}},
-        "片手":       {"dice": 6,  "bonus": [2,6,6,10,10,14], "action": simple_attack_action, "params": {"extra_roll_dice": 8}},
-        "双刀":       {"dice": 8,  "bonus": [0,1,1,4,4,7],    "action": multi_attack_action,  "params": {"num_attacks": 2}},
-        "太刀":       {"dice": 8, "bonus": [0,3,3,6,6,9],   "action": long_sword_token_action},
-        "大锤":       {"dice": 12, "bonus": [1,4,4,7,7,10],   "action": great_hammer_action},
-        "狩猎笛":     {"dice": 8,  "bonus": [0,3,3,6,6,9],   "action": simple_attack_action, "params": {"attack_modifier_bonus": 1, "damage_bonus": 2}},
-        "长枪":       {"dice": 10,  "bonus": [1,4,4,7,7,10],   "action": lance_action},
-        "铳枪":       {"dice": 10, "bonus": [3,6,6,9,9,12],   "action": wyvernstake_action},
-        "斩斧 (N=1)": {"dice": 10, "bonus": [3,6,6,9,9,12],   "action": form_switching_action,"params": {"form_switch_threshold": 1, "form_duration": 1, "form_damage_bonus": 2, "form_attack_bonus": 1}},
-        "斩斧 (N=2)": {"dice": 10, "bonus": [3,6,6,9,9,12],   "action": form_switching_action,"params": {"form_switch_threshold": 2, "form_duration": 2, "form_damage_bonus": 4, "form_attack_bonus": 2}},
-        "斩斧 (N=3)": {"dice": 10, "bonus": [3,6,6,9,9,12],   "action": form_switching_action,"params": {"form_switch_threshold": 3, "form_duration": 3, "form_damage_bonus": 6, "form_attack_bonus": 3}},
-        "斩斧 (N=4)": {"dice": 10, "bonus": [3,6,6,9,9,12],   "action": form_switching_action,"params": {"form_switch_threshold": 4, "form_duration": 4, "form_damage_bonus": 8, "form_attack_bonus": 4}},
-        "斩斧 (N=5)": {"dice": 10, "bonus": [3,6,6,9,9,12],   "action": form_switching_action,"params": {"form_switch_threshold": 5, "form_duration": 5, "form_damage_bonus": 10, "form_attack_bonus": 5}},
-        "盾斧 (N=1)": {"dice": 12, "bonus": [3,6,6,9,9,12],   "action": charge_blade_action,  "params": {"discharge_threshold": 1, "num_aoe_targets": 1}},
-        "盾斧 (N=2)": {"dice": 12, "bonus": [3,6,6,9,9,12],   "action": charge_blade_action,  "params": {"discharge_threshold": 2, "num_aoe_targets": 2}},
-        "盾斧 (N=3)": {"dice": 12, "bonus": [3,6,6,9,9,12],   "action": charge_blade_action,  "params": {"discharge_threshold": 3, "num_aoe_targets": 3}},
-        "盾斧 (N=4)": {"dice": 12, "bonus": [3,6,6,9,9,12],   "action": charge_blade_action,  "params": {"discharge_threshold": 4, "num_aoe_targets": 3}},
-        "盾斧 (N=5)": {"dice": 12, "bonus": [3,6,6,9,9,12],   "action": charge_blade_action,  "params": {"discharge_threshold": 5, "num_aoe_targets": 3}},
-        "虫棍":       {"dice": 8,  "bonus": [1,4,4,7,7,10],   "action": insect_glaive_action},
-        "龙矢":       {"dice": 8,  "bonus": [3,6,6,9,9,12],   "action": simple_aoe_action,    "params": {"num_aoe_targets": 3}},
-        "轻弩":       {"dice": 6,  "bonus": [1,4,4,7,7,10],    "action": light_bowgun_action},
-        "重弩 (N=1)": {"dice": 8,  "bonus": [0,3,3,6,6,9],    "action": heavy_bowgun_action,  "params": {"buff_stacks": 1}},
-        "重弩 (N=2)": {"dice": 8,  "bonus": [0,3,3,6,6,9],    "action": heavy_bowgun_action,  "params": {"buff_stacks": 2}},
-        "重弩 (N=3)": {"dice": 8,  "bonus": [0,3,3,6,6,9],    "action": heavy_bowgun_action,  "params": {"buff_stacks": 3}},
-        "重弩 (N=4)": {"dice": 8,  "bonus": [0,3,3,6,6,9],    "action": heavy_bowgun_action,  "params": {"buff_stacks": 4}},
-    }
+    SIM_MODE = "scalar"  # 'scalar', 'vectorized' 或 'exact'
+    SEED = 0  # 抽样的随机种子；设为 None 时每次重新抽样，抽样单元不再写入结果缓存
+    ANALYTIC_STATELESS = True  # 无状态武器直接使用闭式期望
+    ADAPTIVE_HALF_WIDTH = None  # 设为如 0.05 时按置信区间半宽自适应决定模拟次数，并输出 ± 列
+    SHOW_DISTRIBUTION = False  # 额外输出每个单元每场HP损失的均值/方差/p5/p50/p95/最大值 (仅抽样路径)
+    INSTRUMENT = False  # 输出每个单元的动作耗时、roll_dice次数、状态分布与HP损失分桶 (仅标量引擎，跳过缓存)
+    TIME_TO_KILL_HP = None  # 设为如 12 时额外输出击杀该HP所需回合数的均值与 p5/p50/p95 (最多 TIME_TO_KILL_MAX_ROUNDS 回合)
+    TIME_TO_KILL_MAX_ROUNDS = 100
 
     # --- 数据存储 ---
     results_data = []
+    time_to_kill_rows = []
+    distribution_rows = []
     weapon_order = list(WEAPON_CONFIG.keys())
 
+    # --- 结果缓存: 只重新计算输入发生变化的单元 ---
+    parser = argparse.ArgumentParser(description="武器×Pro平衡扫描")
+    parser.add_argument("--no-cache", action="store_true", help="忽略结果缓存，全部重新计算")
+    args = parser.parse_args()
+    cache = None if args.no_cache else ResultCache()
+
     # --- 模拟循环 ---
     for pro_val in range(1, 7):
         Pro = pro_val
         for name, config in WEAPON_CONFIG.items():
-            params = config.get("params", {})
-            
-            # 构建base_damage_roll函数
-            def create_damage_roll(p, c):
-                bonus_val = c['bonus'][p-1]
-                damage_multiplier = c.get("params", {}).get("damage_multiplier", 1)
-                extra_roll_dice = c.get("params", {}).get("extra_roll_dice")
-                damage_bonus = c.get("params", {}).get("damage_bonus", 0)
-
-                def roll_func():
-                    main_damage = roll_dice(p, c['dice'], bonus_val)
-                    if extra_roll_dice:
-                        main_damage += roll_dice(p, extra_roll_dice, 0)
-                    return (main_damage + damage_bonus) * damage_multiplier
-                return roll_func
-
-            attacker_stats = SimpleNamespace(
-                attack_modifier=ATTACKER_MOD + params.get("attack_modifier_bonus", 0),
-                base_damage_roll=create_damage_roll(Pro, config),
-                **params
-            )
-
-            sim = Simulator(config["action"], attacker_stats, DEFENDER)
-            _, avg_dmg = sim.run(NUM_SIMULATIONS, NUM_ROUNDS, pro_val)
-            results_data.append({'Weapon': name, 'Pro': Pro, 'HP Loss': avg_dmg})
+            if TIME_TO_KILL_HP:  # 击杀回合不经过结果缓存
+                ttk = Simulator(config["action"], build_attacker_stats(Pro, config, ATTACKER_MOD), DEFENDER,
+                                mode=SIM_MODE, seed=SEED).run_time_to_kill(NUM_SIMULATIONS, TIME_TO_KILL_HP,
+                                                                TIME_TO_KILL_MAX_ROUNDS, pro_val)
+                time_to_kill_rows.append({'Weapon': name, 'Pro': Pro, 'Rounds': ttk.mean_rounds, 'p5': ttk.p5,
+                                          'p50': ttk.p50, 'p95': ttk.p95, 'Kill Rate': ttk.kill_rate})
+            key = None
+            # 不带种子的抽样结果每次不同，不缓存
+            if cache is not None and not INSTRUMENT and (SEED is not None or SIM_MODE == 'exact'):
+                key = cell_key(config, Pro, DEFENDER, NUM_ROUNDS, NUM_SIMULATIONS, SEED, SIM_MODE,
+                               runner='monte_carlo_simulator', attack_modifier=ATTACKER_MOD,
+                               analytic_stateless=ANALYTIC_STATELESS, adaptive_half_width=ADAPTIVE_HALF_WIDTH)
+                cached = cache.get(key)
+                if cached is not None:
+                    results_data.append({'Weapon': name, 'Pro': Pro, **cached['result']})
+                    if SHOW_DISTRIBUTION and cached['distribution']:
+                        distribution_rows.append({'Weapon': name, 'Pro': Pro, **cached['distribution']})
+                    continue
+
+            attacker_stats = build_attacker_stats(Pro, config, ATTACKER_MOD)
+
+            instrumentation = Instrumentation(f"{name} Pro{Pro}") if INSTRUMENT else None
+            sim = Simulator(config["action"], attacker_stats, DEFENDER, mode=SIM_MODE, seed=SEED,
+                            analytic_stateless=ANALYTIC_STATELESS, instrumentation=instrumentation)
+            if ADAPTIVE_HALF_WIDTH:
+                result = sim.run_adaptive(ADAPTIVE_HALF_WIDTH, NUM_ROUNDS, pro_val)
+                row = {'HP Loss': result.avg_hp_loss, 'HP Loss ±': result.half_width, 'Battles': result.num_simulations}
+            else:
+                _, avg_dmg = sim.run(NUM_SIMULATIONS, NUM_ROUNDS, pro_val)
+                row = {'HP Loss': avg_dmg}
+            results_data.append({'Weapon': name, 'Pro': Pro, **row})
+            distribution = sim.hp_loss_stats.summary() if sim.hp_loss_stats is not None else None
+            if SHOW_DISTRIBUTION and distribution:
+                distribution_rows.append({'Weapon': name, 'Pro': Pro, **distribution})
+            if instrumentation is not None:
+                print(instrumentation.report())
+            if key is not None:
+                cache.put(key, {'result': row, 'distribution': distribution})
 
     # --- 结果展示 ---
-    df = pd.DataFrame(results_data)
-    df['Weapon'] = pd.Categorical(df['Weapon'], categories=weapon_order, ordered=True)
-    df.sort_values('Weapon', inplace=True)
-    
-    pivot_df = df.pivot(index='Weapon', columns='Pro', values='HP Loss')
-    
-    pd.set_option('display.float_format', '{:.2f}'.format)
-    print(f"模拟环境: 敌人防御={DEFENDER.defense}, 伤害阈值随Pro等级变化, 每场战斗 {NUM_ROUNDS} 回合, 共模拟 {NUM_SIMULATIONS} 次")
-    try:
-        from tabulate import tabulate
-        print(tabulate(pivot_df, headers='keys', tablefmt='psql'))
-    except ImportError:
-        print("\n[提示] 'tabulate' 库未安装，建议运行 'pip install tabulate' 以获得更美观的表格输出。")
-        print(pivot_df)
+    pivot_df = pivot_results(results_data, weapon_order)
+    sample_desc = f"95%置信区间半宽 <= {ADAPTIVE_HALF_WIDTH}" if ADAPTIVE_HALF_WIDTH else f"共模拟 {NUM_SIMULATIONS} 次"
+    print(f"模拟环境: 敌人防御={DEFENDER.defense}, 伤害阈值随Pro等级变化, 每场战斗 {NUM_ROUNDS} 回合, {sample_desc}")
+    if cache is not None:
+        print(f"缓存: 命中 {cache.hits} 个单元, 重新计算 {cache.misses} 个单元 (--no-cache 可强制全部重新计算)")
+        cache.close()
+    print_table(pivot_df)
+    if distribution_rows:
+        print("\n每场HP损失分布:")
+        print_table(pd.DataFrame(distribution_rows).set_index(['Weapon', 'Pro']))
+    if time_to_kill_rows:
+        print(f"\n击杀 HP={TIME_TO_KILL_HP} 的敌人所需回合数 (最多 {TIME_TO_KILL_MAX_ROUNDS} 回合，只统计击杀的战斗):")
+        print_table(pd.DataFrame(time_to_kill_rows).set_index(['Weapon', 'Pro']))
@@ -0,0 +1,126 @@
+"""
+武器 × Pro 平衡表的多进程并行扫描。
+
+每个 (武器, Pro) 单元按固定的 chunk_size 切成若干块，每块的随机流由
+主种子和 (武器名, Pro, 块序号) 派生，与进程数和武器顺序无关；结果按任务顺序合并，
+因此同一个主种子在任意 workers 数下得到逐位相同的透视表。
+"""
+import argparse
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from monte_carlo_simulator import (
+    ATTACKER_MOD, DEFENDER, WEAPON_CONFIG, Simulator, build_attacker_stats, pivot_results, print_table,
+)
+from result_cache import DEFAULT_CACHE_PATH, ResultCache, cell_key
+
+DEFAULT_CHUNK_SIZE = 10_000
+
+def chunk_seed(master_seed, name, pro_level, chunk_index):
+    """由主种子和块坐标派生独立的随机流。武器以名字的CRC32标识，增删其他武器不影响它的随机流。"""
+    return np.random.SeedSequence(master_seed, spawn_key=(zlib.crc32(name.encode('utf-8')), pro_level, chunk_index))
+
+def build_tasks(weapon_config, pro_levels, num_simulations, chunk_size):
+    """把扫描拆分为 (武器名, Pro, 块序号, 本块模拟次数) 任务，顺序固定。"""
+    tasks = []
+    for pro_level in pro_levels:
+        for name in weapon_config:
+            for chunk_index, start in enumerate(range(0, num_simulations, chunk_size)):
+                tasks.append((name, pro_level, chunk_index, min(chunk_size, num_simulations - start)))
+    return tasks
+
+def _run_chunk(task, weapon_config, defender, num_rounds, mode, master_seed, analytic_stateless):
+    """在工作进程中运行一个块，返回 (平均命中, 平均HP损失, 模拟次数)。"""
+    name, pro_level, chunk_index, n = task
+    config = weapon_config[name]
+    seed_sequence = chunk_seed(master_seed, name, pro_level, chunk_index)
+    attacker_stats = build_attacker_stats(pro_level, config, ATTACKER_MOD)
+
+    # 标量引擎通过 DiceSource 使用同一个 Generator
+    sim = Simulator(config["action"], attacker_stats, defender, mode=mode,
+                    seed=np.random.default_rng(seed_sequence), analytic_stateless=analytic_stateless)
+    avg_hits, avg_hp_loss = sim.run(n, num_rounds, pro_level)
+    return avg_hits, avg_hp_loss, n
+
+def _run_chunk_star(args):
+    return _run_chunk(*args)
+
+def run_sweep(weapon_config=None, defender=None, pro_levels=range(1, 7), num_simulations=10000, num_rounds=10,
+              mode='vectorized', master_seed=0, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, analytic_stateless=False,
+              cache=None):
+    """
+    并行运行平衡扫描，返回 武器×Pro 的HP损失透视表。
+    workers=1 时在当前进程内顺序执行，结果与多进程完全相同。
+    cache 为 ResultCache 时，输入未变化的单元直接取缓存，只重新计算其余单元。
+    """
+    weapon_config = WEAPON_CONFIG if weapon_config is None else weapon_config
+    defender = DEFENDER if defender is None else defender
+    workers = workers or os.cpu_count() or 1
+    if mode == 'exact':
+        # 精确求解不抽样，结果与 num_simulations 无关: 每个单元只需一个权重为 1 的任务
+        num_simulations = chunk_size = 1
+
+    # 先从缓存中取出未变化的单元
+    totals = {}
+    cell_keys = {}
+    if cache is not None:
+        for pro_level in pro_levels:
+            for name, config in weapon_config.items():
+                key = cell_key(config, pro_level, defender, num_rounds, num_simulations, master_seed, mode,
+                               runner='parallel_sweep', chunk_size=chunk_size, attack_modifier=ATTACKER_MOD,
+                               analytic_stateless=analytic_stateless)
+                cached = cache.get(key)
+                if cached is None:
+                    cell_keys[(name, pro_level)] = key
+                else:
+                    totals[(name, pro_level)] = (cached['hp_loss_sum'], cached['count'])
+
+    tasks = [task for task in build_tasks(weapon_config, pro_levels, num_simulations, chunk_size)
+             if (task[0], task[1]) not in totals]
+    jobs = [(task, weapon_config, defender, num_rounds, mode, master_seed, analytic_stateless) for task in tasks]
+    if workers == 1:
+        chunk_results = [_run_chunk_star(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunk_results = list(executor.map(_run_chunk_star, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+    # 按任务顺序合并各块，保证与进程数无关
+    computed = {}
+    for (name, pro_level, _, _), (avg_hits, avg_hp_loss, n) in zip(tasks, chunk_results):
+        hp_loss_sum, count = computed.get((name, pro_level), (0.0, 0))
+        computed[(name, pro_level)] = (hp_loss_sum + avg_hp_loss * n, count + n)
+    if cache is not None:
+        for cell, (hp_loss_sum, count) in computed.items():
+            cache.put(cell_keys[cell], {'HP Loss': hp_loss_sum / count, 'hp_loss_sum': hp_loss_sum, 'count': count})
+    totals.update(computed)
+
+    results_data = [
+        {'Weapon': name, 'Pro': pro_level, 'HP Loss': hp_loss_sum / count}
+        for (name, pro_level), (hp_loss_sum, count) in totals.items()
+    ]
+    return pivot_results(results_data, list(weapon_config.keys()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="并行运行武器×Pro平衡扫描")
+    parser.add_argument("--simulations", type=int, default=10000, help="每个单元的模拟次数")
+    parser.add_argument("--rounds", type=int, default=10, help="每场战斗回合数")
+    parser.add_argument("--mode", choices=Simulator.MODES, default="vectorized", help="模拟引擎")
+    parser.add_argument("--seed", type=int, default=0, help="主种子")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认为CPU核数")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="每块模拟次数")
+    parser.add_argument("--no-cache", action="store_true", help="忽略结果缓存，全部重新计算")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="结果缓存文件")
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else ResultCache(args.cache_path)
+    pivot_df = run_sweep(num_simulations=args.simulations, num_rounds=args.rounds, mode=args.mode,
+                         master_seed=args.seed, workers=args.workers, chunk_size=args.chunk_size, cache=cache)
+    if cache is not None:
+        print(f"缓存: 命中 {cache.hits} 个单元, 重新计算 {cache.misses} 个单元")
+        cache.close()
+    print(f"模拟环境: 敌人防御={DEFENDER.defense}, 每场战斗 {args.rounds} 回合, 共模拟 {args.simulations} 次, "
+          f"引擎={args.mode}, 主种子={args.seed}")
+    print_table(pivot_df)
@@ -0,0 +1,170 @@
+"""
+平衡扫描的本地结果缓存 (SQLite)，以内容哈希为键。
+
+每个 (武器, Pro) 单元的键由以下内容的SHA-256得到:
+  动作函数及其所用引擎版本 (向量化/精确模型) 的源码、该引擎共用代码 (SHARED_SOURCES) 的源码、
+  ENGINE_VERSION、params、dice、bonus、防御者的 defense/thresholds、回合数、模拟次数、种子、引擎
+  以及调用方给出的其他参数。
+因此修改某把武器的 bonus 或某个动作函数后，只有受影响的单元会重新计算；修改伤害、阈值换算或
+战斗循环等共用代码时，该引擎的所有单元都会重新计算。
+缓存按条目数设上限，超出时淘汰最久未访问的条目。
+"""
+import hashlib
+import importlib
+import inspect
+import json
+import sqlite3
+import time
+from functools import lru_cache
+
+DEFAULT_CACHE_PATH = ".sim_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 100_000
+
+# 共用代码之外、又会改变结果的修改 (如骰子来源的随机流) 时手动加一
+ENGINE_VERSION = 1
+
+# 各引擎除动作函数外也会决定结果的共用代码: "模块" 表示整个模块，"模块:名称" 表示其中的函数/类
+SHARED_SOURCES = {
+    'common': (
+        "monte_carlo_simulator:convert_damage_to_hp_loss", "monte_carlo_simulator:damage_expression",
+        "monte_carlo_simulator:make_damage_spec", "monte_carlo_simulator:build_attacker_stats",
+        # analytic_stateless 时任何引擎都可能走闭式期望，它依赖的精确求解部件也算共用代码
+        "exact_solver:stateless_expectation", "exact_solver:hit_probability", "exact_solver:_SolverContext",
+        "exact_solver:_hit_outcomes", "dice_expr", "damage_distribution",
+    ),
+    'scalar': (
+        "monte_carlo_simulator:roll_dice", "monte_carlo_simulator:random_unit",
+        "monte_carlo_simulator:create_damage_roll", "monte_carlo_simulator:Simulator.run",
+        "monte_carlo_simulator:Simulator._run_scalar", "monte_carlo_simulator:Simulator._run_battle",
+        "monte_carlo_simulator:Simulator._simulate_batch", "monte_carlo_simulator:Simulator._run_adaptive_batches",
+        "alias_table", "dice_source",
+    ),
+    'vectorized': (
+        "batch_engine:roll_dice_batch", "batch_engine:roll_attack_batch", "batch_engine:roll_damage_batch",
+        "batch_engine:damage_on_hit", "batch_engine:convert_damage_to_hp_loss_batch", "batch_engine:_state_array",
+        "batch_engine:make_rng", "batch_engine:simulate_battles", "batch_engine:run_batch",
+        "monte_carlo_simulator:Simulator._run_adaptive_batches", "alias_table",
+    ),
+    'exact': (
+        "exact_solver:ExactSolver",
+    ),
+}
+
+def _source_of(func):
+    """函数源码；取不到时 (例如交互式定义) 退回到限定名。"""
+    try:
+        return inspect.getsource(func)
+    except (OSError, TypeError):
+        return getattr(func, '__qualname__', repr(func))
+
+def engine_sources(action_function, mode):
+    """
+    本次计算实际执行的代码: 动作函数，以及向量化/精确引擎中对应的版本。
+    无状态动作在任何引擎下都可能走闭式期望 (analytic_stateless)，因此总是包含其精确模型。
+    """
+    sources = [_source_of(action_function)]
+    if mode == 'vectorized':
+        from batch_engine import BATCH_ACTIONS
+        batch_action = BATCH_ACTIONS.get(action_function.__name__)
+        if batch_action is not None:
+            sources.append(_source_of(batch_action))
+    from exact_solver import EXACT_MODELS, is_stateless
+    if action_function.__name__ in EXACT_MODELS and (mode == 'exact' or is_stateless(action_function)):
+        sources.append(_source_of(EXACT_MODELS[action_function.__name__][1]))
+    return sources
+
+@lru_cache(maxsize=None)
+def shared_sources(mode):
+    """引擎 mode 的共用代码源码 (SHARED_SOURCES 中 'common' 与该引擎的条目)。"""
+    sources = []
+    for path in SHARED_SOURCES['common'] + SHARED_SOURCES.get(mode, ()):
+        module_name, _, qualname = path.partition(":")
+        obj = importlib.import_module(module_name)
+        for attr in filter(None, qualname.split(".")):
+            obj = getattr(obj, attr)
+        sources.append(_source_of(obj))
+    return sources
+
+def cell_key(config, pro_level, defender, num_rounds, num_simulations, seed=None, mode='scalar', **extra):
+    """计算一个扫描单元的内容哈希。extra 中可放入任何影响结果的参数 (如 chunk_size)。"""
+    payload = {
+        'action': config['action'].__name__,
+        'sources': engine_sources(config['action'], mode),
+        'shared': hashlib.sha256("\n".join(shared_sources(mode)).encode('utf-8')).hexdigest(),
+        'engine_version': ENGINE_VERSION,
+        'dice': config['dice'],
+        'bonus': list(config['bonus']),
+        'damage': config.get('damage'),
+        'params': config.get('params', {}),
+        'defense': defender.defense,
+        'thresholds': [list(t) for t in defender.thresholds],
+        'pro_level': pro_level,
+        'num_rounds': num_rounds,
+        'num_simulations': num_simulations,
+        'seed': seed,
+        'mode': mode,
+        'extra': extra,
+    }
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=repr)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+class ResultCache:
+    """SQLite结果缓存。值为可JSON序列化的对象。"""
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """读取缓存，未命中返回None。"""
+        row = self._conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """写入缓存，并在超出上限时淘汰最久未访问的条目。"""
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO results (key, value, created, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now, now),
+        )
+        self._evict()
+        self._conn.commit()
+
+    def _evict(self):
+        count, = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_access LIMIT ?)",
+                (excess,),
+            )
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def clear(self):
+        self._conn.execute("DELETE FROM results")
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
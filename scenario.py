@@ -0,0 +1,113 @@
+"""
+外部场景文件: 武器、防御者、骰池等配置从 JSON 或 TOML 读取，不必修改代码。
+
+文件中的各节都是可选的，缺省时沿用各模块中的默认配置:
+
+  [sweep]                       # 武器×Pro扫描 (cli.py sweep)
+  mode = "exact"
+  simulations = 10000
+  rounds = 10
+  pro = [1, 2, 3]
+  attack_modifier = 0
+  seed = 0
+  weapons = ["原版长剑", "斩斧"]   # 只扫描这些武器 (名称或名称前缀)
+
+  [defender]
+  defense = 13
+  thresholds = [[8, 16], [13, 26], [13, 26], [20, 35], [20, 35], [36, 66]]
+
+  [weapons."长剑+1"]             # 追加或覆盖 WEAPON_CONFIG 中的武器，action 为动作函数名
+  dice = 10
+  bonus = [7, 10, 10, 13, 13, 16]
+  action = "simple_attack_action"
+
+  [feast]                       # 猛兽盛宴 (cli.py feast)
+  exact = true
+  pools = [{d4 = 8}, {d6 = 8, d8 = 2}]
+
+  [drops]                       # 素材掉落 (cli.py drops)，覆盖 material_drop_simulator.CONFIG 中的同名项
+  mode = "exact"
+  team_size = 4
+
+  [duality]                     # 二元骰概率表 (cli.py duality)
+  advantage = [0, 1, -1]
+  modifier = 0
+
+JSON 文件的结构相同。
+"""
+import json
+import os
+from types import SimpleNamespace
+
+WEAPON_KEYS = {"dice", "bonus", "action", "damage", "params"}
+
+def load_scenario(path):
+    """按扩展名读取 .json 或 .toml 场景文件，返回字典。"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    if extension == ".toml":
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ValueError("读取 TOML 需要 Python 3.11+ 或 'pip install tomli'") from None
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    raise ValueError(f"不支持的场景文件格式: {path!r} (可选 .json / .toml)")
+
+def section(scenario, name):
+    """场景中的一节，缺省为空字典。"""
+    value = (scenario or {}).get(name, {})
+    if not isinstance(value, dict):
+        raise ValueError(f"场景中的 {name!r} 应为表/对象")
+    return value
+
+def weapon_config(scenario=None):
+    """WEAPON_CONFIG 加上场景 [weapons] 中追加或覆盖的武器，action 由名称解析为动作函数。"""
+    from monte_carlo_simulator import WEAPON_CONFIG, get_action
+
+    config = dict(WEAPON_CONFIG)
+    for name, weapon in section(scenario, "weapons").items():
+        unknown = set(weapon) - WEAPON_KEYS
+        if unknown:
+            raise ValueError(f"武器 {name!r} 中有未知的键: {sorted(unknown)}")
+        merged = {**config.get(name, {}), **weapon}
+        missing = {"dice", "bonus", "action"} - set(merged)
+        if missing:
+            raise ValueError(f"武器 {name!r} 缺少: {sorted(missing)}")
+        if len(merged["bonus"]) != 6:
+            raise ValueError(f"武器 {name!r} 的 bonus 应有6项 (Pro1..6)")
+        if isinstance(merged["action"], str):
+            merged["action"] = get_action(merged["action"])
+        config[name] = merged
+    return config
+
+def select_weapons(config, names):
+    """按名称或名称前缀筛选武器，保持 config 中的顺序；names 为空时全部保留。"""
+    if not names:
+        return config
+    selected = {name: weapon for name, weapon in config.items()
+                if any(name == pattern or name.startswith(pattern) for pattern in names)}
+    if not selected:
+        raise ValueError(f"没有匹配 {names} 的武器")
+    return selected
+
+def defender_stats(scenario=None):
+    """场景 [defender] 覆盖默认防御者的 defense/thresholds/hp。"""
+    from monte_carlo_simulator import DEFENDER
+
+    fields = {**vars(DEFENDER), **section(scenario, "defender")}
+    if len(fields["thresholds"]) != 6:
+        raise ValueError("防御者的 thresholds 应有6组 (Pro1..6)")
+    return SimpleNamespace(**fields)
+
+def drops_config(scenario=None):
+    """material_drop_simulator.CONFIG 被场景 [drops] 覆盖后的配置 (不含 mode)。"""
+    from material_drop_simulator import CONFIG
+
+    overrides = {key: value for key, value in section(scenario, "drops").items() if key != "mode"}
+    return {**CONFIG, **overrides}
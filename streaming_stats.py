@@ -0,0 +1,139 @@
+"""
+流式统计累加器: 内存占用与样本数无关。
+
+均值/方差使用 Welford 算法 (批量合并使用 Chan 公式)；
+整数结果额外记入宽度为1的直方图，从而得到精确分位数。
+所有模拟器的结果 (HP损失、烹饪分数、狩猎价值) 都是有界整数，直方图很小。
+"""
+
+class StreamingStats:
+    """整数结果的流式累加器。"""
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+        self._offset = 0      # histogram[i] 对应数值 offset + i
+        self._histogram = []
+
+    # --- 累加 ---
+    def add(self, value):
+        """加入单个整数样本。"""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self._ensure_range(value, value)
+        self._histogram[value - self._offset] += 1
+
+    def add_batch(self, values):
+        """加入一批整数样本 (列表或NumPy数组)。"""
+        if hasattr(values, 'dtype'):
+            self._add_array(values)
+            return
+        for value in values:
+            self.add(value)
+
+    def _add_array(self, values):
+        import numpy as np
+        values = np.asarray(values, dtype=np.int64).ravel()
+        if values.size == 0:
+            return
+        batch_min, batch_max = int(values.min()), int(values.max())
+        counts = np.bincount(values - batch_min)
+        batch = StreamingStats()
+        batch.count = int(values.size)
+        batch.mean = float(values.mean())
+        batch._m2 = float(((values - batch.mean) ** 2).sum())
+        batch.min, batch.max = batch_min, batch_max
+        batch._offset = batch_min
+        batch._histogram = counts.tolist()
+        self.merge(batch)
+
+    def merge(self, other):
+        """合并另一个累加器 (例如来自其他进程或分块)。"""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self._m2 = other.count, other.mean, other._m2
+        else:
+            total = self.count + other.count
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / total
+            self._m2 += other._m2 + delta * delta * self.count * other.count / total
+            self.count = total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._ensure_range(other._offset, other._offset + len(other._histogram) - 1)
+        start = other._offset - self._offset
+        for i, c in enumerate(other._histogram):
+            self._histogram[start + i] += c
+        return self
+
+    def _ensure_range(self, low, high):
+        """按需扩展直方图以覆盖 [low, high]。"""
+        if not self._histogram:
+            self._offset = low
+            self._histogram = [0] * (high - low + 1)
+            return
+        if low < self._offset:
+            self._histogram[:0] = [0] * (self._offset - low)
+            self._offset = low
+        end = self._offset + len(self._histogram) - 1
+        if high > end:
+            self._histogram.extend([0] * (high - end))
+
+    # --- 统计量 ---
+    @property
+    def variance(self):
+        """总体方差 (与 np.var 一致)。"""
+        return self._m2 / self.count if self.count else 0.0
+
+    @property
+    def sample_variance(self):
+        """样本方差 (ddof=1)。"""
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std_error(self):
+        """均值的标准误。"""
+        return (self.sample_variance / self.count) ** 0.5 if self.count else float('inf')
+
+    def quantile(self, q):
+        """精确分位数: 使累计频率 >= q 的最小数值。"""
+        if self.count == 0:
+            raise ValueError("没有样本，无法计算分位数")
+        target = q * self.count
+        cumulative = 0
+        for i, c in enumerate(self._histogram):
+            cumulative += c
+            if c and cumulative >= target:
+                return self._offset + i
+        return self.max
+
+    def histogram(self):
+        """{数值: 次数}，只包含出现过的数值。"""
+        return {self._offset + i: c for i, c in enumerate(self._histogram) if c}
+
+    def summary(self):
+        """均值、方差、p5/p50/p95 与最大值。"""
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'variance': self.variance,
+            'p5': self.quantile(0.05),
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'max': self.max,
+        }
+
+    def format_summary(self, precision=2):
+        """单行文本摘要。"""
+        s = self.summary()
+        return (f"均值={s['mean']:.{precision}f} 方差={s['variance']:.{precision}f} "
+                f"p5={s['p5']} p50={s['p50']} p95={s['p95']} 最大={s['max']}")
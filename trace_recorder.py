@@ -0,0 +1,245 @@
+"""
+逐场逐回合的战斗轨迹，用于排查平衡扫描中的异常值。
+
+每条记录为定长结构 TRACE_DTYPE: 战斗序号、回合、本回合伤害、命中数、HP损失和关键状态
+(该武器状态类的 KEY_FIELD，如 Token 数，回合结束时的值；无状态武器为 0)。
+每个 (武器, Pro) 单元写入目录下的一个 .npy 文件，记录按战斗、回合顺序排列，
+文件头写好后逐块追加，内存占用与战斗数无关；index.json 记录各单元的文件名与参数。
+写入时先写 .partial 临时文件，全部写满后才改名并登记到索引；中途出错则删除临时文件，
+原有的轨迹与索引保持不变。
+读取时以 np.load(mmap_mode='r') 打开，只有实际访问的切片才会从磁盘读入。
+
+用法:
+  python trace_recorder.py record traces --weapon 盾斧 --pro 3 --simulations 1000000 --mode vectorized
+  python trace_recorder.py show traces --weapon "盾斧 (N=3)" --pro 3 --top 5
+"""
+import argparse
+import json
+import os
+import re
+
+import numpy as np
+
+TRACE_DTYPE = np.dtype([
+    ('battle', '<u4'), ('round', '<u2'), ('damage', '<i4'), ('hits', '<u2'), ('hp_loss', '<u1'), ('state', '<i4'),
+])
+INDEX_FILE = "index.json"
+CELL_FILE = re.compile(r"cell_(\d+)\.npy(?:\.partial)?")
+# 标量引擎每积累这么多条记录写一次盘
+TRACE_CHUNK_ROWS = 100_000
+
+def state_code(state, key_field):
+    """动作状态的关键字段值 (整数)，没有关键字段时为 0。"""
+    return int(getattr(state, key_field)) if key_field else 0
+
+class TraceWriter:
+    """
+    一个单元的轨迹文件。num_battles × num_rounds 条记录，须全部写满后 close，出错时 abort。
+    由 Simulator(trace=...) 在 run 中调用 write_rounds；也可用作上下文管理器。
+    close 成功后调用 on_complete (TraceRecorder 借此登记索引)。
+    """
+    def __init__(self, path, num_battles, num_rounds, on_complete=None):
+        self.path = path
+        self.num_battles = num_battles
+        self.num_rounds = num_rounds
+        self.rows = num_battles * num_rounds
+        self.position = 0
+        self.on_complete = on_complete
+        self._partial_path = path + ".partial"
+        self._file = open(self._partial_path, "wb")
+        np.lib.format.write_array_header_1_0(self._file, {
+            'descr': np.lib.format.dtype_to_descr(TRACE_DTYPE), 'fortran_order': False, 'shape': (self.rows,),
+        })
+
+    def write_rounds(self, damage, hits, hp_loss, state):
+        """追加一块按战斗、回合顺序排列的记录，战斗序号与回合由当前位置推出。"""
+        n = len(damage)
+        if self.position + n > self.rows:
+            raise ValueError(f"轨迹记录超出预定的 {self.num_battles} 场 × {self.num_rounds} 回合")
+        rows = np.arange(self.position, self.position + n)
+        chunk = np.empty(n, dtype=TRACE_DTYPE)
+        chunk['battle'] = rows // self.num_rounds
+        chunk['round'] = rows % self.num_rounds + 1
+        chunk['damage'] = damage
+        chunk['hits'] = hits
+        chunk['hp_loss'] = hp_loss
+        chunk['state'] = state
+        self._file.write(chunk.tobytes())
+        self.position += n
+
+    def close(self):
+        """写满后关闭文件、替换 path 并调用 on_complete；记录不足时删除临时文件并报错。"""
+        if self._file.closed:
+            return
+        if self.position != self.rows:
+            self.abort()
+            raise ValueError(f"轨迹不完整: {self.path} 只写了 {self.position}/{self.rows} 条记录")
+        self._file.close()
+        os.replace(self._partial_path, self.path)
+        if self.on_complete is not None:
+            self.on_complete()
+
+    def abort(self):
+        """放弃本次写入: 关闭并删除临时文件，path 处原有的文件不受影响。"""
+        self._file.close()
+        if os.path.exists(self._partial_path):
+            os.remove(self._partial_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+class TraceRecorder:
+    """轨迹目录: 每个 (武器, Pro) 单元一个 .npy 文件，cell 返回该单元的 TraceWriter。"""
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.index = _read_index(directory)
+        self._next_file = _next_file_number(directory, self.index)
+
+    def cell(self, weapon, pro_level, num_battles, num_rounds, **meta):
+        """
+        返回一个单元的 TraceWriter，写满并 close 后才登记到索引；已存在的单元届时被覆盖。
+        meta 一并写入索引。
+        """
+        key = _cell_key(weapon, pro_level)
+        if key in self.index:
+            file_name = self.index[key]['file']
+        else:
+            file_name = f"cell_{self._next_file:04d}.npy"
+            self._next_file += 1
+            if any(entry['file'] == file_name for entry in self.index.values()):
+                raise ValueError(f"轨迹文件名 {file_name} 已被索引中的其他单元使用")
+        entry = dict(file=file_name, weapon=weapon, pro=pro_level, battles=num_battles, rounds=num_rounds, **meta)
+
+        def commit():
+            if any(other != key and e['file'] == file_name for other, e in self.index.items()):
+                raise ValueError(f"轨迹文件名 {file_name} 已被索引中的其他单元使用")
+            self.index[key] = entry
+            with open(os.path.join(self.directory, INDEX_FILE), "w", encoding="utf-8") as f:
+                json.dump(self.index, f, ensure_ascii=False, indent=2)
+        return TraceWriter(os.path.join(self.directory, file_name), num_battles, num_rounds, on_complete=commit)
+
+class TraceReader:
+    """惰性读取轨迹目录。load 返回只读内存映射，不会把整个文件读入内存。"""
+    def __init__(self, directory):
+        self.directory = directory
+        self.index = _read_index(directory)
+        if not self.index:
+            raise ValueError(f"{directory} 中没有轨迹索引 {INDEX_FILE}")
+
+    def cells(self):
+        """[(武器, Pro)]"""
+        return [(entry['weapon'], entry['pro']) for entry in self.index.values()]
+
+    def info(self, weapon, pro_level):
+        try:
+            return self.index[_cell_key(weapon, pro_level)]
+        except KeyError:
+            raise ValueError(f"轨迹中没有单元 {weapon} Pro{pro_level}") from None
+
+    def load(self, weapon, pro_level):
+        """该单元的全部记录 (只读内存映射)。"""
+        return np.load(os.path.join(self.directory, self.info(weapon, pro_level)['file']), mmap_mode='r')
+
+    def battles(self, weapon, pro_level, start, stop=None):
+        """第 start..stop-1 场战斗的记录 (stop 默认为 start+1)。"""
+        rounds = self.info(weapon, pro_level)['rounds']
+        stop = start + 1 if stop is None else stop
+        return np.asarray(self.load(weapon, pro_level)[start * rounds:stop * rounds])
+
+    def battle_totals(self, weapon, pro_level, chunk_battles=100_000):
+        """每场战斗的 (伤害, 命中数, HP损失) 合计，逐块读取。返回三个长度为战斗数的数组。"""
+        info = self.info(weapon, pro_level)
+        records = self.load(weapon, pro_level)
+        rounds = info['rounds']
+        totals = {name: np.empty(info['battles'], dtype=np.int64) for name in ('damage', 'hits', 'hp_loss')}
+        for start in range(0, info['battles'], chunk_battles):
+            stop = min(start + chunk_battles, info['battles'])
+            chunk = records[start * rounds:stop * rounds]
+            for name, values in totals.items():
+                values[start:stop] = chunk[name].reshape(-1, rounds).sum(axis=1, dtype=np.int64)
+        return totals['damage'], totals['hits'], totals['hp_loss']
+
+    def outliers(self, weapon, pro_level, top=10, largest=True):
+        """HP损失最高 (largest=False 时最低) 的 top 场战斗序号。"""
+        _, _, hp_loss = self.battle_totals(weapon, pro_level)
+        order = np.argsort(-hp_loss if largest else hp_loss, kind='stable')
+        return order[:top]
+
+def _cell_key(weapon, pro_level):
+    return f"{weapon}|{pro_level}"
+
+def _next_file_number(directory, index):
+    """下一个未用过的 cell_NNNN 编号: 大于索引与目录中出现过的所有编号 (含未完成的 .partial)。"""
+    names = [entry['file'] for entry in index.values()] + os.listdir(directory)
+    numbers = [int(m.group(1)) for m in map(CELL_FILE.fullmatch, names) if m]
+    return max(numbers, default=-1) + 1
+
+def _read_index(directory):
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def format_battle(records):
+    """一场战斗的逐回合表格文本。"""
+    lines = [f"{'回合':>4}{'伤害':>8}{'命中':>6}{'HP损失':>8}{'状态':>6}"]
+    for r in records:
+        lines.append(f"{r['round']:>4}{r['damage']:>8}{r['hits']:>6}{r['hp_loss']:>8}{r['state']:>6}")
+    return "\n".join(lines)
+
+def record(directory, weapon_prefix="", pro_levels=range(1, 7), num_simulations=10000, num_rounds=10,
+           mode='vectorized', seed=0):
+    """为名称以 weapon_prefix 开头的武器记录轨迹。返回 TraceRecorder。"""
+    from monte_carlo_simulator import ATTACKER_MOD, DEFENDER, WEAPON_CONFIG, Simulator, build_attacker_stats
+
+    recorder = TraceRecorder(directory)
+    for name, config in WEAPON_CONFIG.items():
+        if not name.startswith(weapon_prefix):
+            continue
+        for pro_level in pro_levels:
+            writer = recorder.cell(name, pro_level, num_simulations, num_rounds,
+                                   action=config["action"].__name__, mode=mode, seed=seed)
+            attacker_stats = build_attacker_stats(pro_level, config, ATTACKER_MOD)
+            sim = Simulator(config["action"], attacker_stats, DEFENDER, mode=mode, seed=seed, trace=writer)
+            avg_hits, avg_hp_loss = sim.run(num_simulations, num_rounds, pro_level)
+            print(f"{name} Pro{pro_level}: 平均HP损失 {avg_hp_loss:.4f}, 平均命中 {avg_hits:.4f} -> {writer.path}")
+    return recorder
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="逐场逐回合的战斗轨迹")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record", help="记录轨迹")
+    record_parser.add_argument("directory")
+    record_parser.add_argument("--weapon", default="", help="武器名前缀，默认全部")
+    record_parser.add_argument("--pro", type=int, nargs="+", default=list(range(1, 7)))
+    record_parser.add_argument("--simulations", type=int, default=10000)
+    record_parser.add_argument("--rounds", type=int, default=10)
+    record_parser.add_argument("--mode", choices=("scalar", "vectorized"), default="vectorized")
+    record_parser.add_argument("--seed", type=int, default=0)
+    show_parser = subparsers.add_parser("show", help="查看某个单元的战斗")
+    show_parser.add_argument("directory")
+    show_parser.add_argument("--weapon", required=True)
+    show_parser.add_argument("--pro", type=int, required=True)
+    show_parser.add_argument("--battle", type=int, nargs="*", default=[], help="显示这些战斗的逐回合记录")
+    show_parser.add_argument("--top", type=int, default=0, help="显示HP损失最高的几场战斗")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.directory, args.weapon, args.pro, args.simulations, args.rounds, args.mode, args.seed)
+    else:
+        reader = TraceReader(args.directory)
+        battles = list(args.battle)
+        if args.top:
+            battles += [int(b) for b in reader.outliers(args.weapon, args.pro, args.top)]
+        for battle in battles:
+            records = reader.battles(args.weapon, args.pro, battle)
+            print(f"\n{args.weapon} Pro{args.pro} 第 {battle} 场, HP损失合计 {int(records['hp_loss'].sum())}")
+            print(format_battle(records))
@@ -0,0 +1,210 @@
+"""
+平衡扫描的方差缩减估计 (向量化引擎)。
+
+  - antithetic: 对偶抽样。战斗两两配对，后一半的每个随机数是前一半的镜像
+                (d 面骰 x -> d+1-x，均匀数 u -> 1-u)，命中骰和伤害骰同时反向；
+                别名表抽样不随 u 单调，对偶时伤害改按逆分布函数取值 (见 batch_engine.roll_damage_batch)；
+  - control:    控制变量。每场命中数的精确期望由 exact_solver 求出 (对 defender.defense 的
+                每回合命中概率)，用命中数的抽样偏差修正HP损失估计；
+  - 共同随机数: compare_weapons 让多把武器使用同一串随机数，差值在配对的骰子上估计。
+
+三者都要求每次抽样的数量与命中情况无关 (draw_all，见 batch_engine.damage_on_hit)。
+样本逐块累计为均值、方差与协方差 (Moments)，内存与模拟次数无关。
+每次运行都报告方差缩减倍数 = 同样战斗数下独立抽样的方差 / 本估计的方差。
+"""
+from types import SimpleNamespace
+
+import numpy as np
+
+from batch_engine import DEFAULT_CHUNK_SIZE, make_rng, simulate_battles
+
+METHODS = ('antithetic', 'control')
+
+class MatchedRandomNumbers:
+    """逐次抽样数量与命中无关的 Generator 包装，同一种子的多次运行逐个随机数对应。"""
+    draw_all = True
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def integers(self, low, high, size):
+        return self.rng.integers(low, high, size=size)
+
+    def random(self, size):
+        return self.rng.random(size)
+
+class AntitheticRandomNumbers(MatchedRandomNumbers):
+    """前一半战斗正常抽样，后一半使用镜像的随机数。战斗数必须为偶数。"""
+    inverse_cdf = True  # 伤害随均匀数单调，镜像后才反向，见 batch_engine.roll_damage_batch
+    def _paired(self, draw, mirror, size):
+        size = (size,) if np.isscalar(size) else tuple(size)
+        half = draw((size[0] // 2,) + size[1:])
+        return np.concatenate([half, mirror(half)])
+
+    def integers(self, low, high, size):
+        return self._paired(lambda s: self.rng.integers(low, high, size=s), lambda x: low + high - 1 - x, size)
+
+    def random(self, size):
+        # 1-u 可能恰为 1.0，取 [0, 1) 内最接近的值
+        return self._paired(self.rng.random, lambda u: np.minimum(1.0 - u, np.nextafter(1.0, 0.0)), size)
+
+def _check_methods(methods):
+    unknown = set(methods) - set(METHODS)
+    if unknown:
+        raise ValueError(f"未知的方差缩减方法: {sorted(unknown)}，可选: {METHODS}")
+
+class Moments:
+    """两列样本 (y, c) 的流式均值、样本方差与协方差，逐块按并行公式合并。"""
+    def __init__(self):
+        self.count = 0
+        self.mean_y = 0.0
+        self.mean_c = 0.0
+        self._m2_y = 0.0
+        self._m2_c = 0.0
+        self._c_yc = 0.0
+
+    def add_batch(self, y, c):
+        n = y.size
+        if n == 0:
+            return
+        y = y.astype(float)
+        c = c.astype(float)
+        mean_y, mean_c = y.mean(), c.mean()
+        dy, dc = y - mean_y, c - mean_c
+        total = self.count + n
+        delta_y, delta_c = mean_y - self.mean_y, mean_c - self.mean_c
+        weight = self.count * n / total
+        self._m2_y += float(dy @ dy) + delta_y * delta_y * weight
+        self._m2_c += float(dc @ dc) + delta_c * delta_c * weight
+        self._c_yc += float(dy @ dc) + delta_y * delta_c * weight
+        self.mean_y += delta_y * n / total
+        self.mean_c += delta_c * n / total
+        self.count = total
+
+    @property
+    def variance_y(self):
+        return self._m2_y / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def variance_c(self):
+        return self._m2_c / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def covariance(self):
+        return self._c_yc / (self.count - 1) if self.count > 1 else 0.0
+
+def battle_chunks(action_function, attacker_stats, defender_stats, num_simulations, num_rounds=10, pro_level=1,
+                  seed=None, antithetic=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    逐块生成每场的 (命中数数组, HP损失数组)。antithetic=True 时每块前一半的第 i 场与后一半的第 i 场对偶。
+    同一 seed 的两次调用，不论武器参数如何，只要动作的抽样次序相同，随机数就逐个对应。
+    """
+    rng = make_rng(seed)
+    wrapped = AntitheticRandomNumbers(rng) if antithetic else MatchedRandomNumbers(rng)
+    if antithetic:
+        chunk_size -= chunk_size % 2
+        if num_simulations % 2:
+            raise ValueError("对偶抽样需要偶数次模拟")
+    for start in range(0, num_simulations, chunk_size):
+        n = min(chunk_size, num_simulations - start)
+        yield simulate_battles(action_function, attacker_stats, defender_stats, n, num_rounds, pro_level, wrapped)
+
+def estimation_units(values, antithetic=False):
+    """估计单元: 对偶时为一块中每对战斗的平均，否则为每场本身。"""
+    if not antithetic:
+        return values
+    half = values.size // 2
+    return (values[:half] + values[half:]) / 2
+
+def expected_hits(action_function, attacker_stats, defender_stats, num_rounds, pro_level):
+    """每场命中数的精确期望 (exact_solver)。"""
+    from exact_solver import ExactSolver
+    return ExactSolver(action_function, attacker_stats, defender_stats).run(None, num_rounds, pro_level)[0]
+
+def reduced_estimate(battles, units, hits_mean=None):
+    """
+    由累计的样本矩得到方差缩减后的估计。battles 为每场 (HP损失, 命中数) 的 Moments，
+    units 为估计单元 (见 estimation_units) 的 Moments；hits_mean 给出时使用控制变量。
+    返回 SimpleNamespace(avg_hits, avg_hp_loss, std_error, naive_std_error, variance_reduction_factor, beta)。
+    """
+    naive_var = battles.variance_y / battles.count
+    avg_hp_loss = units.mean_y
+    unit_variance = units.variance_y
+    beta = 0.0
+    if hits_mean is not None and units.variance_c > 0:
+        beta = units.covariance / units.variance_c
+        avg_hp_loss -= beta * (units.mean_c - hits_mean)
+        unit_variance -= beta * units.covariance
+    variance = max(unit_variance, 0.0) / units.count
+    return SimpleNamespace(
+        avg_hits=float(battles.mean_c),
+        avg_hp_loss=float(avg_hp_loss),
+        std_error=float(np.sqrt(variance)),
+        naive_std_error=float(np.sqrt(naive_var)),
+        variance_reduction_factor=float(naive_var / variance) if variance > 0 else float('inf'),
+        beta=float(beta),
+    )
+
+def run_reduced(action_function, attacker_stats, defender_stats, num_simulations=10000, num_rounds=10, pro_level=1,
+                seed=None, methods=METHODS, hp_loss_stats=None):
+    """Simulator(variance_reduction=...) 的入口: 按 methods 运行并返回 reduced_estimate 的结果。"""
+    _check_methods(methods)
+    antithetic = 'antithetic' in methods
+    battles, units = Moments(), Moments()
+    for hits, hp_loss in battle_chunks(action_function, attacker_stats, defender_stats, num_simulations, num_rounds,
+                                       pro_level, seed, antithetic):
+        battles.add_batch(hp_loss, hits)
+        units.add_batch(estimation_units(hp_loss, antithetic), estimation_units(hits, antithetic))
+        if hp_loss_stats is not None:
+            hp_loss_stats.add_batch(hp_loss)
+    hits_mean = (expected_hits(action_function, attacker_stats, defender_stats, num_rounds, pro_level)
+                 if 'control' in methods else None)
+    return reduced_estimate(battles, units, hits_mean)
+
+def compare_weapons(weapons, defender_stats, num_simulations=10000, num_rounds=10, pro_level=1, seed=0,
+                    antithetic=False):
+    """
+    共同随机数比较: weapons 为 {名称: (action_function, attacker_stats)}，全部使用同一串随机数。
+    各武器逐块同步推进，只累计 HP损失 与 与第一把武器之差 的样本矩。
+    返回 [(名称, 平均HP损失, 与第一把武器之差, 差值标准误, 差值的方差缩减倍数)]，
+    方差缩减倍数 = 两把武器独立抽样时差值的方差 / 配对差值的方差 (第一把武器为 nan)。
+    """
+    streams = [battle_chunks(action, attacker, defender_stats, num_simulations, num_rounds, pro_level,
+                             np.random.default_rng(seed), antithetic)
+               for action, attacker in weapons.values()]
+    moments = [Moments() for _ in streams]
+    for chunks in zip(*streams):
+        samples = [estimation_units(hp_loss, antithetic) for _, hp_loss in chunks]
+        for m, y in zip(moments, samples):
+            m.add_batch(y, y - samples[0])
+    baseline = moments[0]
+    rows = []
+    for name, m in zip(weapons, moments):
+        independent_var = m.variance_y + baseline.variance_y
+        paired_var = m.variance_c
+        factor = float(independent_var / paired_var) if paired_var > 0 else float('nan')
+        rows.append((name, float(m.mean_y), float(m.mean_c), float(np.sqrt(paired_var / m.count)), factor))
+    return rows
+
+if __name__ == "__main__":
+    import argparse
+
+    from monte_carlo_simulator import ATTACKER_MOD, DEFENDER, WEAPON_CONFIG, build_attacker_stats
+
+    parser = argparse.ArgumentParser(description="共同随机数比较同一类武器 (如 斩斧 N=1..5)")
+    parser.add_argument("prefix", help="武器名前缀，如 斩斧")
+    parser.add_argument("--pro", type=int, default=3, help="Pro等级")
+    parser.add_argument("--simulations", type=int, default=50000, help="每把武器的模拟次数")
+    parser.add_argument("--rounds", type=int, default=10, help="每场战斗回合数")
+    parser.add_argument("--seed", type=int, default=0, help="共同的种子")
+    parser.add_argument("--antithetic", action="store_true", help="同时使用对偶抽样")
+    args = parser.parse_args()
+
+    weapons = {name: (config["action"], build_attacker_stats(args.pro, config, ATTACKER_MOD))
+               for name, config in WEAPON_CONFIG.items() if name.startswith(args.prefix)}
+    if not weapons:
+        parser.error(f"没有以 {args.prefix!r} 开头的武器")
+    print(f"{'武器':<14}{'HP损失':>10}{'差值':>10}{'标准误':>10}{'缩减倍数':>10}")
+    for name, hp_loss, diff, std_error, factor in compare_weapons(
+            weapons, DEFENDER, args.simulations, args.rounds, args.pro, args.seed, args.antithetic):
+        print(f"{name:<14}{hp_loss:>10.4f}{diff:>+10.4f}{std_error:>10.4f}{factor:>10.2f}")